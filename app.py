@@ -1,14 +1,32 @@
-from flask import Flask, request, jsonify, render_template
-import joblib
-import jieba
-import re
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
+import json
 import logging
 import os
+import threading
+import time
+from concurrent.futures import Future
 from dotenv import load_dotenv
 # 導入標題生成模塊
-from title_generator import generate_titles, mock_generate_titles, get_api_key_instructions
+from title_generator import generate_titles_async, mock_generate_titles, get_api_key_instructions
+from gemini_client import GeminiError
 # 導入關鍵字提取與推薦模塊
-from keyword_extractor import generate_hot_keywords
+from keyword_extractor import generate_hot_keywords, generate_hot_keywords_batch, catalog_version, KEYWORDS_MAX_CHARS
+# 導入模型推論模組
+from inference import InferenceEngine
+from compact_vectorizer import select_vectorizer_path
+# 導入共用分詞模組
+from tokenizer import classifier_input, clip_text, segment
+# 導入結果快取模組
+from cache import ResultCache, content_key
+# 導入相同內容請求合併模組
+from single_flight import SingleFlight
+# 導入近似重複文章索引
+from near_duplicate import NearDuplicateIndex, simhash
+# 導入微批次排程模組
+from batcher import MicroBatcher
+# 導入效能指標模組
+from metrics import span, increment, observe, start_profile, finish_profile, server_timing, render_prometheus
+from memory_report import process_memory
 
 # 載入 .env 檔案中的環境變數
 load_dotenv()
@@ -16,8 +34,9 @@ logging.info("嘗試載入 .env 檔案中的環境變數")
 
 app = Flask(__name__)
 
-# 設置日誌級別
+# 設置日誌級別，LOG_LEVEL=WARNING 時省略每個請求的日誌
 logging.basicConfig(level=logging.INFO)
+logging.getLogger().setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
 
 # 檢查是否設置了 Gemini API 密鑰
 has_api_key = os.getenv("GEMINI_API_KEY") is not None
@@ -34,118 +53,563 @@ else:
     else:
         logging.info("未找到 .env 檔案")
 
-# 載入模型和向量化器
-model = joblib.load('Dcard-posts-classification-main/voting_classifier_model.joblib')
-vectorizer = joblib.load('Dcard-posts-classification-main/tfidf_vectorizer.joblib')
+# 定義所有支持的類別和對應的中文看板名稱
+VALID_CATEGORIES = ['mood', 'relationship', 'talk']
+CATEGORY_NAMES = {
+    'mood': '心情板',
+    'relationship': '感情板',
+    'talk': '閒聊板'
+}
+
+# 批次預測單次請求可處理的最大文章數量
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '500'))
+
+# 長度限制：請求本文超過 MAX_REQUEST_BYTES 位元組時在解析 JSON 之前就拒絕，單篇文章超過 MAX_TEXT_CHARS 字元時也直接拒絕
+MAX_REQUEST_BYTES = int(os.getenv('MAX_REQUEST_BYTES', str(4 * 1024 * 1024)))
+MAX_TEXT_CHARS = int(os.getenv('MAX_TEXT_CHARS', '20000'))
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES or None
+# 分類最多使用 CLASSIFY_MAX_CHARS 個字元（0 表示不限制）；CLASSIFY_SAMPLING=head_tail 時取開頭與結尾各一半
+CLASSIFY_MAX_CHARS = int(os.getenv('CLASSIFY_MAX_CHARS', '3000'))
+CLASSIFY_SAMPLING = os.getenv('CLASSIFY_SAMPLING', 'head')
+
+# 模型目錄，可以指向 train_model.py 產生的版本目錄（例如 models/20240625-120000-abc123）
+MODEL_DIR = os.getenv('MODEL_DIR', 'Dcard-posts-classification-main')
+
+# 優先載入不需要 pickle 的精簡向量化器（compact_vectorizer.py 匯出的 .npz）；
+# 不存在，或不是由目錄中目前的 joblib 檔案匯出（例如以 notebook 重新訓練後）時載入 joblib 檔案
+VECTORIZER_PATH = select_vectorizer_path(MODEL_DIR)
+
+# 服務模式：ensemble 使用完整的投票分類器；fast 使用蒸餾後的線性模型（distill.py 產生的 distilled_model.npz）
+SERVING_MODE = os.getenv('SERVING_MODE', 'ensemble')
+if SERVING_MODE == 'fast':
+    MODEL_PATH = os.path.join(MODEL_DIR, 'distilled_model.npz')
+else:
+    MODEL_PATH = os.path.join(MODEL_DIR, 'voting_classifier_model.joblib')
+logging.info(f"服務模式: {SERVING_MODE}")
+
+# 載入模型和向量化器，類別標籤在啟動時就解碼完成
+engine = InferenceEngine.load(
+    MODEL_PATH,
+    VECTORIZER_PATH,
+    labels=VALID_CATEGORIES
+)
+
+# 請求帶有 X-Profile: 1 標頭時，以 Server-Timing 標頭返回各階段耗時；PROFILE_HEADER_ENABLED=0 時停用
+PROFILE_HEADER_ENABLED = os.getenv('PROFILE_HEADER_ENABLED', '1') != '0'
+
+# 微批次排程：同時到達的請求在 MICRO_BATCH_MAX_WAIT_MS 毫秒內最多合併 MICRO_BATCH_MAX_SIZE 篇，一次向量化與預測；
+# MICRO_BATCH_MAX_WAIT_MS=0 時關閉，每個請求各自呼叫模型
+classifier_batcher = MicroBatcher(
+    engine.predict,
+    max_batch_size=int(os.getenv('MICRO_BATCH_MAX_SIZE', '32')),
+    max_wait_ms=float(os.getenv('MICRO_BATCH_MAX_WAIT_MS', '5')),
+    name='classifier'
+)
+
+# 以正規化文本雜湊為鍵的結果快取，設定 RESULT_CACHE_REDIS_URL 時多個 worker 共用快取
+result_cache = ResultCache(
+    max_entries=int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '10000')),
+    max_bytes=int(os.getenv('RESULT_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+    ttl=float(os.getenv('RESULT_CACHE_TTL', '3600')),
+    redis_url=os.getenv('RESULT_CACHE_REDIS_URL'),
+    # 分類的截取方式也會影響結果
+    model_version=f"{engine.version}:{CLASSIFY_MAX_CHARS}:{CLASSIFY_SAMPLING}"
+)
+
+# 近似重複草稿：與最近分析過的同類別文章 SimHash 漢明距離不超過 NEAR_DUPLICATE_MAX_DISTANCE 時，
+# 沿用該文章的標題與熱門關鍵字，只重新執行分類；詞數少於 NEAR_DUPLICATE_MIN_TOKENS 的短文不比對
+NEAR_DUPLICATE_ENABLED = os.getenv('NEAR_DUPLICATE_ENABLED', '1') != '0'
+NEAR_DUPLICATE_MIN_TOKENS = int(os.getenv('NEAR_DUPLICATE_MIN_TOKENS', '20'))
+near_duplicate_index = NearDuplicateIndex(
+    max_distance=int(os.getenv('NEAR_DUPLICATE_MAX_DISTANCE', '6')),
+    ttl=float(os.getenv('NEAR_DUPLICATE_TTL', '600')),
+    max_entries=int(os.getenv('NEAR_DUPLICATE_MAX_ENTRIES', '10000'))
+)
+
+# 相同內容（正規化後）的同時請求只計算一次：分類、關鍵字、標題三個共用階段分別合併，所有路由都適用；
+# SINGLE_FLIGHT_ENABLED=0 時關閉
+SINGLE_FLIGHT_ENABLED = os.getenv('SINGLE_FLIGHT_ENABLED', '1') != '0'
+classification_flight = SingleFlight('classification', enabled=SINGLE_FLIGHT_ENABLED)
+keywords_flight = SingleFlight('keywords', enabled=SINGLE_FLIGHT_ENABLED)
+titles_flight = SingleFlight('titles', enabled=SINGLE_FLIGHT_ENABLED)
+FLIGHTS = (classification_flight, keywords_flight, titles_flight)
+
+# ASGI 服務模式（asgi.py）替換的擴充點，以 Flask 執行時維持預設值：
+# - generate_titles_future: 以 Gemini 生成標題並返回 Future，預設在同步用戶端的執行緒池中呼叫 API
+# - before_titles_wait: 阻塞等待 Gemini 回應之前執行，ASGI 服務模式以此提前釋放 CPU 工作的名額
+# - gauge_providers: 返回額外 gauge 列表的函數，加到 /metrics
+generate_titles_future = generate_titles_async
+before_titles_wait = None
+gauge_providers = []
 
 def preprocess_text(text):
-    # 移除URL
-    text = re.sub(r'http\S+|www\S+|https\S+', '', text, flags=re.MULTILINE)
-    # 移除標點符號
-    text = re.sub(r'[^\w\s]', '', text)
-    # 分詞
-    words = jieba.cut(text)
-    return ' '.join(words)
+    # 套用與訓練時相同的清理規則（只保留中文後斷詞、移除停用詞與單字詞）
+    return classifier_input(text)
+
+def text_too_long(text):
+    return MAX_TEXT_CHARS > 0 and len(text) > MAX_TEXT_CHARS
+
+def text_error(text):
+    """檢查單篇文章，返回 (錯誤訊息, 狀態碼)，沒有問題時返回 None"""
+    if not text:
+        return '請提供文章內容', 400
+    if text_too_long(text):
+        return f'文章內容不可超過 {MAX_TEXT_CHARS} 字', 413
+    return None
+
+def batch_error(texts):
+    """檢查批次預測的文章列表，返回 (錯誤訊息, 狀態碼)，沒有問題時返回 None"""
+    if not isinstance(texts, list) or not texts:
+        return '請提供文章內容列表 texts', 400
+    if len(texts) > MAX_BATCH_SIZE:
+        return f'單次最多只能處理 {MAX_BATCH_SIZE} 篇文章', 400
+    for i, text in enumerate(texts):
+        if not isinstance(text, str) or not text:
+            return f'第 {i} 篇文章內容無效', 400
+        if text_too_long(text):
+            return f'第 {i} 篇文章內容不可超過 {MAX_TEXT_CHARS} 字', 413
+    return None
+
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({'error': f'請求內容不可超過 {MAX_REQUEST_BYTES} 位元組'}), 413
 
 @app.route('/')
 def home():
     return render_template('index.html')
 
-@app.route('/predict', methods=['POST'])
-def predict():
-    data = request.get_json()
-    text = data.get('text', '')
-    
-    if not text:
-        return jsonify({'error': '請提供文章內容'}), 400
-    
-    # 處理文本
-    processed_text = preprocess_text(text)
-    # 轉換為TF-IDF特徵
-    features = vectorizer.transform([processed_text]).toarray()  # 轉換為密集矩陣
-    # 預測
-    prediction = model.predict(features)
-    # 獲取預測機率
-    probabilities = model.predict_proba(features)
-    
-    # 記錄預測結果類型和值
-    logging.info(f"預測結果類型: {type(prediction[0])}, 值: {prediction[0]}")
-    
-    # 定義所有支持的類別和對應的索引
-    valid_categories = ['mood', 'relationship', 'talk']
-    
-    # 獲取預測類別
-    predicted_category = prediction[0]
-    
-    # 如果預測結果是數字，轉換為對應的字串標籤
-    if isinstance(predicted_category, (int, float)):
-        if int(predicted_category) < len(valid_categories):
-            predicted_category = valid_categories[int(predicted_category)]
-        else:
-            # 默認使用第一個類別
-            logging.warning(f"預測結果 {predicted_category} 超出範圍，使用默認類別")
-            predicted_category = valid_categories[0]
-    elif predicted_category not in valid_categories:
-        # 如果是字串但不在有效類別列表中，使用默認類別
-        logging.warning(f"預測結果 '{predicted_category}' 不在有效類別列表中，使用默認類別")
-        predicted_category = valid_categories[0]
-    
-    # 記錄最終類別
-    logging.info(f"最終預測類別: {predicted_category}")
-    
-    # 構建結果
-    result = {
+def classify_texts(texts):
+    """
+    批次分類多篇文章，未命中快取的文章整批只做一次向量化與一次模型預測
+
+    參數:
+        texts (list): 文章內容列表
+
+    返回:
+        list: 每篇文章的 (類別, 各類別機率字典) 元組
+    """
+    results = [result_cache.classification.get(text) for text in texts]
+    missing = [i for i, cached in enumerate(results) if cached is None]
+    if missing:
+        # 其他請求正在分類相同內容的文章時等待其結果，只計算其餘的文章
+        classifications = classification_flight.do_batch(
+            [content_key(texts[i]) for i in missing],
+            lambda leaders: classify_missing(texts, [missing[j] for j in leaders])
+        )
+        for i, classification in zip(missing, classifications):
+            results[i] = classification
+    return [tuple(classification) for classification in results]
+
+def classify_missing(texts, missing):
+    """整批分類未命中快取的文章，寫入快取並返回各篇的 (類別, 各類別機率字典)"""
+    # 分類器的斷詞先移除非中文字元，與關鍵字提取的分詞結果不同，不共用；長文章只以截取的部分分類
+    with span('segment'):
+        processed_texts = [preprocess_text(clip_text(texts[i], CLASSIFY_MAX_CHARS, CLASSIFY_SAMPLING))
+                           for i in missing]
+    # 稀疏特徵只跑一次 predict_proba，類別取機率最高者；與其他請求的文章合併成同一批
+    with span('classify'):
+        classifications = classifier_batcher.map(processed_texts)
+    for i, classification in zip(missing, classifications):
+        result_cache.classification.set(texts[i], classification)
+    return classifications
+
+def build_result(predicted_category, probabilities):
+    """構建分類結果的回應內容"""
+    return {
         'category': predicted_category,
-        'category_name': '心情板' if predicted_category == 'mood' else ('感情板' if predicted_category == 'relationship' else '閒聊板'),
-        'probabilities': {}
-    }
-    
-    # 確保所有類別都有對應的概率值
-    for i, category in enumerate(valid_categories):
-        if i < len(probabilities[0]):
-            result['probabilities'][category] = float(probabilities[0][i])
-        else:
-            # 如果索引超出範圍，設置為0
-            result['probabilities'][category] = 0.0
-    
-    # 添加中文名稱到結果中
-    result['probability_names'] = {
-        'mood': '心情板',
-        'relationship': '感情板',
-        'talk': '閒聊板'
+        'category_name': CATEGORY_NAMES.get(predicted_category, '閒聊板'),
+        'probabilities': probabilities,
+        # 添加中文名稱到結果中
+        'probability_names': dict(CATEGORY_NAMES)
     }
-    
-    # 生成標題建議
+
+def start_suggested_titles(text, predicted_category):
+    """
+    開始生成標題建議，使用 Gemini 時在背景執行緒呼叫 API，讓關鍵字提取可以同時進行
+
+    返回:
+        concurrent.futures.Future: 結果為標題列表
+    """
+    # 根據是否有API密鑰選擇使用實際或模擬功能
+    title_source = 'gemini' if has_api_key else 'mock'
+    future = Future()
     try:
-        # 根據是否有API密鑰選擇使用實際或模擬功能
-        if has_api_key:
-            suggested_titles = generate_titles(text, predicted_category, num_titles=3)
-            api_instructions = None
-        else:
+        cached_titles = result_cache.titles.get(text, predicted_category, title_source)
+        if cached_titles is not None:
+            future.set_result(cached_titles)
+            return future
+        # 相同內容的標題正在生成時共用同一個 Future，只呼叫一次 Gemini API
+        return titles_flight.submit(content_key(text, predicted_category, title_source),
+                                    lambda: generate_suggested_titles(text, predicted_category, title_source))
+    except Exception as e:
+        future.set_exception(e)
+        return future
+
+def generate_suggested_titles(text, predicted_category, title_source):
+    """生成標題並在完成後寫入快取，返回 Future"""
+    future = Future()
+    if has_api_key:
+        # API 失敗時由 add_suggested_titles 改用本地標題生成，避免快取到備用標題
+        future = generate_titles_future(text, predicted_category, num_titles=3, fallback=False)
+    else:
+        with span('titles_mock'):
+            future.set_result(mock_generate_titles(text, predicted_category, num_titles=3))
+
+    def store(done):
+        if done.exception() is None:
+            result_cache.titles.set(text, done.result(), predicted_category, title_source)
+
+    future.add_done_callback(store)
+    return future
+
+def add_suggested_titles(result, text, predicted_category, title_future=None):
+    """為結果加入標題建議，title_future 為 start_suggested_titles 返回的 Future"""
+    try:
+        if title_future is None:
+            title_future = start_suggested_titles(text, predicted_category)
+        if before_titles_wait is not None and not title_future.done():
+            before_titles_wait()
+        try:
+            # 等待背景生成的標題，耗時為標題生成中未與關鍵字提取重疊的部分
+            with span('titles_wait'):
+                suggested_titles = title_future.result()
+        except GeminiError as e:
+            logging.warning(f"Gemini API 無法使用，改用本地標題生成: {str(e)}")
             suggested_titles = mock_generate_titles(text, predicted_category, num_titles=3)
-            # 添加 API 密鑰設置說明
-            api_instructions = get_api_key_instructions()
+        # 未設置密鑰時添加 API 密鑰設置說明
+        api_instructions = None if has_api_key else get_api_key_instructions()
         
         result['suggested_titles'] = suggested_titles
         if api_instructions:
             result['api_instructions'] = api_instructions
         
-        logging.info(f"為文章生成了 {len(suggested_titles)} 個標題建議")
+        logging.debug("為文章生成了 %d 個標題建議", len(suggested_titles))
     except Exception as e:
         logging.error(f"生成標題時發生錯誤: {str(e)}")
         result['suggested_titles'] = ["無法生成標題建議"]
-    
-    # 生成熱門關鍵字推薦
+
+def add_hot_keywords(result, text, predicted_category, segmented=None):
+    """為結果加入熱門關鍵字推薦"""
     try:
-        keywords_result = generate_hot_keywords(text, predicted_category, max_extracted=15, max_recommended=5)
+        # 熱門關鍵字目錄重新載入後，舊的推薦結果自動失效
+        version = catalog_version()
+        keywords_result = result_cache.keywords.get(text, predicted_category, version)
+        if keywords_result is None:
+            with span('keywords'):
+                keywords_result = keywords_flight.do(content_key(text, predicted_category, version),
+                                                     generate_keywords, text, predicted_category, version, segmented)
         result['extracted_keywords'] = keywords_result['extracted_keywords']
         result['hot_keywords'] = keywords_result['recommended_hot_keywords']
-        logging.info(f"為文章生成了 {len(result['hot_keywords'])} 個熱門關鍵字推薦")
+        logging.debug("為文章生成了 %d 個熱門關鍵字推薦", len(result['hot_keywords']))
     except Exception as e:
         logging.error(f"生成熱門關鍵字時發生錯誤: {str(e)}")
         result['hot_keywords'] = []
+
+def generate_keywords(text, predicted_category, version, segmented=None):
+    """提取關鍵詞並推薦熱門關鍵字，結果寫入快取"""
+    keywords_result = generate_hot_keywords(text, predicted_category, max_extracted=15, max_recommended=5,
+                                            segmented=segmented)
+    result_cache.keywords.set(text, keywords_result, predicted_category, version)
+    return keywords_result
+
+def add_hot_keywords_batch(results, texts, categories):
+    """為多篇文章的結果加入熱門關鍵字推薦，未命中快取的文章整批提取關鍵詞"""
+    try:
+        version = catalog_version()
+        keywords_results = [
+            result_cache.keywords.get(text, category, version) for text, category in zip(texts, categories)
+        ]
+        missing = [i for i, cached in enumerate(keywords_results) if cached is None]
+        if missing:
+            def generate(leaders):
+                indices = [missing[j] for j in leaders]
+                generated = generate_hot_keywords_batch([texts[i] for i in indices], [categories[i] for i in indices],
+                                                        max_extracted=15, max_recommended=5)
+                for i, keywords_result in zip(indices, generated):
+                    result_cache.keywords.set(texts[i], keywords_result, categories[i], version)
+                return generated
+
+            with span('keywords'):
+                generated = keywords_flight.do_batch(
+                    [content_key(texts[i], categories[i], version) for i in missing], generate
+                )
+            for i, keywords_result in zip(missing, generated):
+                keywords_results[i] = keywords_result
+        for result, keywords_result in zip(results, keywords_results):
+            result['extracted_keywords'] = keywords_result['extracted_keywords']
+            result['hot_keywords'] = keywords_result['recommended_hot_keywords']
+    except Exception as e:
+        logging.error(f"批次生成熱門關鍵字時發生錯誤: {str(e)}")
+        for result in results:
+            result.setdefault('hot_keywords', [])
+
+def text_fingerprint(text, segmented_texts):
+    """
+    計算文章的 SimHash 指紋，分詞結果會填回 segmented_texts 供關鍵字提取使用
+
+    返回:
+        int: 指紋，未啟用或詞數太少時返回 None
+    """
+    if not NEAR_DUPLICATE_ENABLED:
+        return None
+    segmented = segmented_texts[0]
+    if segmented is None:
+        sample = clip_text(text, KEYWORDS_MAX_CHARS)
+        segmented = segment(sample)
+        if sample is text:
+            segmented_texts[0] = segmented
+    words = [word for word in segmented.words if word.strip()]
+    if len(words) < NEAR_DUPLICATE_MIN_TOKENS:
+        return None
+    return simhash(words)
+
+def reuse_near_duplicate(fingerprint, predicted_category):
+    """
+    近似重複的草稿沿用上一版的熱門關鍵字與標題
+
+    返回:
+        tuple: (關鍵字結果, 標題結果)，沒有可沿用的結果時返回 None
+    """
+    payload = near_duplicate_index.find(fingerprint, predicted_category)
+    # 熱門關鍵字目錄重新載入後不再沿用
+    if payload is None or payload['catalog_version'] != catalog_version():
+        return None
+    keywords = {'extracted_keywords': payload['extracted_keywords'], 'hot_keywords': payload['hot_keywords']}
+    titles = {'suggested_titles': payload['suggested_titles']}
+    if not has_api_key:
+        titles['api_instructions'] = get_api_key_instructions()
+    return keywords, titles
+
+def remember_near_duplicate(result, fingerprint, predicted_category, titles_reusable=True):
+    """記錄分析結果；Gemini 失敗改用本地標題（titles_reusable 為 False）或關鍵字提取失敗時不記錄，避免沿用備用結果"""
+    if fingerprint is None or 'extracted_keywords' not in result or not titles_reusable:
+        return
+    near_duplicate_index.add(fingerprint, predicted_category, {
+        'extracted_keywords': result['extracted_keywords'],
+        'hot_keywords': result['hot_keywords'],
+        'suggested_titles': result['suggested_titles'],
+        'catalog_version': catalog_version()
+    })
+
+@app.route('/predict', methods=['POST'])
+def predict():
+    data = request.get_json()
+    text = data.get('text', '')
+    
+    error = text_error(text)
+    if error:
+        return jsonify({'error': error[0]}), error[1]
+    
+    return jsonify(analyze(text))
+
+def analyze(text):
+    """/predict 的完整分析流程，返回合併各階段結果的字典"""
+    result = {}
+    for stage, payload in analysis_stages(text):
+        result.update(payload)
+    return result
+
+def analysis_stages(text):
+    """
+    /predict 與 /predict/stream 共用的分析流程，依完成順序產生 (階段名稱, 結果字典)：
+    先產生分類結果（classification），再依完成順序產生熱門關鍵字（keywords）與標題建議（titles）
+    """
+    # 近似重複比對和關鍵字提取共用分詞結果
+    segmented_texts = [None]
+    predicted_category, probabilities = classify_texts([text])[0]
+    
+    # 記錄最終類別（每個請求都會執行，使用 DEBUG 等級與延遲格式化，未啟用時幾乎沒有成本）
+    logging.debug("最終預測類別: %s", predicted_category)
+    yield 'classification', build_result(predicted_category, probabilities)
+    
+    # 修改後重新送出的草稿沿用上一版的標題與熱門關鍵字
+    with span('near_duplicate'):
+        fingerprint = text_fingerprint(text, segmented_texts)
+        reused = reuse_near_duplicate(fingerprint, predicted_category)
+    if reused is not None:
+        yield 'keywords', reused[0]
+        yield 'titles', reused[1]
+        return
+    
+    # 標題在背景生成，同時進行熱門關鍵字推薦；標題若在關鍵字之前完成就先產生
+    title_future = start_suggested_titles(text, predicted_category)
+    titles = None
+    if title_future.done():
+        titles = {}
+        add_suggested_titles(titles, text, predicted_category, title_future)
+        yield 'titles', titles
+    
+    keywords = {}
+    add_hot_keywords(keywords, text, predicted_category, segmented_texts[0])
+    yield 'keywords', keywords
+    
+    # 等待標題建議完成
+    if titles is None:
+        titles = {}
+        add_suggested_titles(titles, text, predicted_category, title_future)
+        yield 'titles', titles
+    remember_near_duplicate(dict(keywords, **titles), fingerprint, predicted_category,
+                            title_future.exception() is None)
+
+@app.route('/predict/stream', methods=['POST'])
+def predict_stream():
+    """
+    以 NDJSON 串流回傳預測結果，每個階段完成後立即送出一行：
+    先送出分類結果，再依完成順序送出關鍵字與標題，最後送出 {"stage": "done"}
+    """
+    data = request.get_json(silent=True) or {}
+    text = data.get('text', '')
+    
+    error = text_error(text)
+    if error:
+        return jsonify({'error': error[0]}), error[1]
     
-    return jsonify(result)
+    def to_line(stage, payload):
+        return json.dumps(dict(payload, stage=stage), ensure_ascii=False) + '\n'
+    
+    def generate():
+        for stage, payload in analysis_stages(text):
+            yield to_line(stage, payload)
+        yield to_line('done', {})
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # 避免反向代理緩衝串流內容
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    批次預測多篇文章
+
+    請求格式:
+        texts (list): 文章內容列表
+        include_titles (bool): 是否生成標題建議，預設為 True
+        include_keywords (bool): 是否生成熱門關鍵字推薦，預設為 True
+    """
+    data = request.get_json(silent=True) or {}
+    texts = data.get('texts')
+    
+    error = batch_error(texts)
+    if error:
+        return jsonify({'error': error[0]}), error[1]
+    
+    # 只接受 JSON 布林值，避免 "false"、"0" 等字串被當成 True
+    for option in ('include_titles', 'include_keywords'):
+        if not isinstance(data.get(option, True), bool):
+            return jsonify({'error': f'{option} 必須是布林值（true 或 false）'}), 400
+    include_titles = data.get('include_titles', True)
+    include_keywords = data.get('include_keywords', True)
+    
+    classifications = classify_texts(texts)
+    
+    # 先讓所有文章的標題建議在背景開始生成
+    title_futures = [
+        start_suggested_titles(text, predicted_category) if include_titles else None
+        for text, (predicted_category, _) in zip(texts, classifications)
+    ]
+    
+    results = [
+        build_result(predicted_category, probabilities) for predicted_category, probabilities in classifications
+    ]
+    if include_keywords:
+        add_hot_keywords_batch(results, texts, [category for category, _ in classifications])
+    
+    if include_titles:
+        for result, text, title_future in zip(results, texts, title_futures):
+            add_suggested_titles(result, text, result['category'], title_future)
+    
+    logging.debug("批次預測了 %d 篇文章", len(results))
+    
+    return jsonify({'results': results, 'count': len(results)})
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.profile_token = None
+    if PROFILE_HEADER_ENABLED and request.headers.get('X-Profile') == '1':
+        g.profile_token = start_profile()
+
+@app.after_request
+def record_request_metrics(response):
+    """記錄每個端點的請求耗時與狀態碼；啟用 profile 時加上 Server-Timing 標頭"""
+    endpoint = request.endpoint or 'unknown'
+    elapsed = time.perf_counter() - g.request_started
+    observe('http_request_duration_seconds', elapsed, endpoint=endpoint)
+    increment('http_requests_total', endpoint=endpoint, status=response.status_code)
+    if g.profile_token is not None:
+        profile = finish_profile(g.profile_token)
+        profile.append(('total', elapsed))
+        response.headers['Server-Timing'] = server_timing(profile)
+    return response
+
+def metrics_gauges():
+    """/metrics 的 gauge 列表：快取命中率、微批次佇列深度、近似重複索引的命中率與進行中的合併計算數量"""
+    gauges = []
+    cache_stats = result_cache.stats()
+    for stage in result_cache.STAGES:
+        for key, value in cache_stats[stage].items():
+            gauges.append((f'cache_{key}', {'stage': stage}, value))
+    for key, value in cache_stats['local'].items():
+        gauges.append((f'cache_local_{key}', {}, value))
+    for key, value in classifier_batcher.stats().items():
+        gauges.append((f'batcher_{key}', {}, value))
+    for key, value in near_duplicate_index.stats().items():
+        gauges.append((f'near_duplicate_{key}', {}, value))
+    for flight in FLIGHTS:
+        gauges.append(('single_flight_in_flight', {'stage': flight.name}, flight.stats()['in_flight']))
+    for provider in gauge_providers:
+        gauges.extend(provider())
+    return gauges
+
+@app.route('/metrics')
+def metrics():
+    """以 Prometheus 文字格式返回各階段耗時直方圖、請求計數、快取命中率、微批次佇列深度與 Gemini 重試次數"""
+    return Response(render_prometheus(metrics_gauges()), mimetype='text/plain; version=0.0.4')
+
+@app.route('/stats')
+def stats():
+    """返回結果快取的命中統計、微批次的佇列深度與批次大小、近似重複索引的命中率、相同內容請求的合併次數，以及處理此請求的 worker 的記憶體使用量（共用與私有分頁）"""
+    return jsonify({
+        'cache': result_cache.stats(),
+        'batcher': classifier_batcher.stats(),
+        'near_duplicate': near_duplicate_index.stats(),
+        'single_flight': {flight.name: flight.stats() for flight in FLIGHTS},
+        'memory': {'pid': os.getpid(), **(process_memory() or {})}
+    })
+
+# 暖機用的範例文章
+WARMUP_TEXT = "今天和男友吵架並提了分手，心情很差，不知道接下來該怎麼辦"
+
+# 暖機完成後才回報就緒，負載平衡器不會把請求送到尚未暖機的 worker
+ready = threading.Event()
+
+def warmup():
+    """
+    以範例文章執行一次所有處理階段（斷詞、分類、關鍵字、本地標題），
+    讓 jieba 詞典、模型分頁等延遲初始化在第一個使用者請求之前完成；
+    不經過結果快取，也不呼叫 Gemini API
+    """
+    started = time.perf_counter()
+    predicted_category, _ = engine.predict([preprocess_text(WARMUP_TEXT)])[0]
+    generate_hot_keywords(WARMUP_TEXT, predicted_category)
+    mock_generate_titles(WARMUP_TEXT, predicted_category)
+    ready.set()
+    logging.info(f"暖機完成，耗時 {time.perf_counter() - started:.2f} 秒")
+
+@app.route('/ready')
+def readiness():
+    """就緒檢查：暖機完成前返回 503"""
+    if ready.is_set():
+        return jsonify({'ready': True})
+    return jsonify({'ready': False}), 503
+
+# 預設在載入時暖機；設定 WARMUP_ON_START=0 時略過暖機並直接視為就緒
+if os.getenv('WARMUP_ON_START', '1') != '0':
+    warmup()
+else:
+    ready.set()
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000) 
\ No newline at end of file
@@ -0,0 +1,332 @@
+"""
+ASGI 服務入口
+以 ASGI 伺服器（uvicorn）執行 app.py 的 Flask 應用程式，路由、驗證與處理流程完全相同，只在外層加上：
+
+- 准入控制：處理中的請求超過 ASGI_MAX_IN_FLIGHT，或等待 CPU 名額的請求超過 ASGI_MAX_QUEUE 時，
+  直接返回 503 與 Retry-After 標頭；等待名額超過 ASGI_QUEUE_TIMEOUT_MS 毫秒時也返回 503，不讓佇列無限增長
+- CPU 名額：同時執行斷詞、分類與關鍵字提取的請求最多 ASGI_WORKERS 個；請求開始等待 Gemini 回應時就釋放名額，
+  同時執行的分類仍由微批次排程合併成同一批預測
+- Gemini API 在事件迴圈上以非同步 I/O 呼叫（需要安裝 httpx），未安裝時使用同步用戶端的執行緒池
+- /metrics、/ready 與 /stats 不受准入控制，滿載時仍然可以監控
+
+使用方式:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app
+"""
+import asyncio
+import contextvars
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+# 導入 Flask 服務，所有路由都由它處理
+import app as service
+from gemini_client import GeminiError
+from title_generator import agenerate_titles, create_async_gemini_client, generate_titles_async
+# 導入效能指標模組
+from metrics import increment, observe
+
+# 同時執行 CPU 工作的請求數量，以及名額用完時最多可以等待的請求數量
+ASGI_WORKERS = int(os.getenv('ASGI_WORKERS', '4'))
+ASGI_MAX_QUEUE = int(os.getenv('ASGI_MAX_QUEUE', '32'))
+# 等待名額超過此毫秒數時放棄（用戶端多半已經逾時）
+ASGI_QUEUE_TIMEOUT_MS = float(os.getenv('ASGI_QUEUE_TIMEOUT_MS', '2000'))
+# 同時處理中的請求上限（包含等待 Gemini 回應的請求）
+ASGI_MAX_IN_FLIGHT = int(os.getenv('ASGI_MAX_IN_FLIGHT', '256'))
+# 返回 503 時建議用戶端等待的秒數
+ASGI_RETRY_AFTER = int(os.getenv('ASGI_RETRY_AFTER', '1'))
+
+# 不受准入控制的監控路徑
+UNLIMITED_PATHS = frozenset(('/metrics', '/ready', '/stats'))
+
+class WorkerSlots:
+    """
+    CPU 工作的名額
+
+    請求在事件迴圈中以 enqueue() 登記，等待的請求已達 max_queue 時立即拒絕；
+    在執行緒中以 acquire() 等待名額，超過 queue_timeout 秒時放棄
+    """
+
+    def __init__(self, workers, max_queue, queue_timeout):
+        """
+        參數:
+            workers (int): 名額數量
+            max_queue (int): 名額用完時最多可以等待的請求數量
+            queue_timeout (float): 最長的等待秒數，0 表示不限制
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._semaphore = threading.Semaphore(self.workers)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.busy = 0
+
+    def enqueue(self):
+        """登記一個等待名額的請求，佇列已滿時返回 False"""
+        with self._lock:
+            free = self.workers - self.busy
+            if self.waiting >= self.max_queue + max(0, free):
+                return False
+            self.waiting += 1
+            return True
+
+    def acquire(self):
+        """等待名額（在執行緒中呼叫），逾時返回 False"""
+        start = time.perf_counter()
+        acquired = self._semaphore.acquire(timeout=self.queue_timeout or None)
+        observe('asgi_queue_wait_seconds', time.perf_counter() - start)
+        with self._lock:
+            self.waiting -= 1
+            if acquired:
+                self.busy += 1
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self.busy -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {'workers': self.workers, 'busy': self.busy, 'queue_depth': self.waiting}
+
+class Slot:
+    """一個請求持有的名額，可以在等待 Gemini 回應之前提前釋放，重複釋放沒有作用"""
+
+    def __init__(self, slots):
+        self.slots = slots
+        self.held = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        self.held = self.slots.acquire()
+        return self.held
+
+    def release(self):
+        with self._lock:
+            if not self.held:
+                return
+            self.held = False
+        self.slots.release()
+
+slots = WorkerSlots(ASGI_WORKERS, ASGI_MAX_QUEUE, ASGI_QUEUE_TIMEOUT_MS / 1000)
+# 執行 Flask 應用程式的執行緒；多數執行緒在等待名額或 Gemini 回應，CPU 工作的並行數量由 slots 限制
+executor = ThreadPoolExecutor(max_workers=ASGI_MAX_IN_FLIGHT, thread_name_prefix='asgi')
+monitor_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='asgi-monitor')
+# 處理中的請求數量，只在事件迴圈中讀寫
+in_flight = 0
+# 目前請求持有的名額，app.before_titles_wait 以此提前釋放
+_current_slot = contextvars.ContextVar('asgi_slot', default=None)
+
+def release_current_slot():
+    slot = _current_slot.get()
+    if slot is not None:
+        slot.release()
+
+def asgi_gauges():
+    gauges = [('asgi_in_flight', {}, in_flight), ('asgi_max_in_flight', {}, ASGI_MAX_IN_FLIGHT)]
+    for key, value in slots.stats().items():
+        gauges.append((f'asgi_slots_{key}', {}, value))
+    return gauges
+
+def start_async_titles(loop, client, text, predicted_category, num_titles=3, fallback=True):
+    """
+    在事件迴圈上以非同步 I/O 生成標題，取代 app.generate_titles_future（在 Flask 的執行緒中呼叫）
+
+    返回:
+        concurrent.futures.Future: 結果為標題列表
+    """
+    future = Future()
+
+    def done(task):
+        if task.cancelled():
+            future.set_exception(GeminiError("標題生成已取消"))
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+    def start():
+        task = loop.create_task(agenerate_titles(text, predicted_category, num_titles, client=client, fallback=fallback))
+        task.add_done_callback(done)
+
+    # 在請求的 context 中執行，Gemini 呼叫的耗時記錄到請求的 profile
+    loop.call_soon_threadsafe(start, context=contextvars.copy_context())
+    return future
+
+def overloaded_messages(reason):
+    """503 回應的 ASGI 訊息"""
+    increment('admission_rejections_total', reason=reason)
+    body = json.dumps({'error': '伺服器忙碌中，請稍後再試'}).encode('utf-8')
+    return [
+        {'type': 'http.response.start', 'status': 503, 'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('latin-1')),
+            (b'retry-after', str(ASGI_RETRY_AFTER).encode('latin-1'))
+        ]},
+        {'type': 'http.response.body', 'body': body}
+    ]
+
+async def read_body(scope, receive):
+    """
+    讀取請求本文；Content-Length 超過 MAX_REQUEST_BYTES 時不讀取，超過上限的部分也不保存，
+    由 Flask 以 413 回應
+
+    返回:
+        bytes: 請求本文，用戶端中斷連線時返回 None
+    """
+    limit = service.MAX_REQUEST_BYTES
+    for name, value in scope['headers']:
+        if name.lower() == b'content-length' and limit and value.isdigit() and int(value) > limit:
+            return b''
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunk = message.get('body', b'')
+        if not limit or size <= limit:
+            chunks.append(chunk)
+            size += len(chunk)
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+def wsgi_environ(scope, body):
+    """由 ASGI 的 scope 建立 WSGI environ"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'REMOTE_ADDR': client[0],
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        # 本文已完整讀取，沒有 Content-Length 時 Flask 也會讀取並套用 MAX_CONTENT_LENGTH
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for name, value in scope['headers']:
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = 'HTTP_' + key
+        value = value.decode('latin-1')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def run_wsgi(environ, slot, emit):
+    """
+    在執行緒中執行 Flask 應用程式，回應狀態與每個本文區塊以 emit 交給事件迴圈，結束時 emit(None)
+
+    slot 不為 None 時先等待 CPU 名額，逾時則返回 503
+    """
+    _current_slot.set(slot)
+    try:
+        if slot is not None and not slot.acquire():
+            for message in overloaded_messages('queue_timeout'):
+                emit(message)
+            return
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+
+        body = service.app(environ, start_response)
+        try:
+            emit({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+            # 串流回應（/predict/stream）的每一行產生後立即送出
+            for chunk in body:
+                if chunk:
+                    emit({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        except Exception as e:
+            logging.exception(f"送出回應時發生錯誤: {str(e)}")
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        emit({'type': 'http.response.body', 'body': b''})
+    finally:
+        if slot is not None:
+            slot.release()
+        emit(None)
+
+async def http(scope, receive, send):
+    global in_flight
+    body = await read_body(scope, receive)
+    if body is None:
+        return
+    limited = scope['path'] not in UNLIMITED_PATHS
+    if limited and in_flight >= ASGI_MAX_IN_FLIGHT:
+        for message in overloaded_messages('in_flight'):
+            await send(message)
+        return
+    if limited and not slots.enqueue():
+        for message in overloaded_messages('queue_full'):
+            await send(message)
+        return
+
+    loop = asyncio.get_running_loop()
+    messages = asyncio.Queue()
+
+    def emit(message):
+        loop.call_soon_threadsafe(messages.put_nowait, message)
+
+    in_flight += limited
+    try:
+        job = loop.run_in_executor(executor if limited else monitor_executor, contextvars.copy_context().run,
+                                   run_wsgi, wsgi_environ(scope, body), Slot(slots) if limited else None, emit)
+        while (message := await messages.get()) is not None:
+            await send(message)
+        await job
+    finally:
+        in_flight -= limited
+
+async def lifespan(receive, send):
+    gemini = None
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            gemini = create_async_gemini_client()
+            if gemini is not None:
+                loop = asyncio.get_running_loop()
+                service.generate_titles_future = lambda *args, **kwargs: start_async_titles(loop, gemini, *args,
+                                                                                            **kwargs)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            service.generate_titles_future = generate_titles_async
+            if gemini is not None:
+                await gemini.aclose()
+            executor.shutdown(wait=True)
+            monitor_executor.shutdown(wait=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+# 請求等待 Gemini 回應之前釋放 CPU 名額；處理中的請求數量與名額使用情況加到 /metrics
+service.before_titles_wait = release_current_slot
+service.gauge_providers.append(asgi_gauges)
+
+async def app(scope, receive, send):
+    """ASGI 應用程式"""
+    if scope['type'] == 'http':
+        await http(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        await lifespan(receive, send)
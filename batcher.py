@@ -0,0 +1,170 @@
+"""
+微批次排程模組
+同時到達的請求先放進佇列，累積到一定數量或等待時間後合併成一批執行，
+讓 vectorizer.transform 與模型推論的固定成本由整批文章分攤
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+class _Failure:
+    """逐筆重新執行時，單筆資料的例外"""
+
+    __slots__ = ('exception',)
+
+    def __init__(self, exception):
+        self.exception = exception
+
+class MicroBatcher:
+    """
+    將單筆請求合併成批次執行
+
+    - 佇列中的第一筆資料等待超過 max_wait_ms，或累積到 max_batch_size 筆時，立即執行一批
+    - 每批只呼叫一次 batch_fn，結果依順序交回各請求的 Future
+    - 整批執行失敗時逐筆重新執行，一筆有問題的資料只會讓它自己的請求失敗
+    - 執行緒在每個程序第一次提交時啟動，fork 出的 worker 也會各自啟動
+    """
+
+    def __init__(self, batch_fn, max_batch_size=32, max_wait_ms=5.0, name='batcher'):
+        """
+        參數:
+            batch_fn (callable): 接收資料列表、返回相同長度結果列表的函數
+            max_batch_size (int): 每批最多的資料筆數
+            max_wait_ms (float): 第一筆資料最多等待的毫秒數，0 表示不合併，直接在呼叫端執行
+            name (str): 名稱，用於執行緒名稱與日誌
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.name = name
+        self._init_state()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._init_state)
+
+    def _init_state(self):
+        # fork 後父程序的執行緒不存在，佇列與鎖都重新建立
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._worker_pid = None
+        self.batches = 0
+        self.items = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.errors = 0
+        self.item_errors = 0
+
+    def _ensure_worker(self):
+        if self._worker_pid == os.getpid():
+            return
+        with self._condition:
+            if self._worker_pid == os.getpid():
+                return
+            self._worker_pid = os.getpid()
+        thread = threading.Thread(target=self._run, name=f'{self.name}-worker', daemon=True)
+        thread.start()
+
+    def submit(self, item):
+        """
+        提交一筆資料
+
+        返回:
+            Future: 完成後的結果為 batch_fn 對該筆資料的輸出
+        """
+        future = Future()
+        self._ensure_worker()
+        with self._condition:
+            self._queue.append((item, future, time.monotonic()))
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+            self._condition.notify()
+        return future
+
+    def map(self, items):
+        """
+        處理多筆資料並等待全部完成
+
+        資料筆數已達批次上限或關閉合併時，直接在呼叫端執行，不經過佇列
+        """
+        items = list(items)
+        if not items:
+            return []
+        if self.max_wait == 0 or len(items) >= self.max_batch_size:
+            return list(self.batch_fn(items))
+        futures = [self.submit(item) for item in items]
+        return [future.result() for future in futures]
+
+    def _take_batch(self):
+        """等待直到可以執行一批，返回該批的 (資料, Future, 提交時間) 列表"""
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            deadline = self._queue[0][2] + self.max_wait
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            count = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(count)]
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            started = time.monotonic()
+            try:
+                results = list(self.batch_fn([item for item, _, _ in batch]))
+            except BaseException as e:
+                # 包含 BaseException：執行緒不能因此結束，否則佇列中的請求永遠等不到結果
+                self.errors += 1
+                logger.error(f"{self.name} 批次執行失敗: {str(e)}")
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                    continue
+                # 逐筆重新執行，只有造成錯誤的資料的請求會失敗
+                results = self._run_each(batch)
+            self.batches += 1
+            self.items += len(batch)
+            self.total_wait += sum(started - submitted for _, _, submitted in batch)
+            if len(results) != len(batch):
+                self.errors += 1
+                logger.error(f"{self.name} 批次結果數量 {len(results)} 與資料筆數 {len(batch)} 不同")
+            for (_, future, _), result in zip(batch, results):
+                if isinstance(result, _Failure):
+                    future.set_exception(result.exception)
+                else:
+                    future.set_result(result)
+            # 沒有對應結果的請求直接失敗，不會一直等待
+            for _, future, _ in batch[len(results):]:
+                future.set_exception(RuntimeError(f"{self.name} 批次沒有返回這筆資料的結果"))
+
+    def _run_each(self, batch):
+        """逐筆執行 batch_fn，失敗的資料以 _Failure 表示"""
+        results = []
+        for item, _, _ in batch:
+            try:
+                results.append(self.batch_fn([item])[0])
+            except BaseException as e:
+                self.item_errors += 1
+                logger.error(f"{self.name} 單筆執行失敗: {str(e)}")
+                results.append(_Failure(e))
+        return results
+
+    def stats(self):
+        """返回目前的佇列深度與批次統計"""
+        return {
+            'queue_depth': len(self._queue),
+            'max_queue_depth': self.max_queue_depth,
+            'batches': self.batches,
+            'items': self.items,
+            'errors': self.errors,
+            'item_errors': self.item_errors,
+            'avg_batch_size': self.items / self.batches if self.batches else 0.0,
+            'avg_wait_ms': self.total_wait / self.items * 1000 if self.items else 0.0,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000
+        }
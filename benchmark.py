@@ -0,0 +1,262 @@
+"""
+效能基準測試
+重播 raw_data/測試.csv 的文章，測量每個處理階段的吞吐量與 p50/p95/p99 延遲，結果寫入 JSON，
+提供上一次的結果（--baseline）時比較兩次執行，延遲變慢或吞吐量下降超過門檻的階段標記為退步
+
+使用方式:
+    python benchmark.py --output bench/before.json
+    python benchmark.py --baseline bench/before.json --output bench/after.json
+
+測量的階段:
+    preprocess                      app.preprocess_text（斷詞與清理）
+    classify                        單篇文章的向量化與模型預測
+    classify_batch                  整批文章一次向量化與預測（吞吐量以文章數計算）
+    keywords_tfidf / _textrank / _mixed   keyword_extractor.extract_keywords 的三種方法（使用已斷詞的結果）
+    keywords_tfidf_batch / _mixed_batch   keyword_extractor.extract_keywords_batch 整批提取（吞吐量以文章數計算）
+    recommend                       keyword_extractor.get_related_popular_keywords
+    mock_titles                     title_generator.mock_generate_titles
+    end_to_end                      以 Flask 測試用戶端呼叫 /predict，Gemini API 以固定回應取代
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CORPUS = os.path.join(BASE_DIR, 'raw_data', '測試.csv')
+
+STUB_TITLES = "1. 男友突然變冷淡該怎麼辦\n2. 吵架之後他就不再主動了\n3. 沒有安全感的我是不是想太多"
+
+# 比較時使用的數值；latency 越大越差，throughput 越小越差
+LATENCY_KEYS = ('p50_ms', 'p95_ms', 'p99_ms')
+THROUGHPUT_KEY = 'throughput_per_sec'
+
+class StubGeminiClient:
+    """以固定回應取代 Gemini API，可以加上模擬的網路延遲"""
+
+    def __init__(self, latency_ms=0.0, pool_size=8, deadline=15.0):
+        self.latency = latency_ms / 1000
+        self.deadline = deadline
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='gemini-stub')
+
+    def generate_content(self, prompt, deadline=None):
+        if self.latency:
+            time.sleep(self.latency)
+        return STUB_TITLES
+
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(fn, *args, **kwargs)
+
+def load_posts(path, limit):
+    """讀取文章內容（標題加內文），略過空白文章"""
+    frame = pd.read_csv(path, usecols=['artTitle', 'artContent'], keep_default_na=False)
+    posts = [f"{title}\n{content}".strip() for title, content in zip(frame['artTitle'], frame['artContent'])]
+    posts = [post for post in posts if post]
+    return posts[:limit] if limit else posts
+
+def summarize(samples, items=None):
+    """
+    將每次呼叫的耗時（秒）整理為延遲百分位數與吞吐量
+
+    參數:
+        samples (list): 每次呼叫的秒數
+        items (int): 處理的項目總數，預設等於呼叫次數
+    """
+    samples = np.asarray(samples) * 1000
+    total_seconds = samples.sum() / 1000
+    return {
+        'calls': len(samples),
+        'p50_ms': round(float(np.percentile(samples, 50)), 4),
+        'p95_ms': round(float(np.percentile(samples, 95)), 4),
+        'p99_ms': round(float(np.percentile(samples, 99)), 4),
+        'mean_ms': round(float(samples.mean()), 4),
+        THROUGHPUT_KEY: round((items or len(samples)) / total_seconds, 2) if total_seconds else 0.0
+    }
+
+def measure(fn, inputs, repeat):
+    """對每個輸入呼叫 fn，重複 repeat 輪，返回每次呼叫的秒數"""
+    samples = []
+    for _ in range(repeat):
+        for value in inputs:
+            started = time.perf_counter()
+            fn(value)
+            samples.append(time.perf_counter() - started)
+    return samples
+
+def run(posts, repeat=3, batch_size=64, gemini_latency_ms=0.0, stages=None):
+    """
+    執行基準測試
+
+    參數:
+        posts (list): 文章內容列表
+        repeat (int): 每個階段重播的輪數
+        batch_size (int): classify_batch 與批次關鍵詞提取每批的文章數
+        gemini_latency_ms (float): 模擬的 Gemini API 延遲
+        stages (list): 只執行指定的階段，預設全部
+
+    返回:
+        dict: 各階段的測量結果
+    """
+    # 依序重播的請求沒有可以合併的同時請求，關閉微批次等待；結果快取與近似重複索引在每次請求前清空，
+    # 相近的文章不會沿用前一篇的標題與關鍵字
+    os.environ.setdefault('MICRO_BATCH_MAX_WAIT_MS', '0')
+    # 使用固定回應的 Gemini 用戶端，需要讓 app 以為已設定 API 密鑰
+    os.environ.setdefault('GEMINI_API_KEY', 'benchmark')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    import app
+    import title_generator
+    from keyword_extractor import extract_keywords, extract_keywords_batch, get_related_popular_keywords
+    from tokenizer import segment
+
+    title_generator.gemini_client = StubGeminiClient(gemini_latency_ms)
+
+    segmented = [segment(post) for post in posts]
+    processed = [app.preprocess_text(post) for post in posts]
+    predicted = [label for label, _ in app.engine.predict(processed)]
+    keywords = [extract_keywords(post, 'mixed', 15, seg) for post, seg in zip(posts, segmented)]
+    indices = range(len(posts))
+
+    def replay_predict(i):
+        app.result_cache.local.clear()
+        app.near_duplicate_index.clear()
+        response = client.post('/predict', json={'text': posts[i]})
+        if response.status_code != 200:
+            raise RuntimeError(f"/predict 回應狀態碼 {response.status_code}")
+
+    client = app.app.test_client()
+    batches = [processed[i:i + batch_size] for i in range(0, len(processed), batch_size)]
+    index_batches = [range(i, min(i + batch_size, len(posts))) for i in range(0, len(posts), batch_size)]
+
+    def keywords_batch(method):
+        return lambda batch: extract_keywords_batch([posts[i] for i in batch], method, 15,
+                                                    [segmented[i] for i in batch])
+    benchmarks = {
+        'preprocess': (lambda i: app.preprocess_text(posts[i]), indices, None),
+        'classify': (lambda i: app.engine.predict([processed[i]]), indices, None),
+        'classify_batch': (app.engine.predict, batches, len(processed)),
+        'keywords_tfidf': (lambda i: extract_keywords(posts[i], 'tfidf', 15, segmented[i]), indices, None),
+        'keywords_textrank': (lambda i: extract_keywords(posts[i], 'textrank', 15, segmented[i]), indices, None),
+        'keywords_mixed': (lambda i: extract_keywords(posts[i], 'mixed', 15, segmented[i]), indices, None),
+        'keywords_tfidf_batch': (keywords_batch('tfidf'), index_batches, len(posts)),
+        'keywords_mixed_batch': (keywords_batch('mixed'), index_batches, len(posts)),
+        'recommend': (lambda i: get_related_popular_keywords(keywords[i], predicted[i], 5), indices, None),
+        'mock_titles': (lambda i: title_generator.mock_generate_titles(posts[i], predicted[i], 3), indices, None),
+        'end_to_end': (replay_predict, indices, None)
+    }
+
+    results = {}
+    for name, (fn, inputs, items) in benchmarks.items():
+        if stages and name not in stages:
+            continue
+        samples = measure(fn, inputs, repeat)
+        results[name] = summarize(samples, items * repeat if items else None)
+        logging.info(f"{name}: p50 {results[name]['p50_ms']:.3f} ms")
+    return results
+
+def environment_info():
+    """記錄影響結果的環境資訊，比較不同機器的結果時參考"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'serving_mode': os.getenv('SERVING_MODE', 'ensemble'),
+        'micro_batch_max_wait_ms': float(os.getenv('MICRO_BATCH_MAX_WAIT_MS', '5'))
+    }
+
+def compare(current, baseline, threshold):
+    """
+    比較兩次執行的結果
+
+    參數:
+        current (dict): 本次的 stages 結果
+        baseline (dict): 基準的 stages 結果
+        threshold (float): 容許的變化比例，例如 0.1 表示慢 10% 以內不算退步
+
+    返回:
+        list: 每個共同階段、每個比較數值的 (階段, 數值名稱, 基準值, 本次值, 變化比例, 是否退步)
+    """
+    rows = []
+    for stage, values in current.items():
+        if stage not in baseline:
+            continue
+        for key in LATENCY_KEYS + (THROUGHPUT_KEY,):
+            before, after = baseline[stage].get(key), values.get(key)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            regressed = change > threshold if key in LATENCY_KEYS else change < -threshold
+            rows.append((stage, key, before, after, change, regressed))
+    return rows
+
+def print_results(results, comparison=None):
+    print(f"{'階段':<18}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'吞吐量/秒':>12}")
+    for stage, values in results.items():
+        print(f"{stage:<20}{values['p50_ms']:>10.3f}{values['p95_ms']:>10.3f}{values['p99_ms']:>10.3f}"
+              f"{values[THROUGHPUT_KEY]:>12.1f}")
+    if comparison:
+        regressions = [row for row in comparison if row[5]]
+        print(f"\n與基準比較：{len(regressions)} 項退步")
+        for stage, key, before, after, change, _ in regressions:
+            print(f"  {stage} {key}: {before} -> {after} ({change:+.1%})")
+
+def main():
+    parser = argparse.ArgumentParser(description='重播測試文章，測量各處理階段的延遲與吞吐量')
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help='重播的文章 CSV 檔案')
+    parser.add_argument('--limit', type=int, default=200, help='使用的文章數量，0 表示全部')
+    parser.add_argument('--repeat', type=int, default=3, help='每個階段重播的輪數')
+    parser.add_argument('--batch-size', type=int, default=64, help='classify_batch 與批次關鍵詞提取每批的文章數')
+    parser.add_argument('--gemini-latency-ms', type=float, default=0.0, help='模擬的 Gemini API 延遲（毫秒）')
+    parser.add_argument('--stages', nargs='+', default=None, help='只執行指定的階段')
+    parser.add_argument('--output', default=None, help='將結果寫入 JSON 檔案')
+    parser.add_argument('--baseline', default=None, help='作為比較基準的 JSON 結果')
+    parser.add_argument('--threshold', type=float, default=0.15, help='判定為退步的變化比例')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    posts = load_posts(args.corpus, args.limit)
+    results = run(posts, args.repeat, args.batch_size, args.gemini_latency_ms, args.stages)
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'environment': environment_info(),
+        'corpus': {'path': os.path.relpath(args.corpus, BASE_DIR), 'documents': len(posts), 'repeat': args.repeat},
+        'stages': results
+    }
+
+    comparison = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        comparison = compare(results, baseline['stages'], args.threshold)
+        report['comparison'] = {
+            'baseline': args.baseline,
+            'threshold': args.threshold,
+            'regressions': [
+                {'stage': stage, 'metric': key, 'baseline': before, 'current': after, 'change': round(change, 4)}
+                for stage, key, before, after, change, regressed in comparison if regressed
+            ]
+        }
+
+    print_results(results, comparison)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    # 有退步時以非零狀態結束，CI 可以直接判斷
+    if comparison and any(row[5] for row in comparison):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
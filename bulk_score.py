@@ -0,0 +1,288 @@
+"""
+離線批次評分工具
+重新分類歷史文章（raw_data/*.csv 的 artTitle/artContent/boardID 格式，或每行一篇文章的 JSONL），
+輸出每篇文章的類別、各類別機率、提取的關鍵詞與推薦的熱門關鍵字，結果與線上 /predict 相同
+
+使用方式:
+    python bulk_score.py raw_data/merge_from_ofoct.csv --output scores.jsonl
+    python bulk_score.py posts.jsonl --output scores.csv --workers 8 --chunk-size 2000
+    # 中斷後從上一個檢查點繼續
+    python bulk_score.py raw_data/merge_from_ofoct.csv --output scores.jsonl --resume
+
+- 輸入分段讀取，斷詞與關鍵詞提取在多個程序中平行執行，最多同時有 workers * 2 個分段在處理中
+- 每個分段的文章在主程序中一次向量化與預測（稀疏矩陣整批計算）
+- 結果依輸入順序寫入；每寫完一個分段就更新檢查點（<output>.checkpoint.json），記錄已處理的列數與輸出檔案大小
+- JSONL 輸入的每一行可以是 {"id": ..., "text": ...}，也可以使用與 CSV 相同的欄位名稱
+"""
+import argparse
+import csv
+import itertools
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+# 導入共用分詞與關鍵詞提取，與線上服務使用相同的處理流程
+from tokenizer import classifier_input, clip_text
+from keyword_extractor import extract_keywords_batch, get_related_popular_keywords
+
+# 設置日誌
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+USE_COLUMNS = ['artUrl', 'artTitle', 'artContent', 'boardID']
+# 與 app.add_hot_keywords 相同的數量
+MAX_EXTRACTED = 15
+MAX_RECOMMENDED = 5
+# 無法解析的 JSONL 行以只包含此欄位（錯誤訊息）的記錄表示
+PARSE_ERROR_KEY = '_parse_error'
+
+def is_repeated_header(record):
+    """合併的 CSV（例如 merge_from_ofoct.csv）中間會有重複的表頭列"""
+    return record.get('boardID') == 'boardID'
+
+def post_text(record):
+    """文章內容為標題加內文，JSONL 也可以直接提供 text；重複的表頭列視為空白"""
+    if is_repeated_header(record):
+        return ''
+    if record.get('text'):
+        return record['text']
+    return f"{record.get('artTitle') or ''}\n{record.get('artContent') or ''}".strip()
+
+def iter_csv(path, chunk_size):
+    reader = pd.read_csv(path, chunksize=chunk_size, dtype=str, encoding='utf-8-sig', keep_default_na=False,
+                         usecols=lambda column: column in USE_COLUMNS)
+    for frame in reader:
+        yield frame.to_dict('records')
+
+def parse_jsonl_line(line):
+    """
+    解析一行 JSONL，空白行視為空白文章
+
+    格式錯誤的行不會中斷整個工作，返回只包含錯誤訊息的記錄，輸出時與空白文章一樣填入 error 欄位
+    """
+    if not line.strip():
+        return {}
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as e:
+        return {PARSE_ERROR_KEY: f'JSON 格式錯誤（第 {e.colno} 個字元）: {e.msg}'}
+    if not isinstance(record, dict):
+        return {PARSE_ERROR_KEY: 'JSON 內容不是物件'}
+    return record
+
+def iter_jsonl(path, chunk_size):
+    with open(path, encoding='utf-8') as f:
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                return
+            yield [parse_jsonl_line(line) for line in lines]
+
+def iter_rows(path, chunk_size, skip_rows=0):
+    """
+    分段讀取輸入檔案，跳過前 skip_rows 列（從檢查點繼續時）
+
+    產生:
+        (int, list): 分段第一列的列號與該分段的記錄
+    """
+    reader = iter_jsonl if path.endswith(('.jsonl', '.ndjson')) else iter_csv
+    row = 0
+    for records in reader(path, chunk_size):
+        start = row
+        row += len(records)
+        if row <= skip_rows:
+            continue
+        if start < skip_rows:
+            records, start = records[skip_rows - start:], skip_rows
+        yield start, records
+
+def process_texts(texts, classify_max_chars, classify_sampling):
+    """
+    在 worker 程序中斷詞並提取關鍵詞，與 app.classify_texts 和 app.add_hot_keywords 的處理相同：
+    分類只使用截取的部分（先只保留中文字元再斷詞），關鍵詞提取使用整篇文章的分詞結果
+
+    返回:
+        list: 每篇文章的 (分類器輸入, 關鍵詞列表)，空白文章為 None
+    """
+    scored = [i for i, text in enumerate(texts) if text]
+    # 整批提取關鍵詞（TF-IDF 以稀疏矩陣計算）
+    keyword_lists = extract_keywords_batch([texts[i] for i in scored], method='mixed', num_keywords=MAX_EXTRACTED)
+    results = [None] * len(texts)
+    for i, keywords in zip(scored, keyword_lists):
+        results[i] = (classifier_input(clip_text(texts[i], classify_max_chars, classify_sampling)), keywords)
+    return results
+
+class ResultWriter:
+    """依副檔名以 JSONL 或 CSV 格式寫入結果"""
+
+    def __init__(self, path, labels, append):
+        self.path = path
+        self.is_csv = path.endswith('.csv')
+        self.file = open(path, 'a' if append else 'w', encoding='utf-8', newline='')
+        self.columns = ['row', 'id', 'board', 'category', 'category_name'] + \
+                       [f'prob_{label}' for label in labels] + ['extracted_keywords', 'hot_keywords', 'error']
+        if self.is_csv:
+            self.writer = csv.DictWriter(self.file, fieldnames=self.columns)
+            if not append:
+                self.writer.writeheader()
+
+    def write(self, result):
+        if not self.is_csv:
+            self.file.write(json.dumps(result, ensure_ascii=False) + '\n')
+            return
+        row = {key: result.get(key) for key in ('row', 'id', 'board', 'category', 'category_name', 'error')}
+        for label, probability in (result.get('probabilities') or {}).items():
+            row[f'prob_{label}'] = probability
+        row['extracted_keywords'] = ' '.join(result.get('extracted_keywords') or [])
+        row['hot_keywords'] = ' '.join(item['keyword'] for item in result.get('hot_keywords') or [])
+        self.writer.writerow(row)
+
+    def sync(self):
+        """確保已寫入的內容落地，返回目前的檔案大小"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+def checkpoint_path(output):
+    return output + '.checkpoint.json'
+
+def load_checkpoint(output, input_path, model_version):
+    """
+    讀取檢查點並將輸出檔案截斷到檢查點記錄的大小（捨棄寫到一半的分段）
+
+    返回:
+        int: 已處理的列數，沒有可用的檢查點時返回 0
+    """
+    path = checkpoint_path(output)
+    if not os.path.exists(path) or not os.path.exists(output):
+        logger.warning("找不到檢查點，從頭開始處理")
+        return 0
+    with open(path, encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if checkpoint['input'] != os.path.abspath(input_path):
+        raise ValueError(f"檢查點記錄的輸入檔案為 {checkpoint['input']}，與本次不同")
+    if checkpoint['model_version'] != model_version:
+        raise ValueError("模型已更新，檢查點之前的結果與目前的模型不一致，請重新處理")
+    with open(output, 'r+b') as f:
+        f.truncate(checkpoint['output_bytes'])
+    logger.info(f"從檢查點繼續：已處理 {checkpoint['rows_done']} 列")
+    return checkpoint['rows_done']
+
+def save_checkpoint(output, input_path, model_version, rows_done, output_bytes):
+    """先寫入暫存檔再取代，中斷時不會留下寫到一半的檢查點"""
+    path = checkpoint_path(output)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'input': os.path.abspath(input_path),
+            'model_version': model_version,
+            'rows_done': rows_done,
+            'output_bytes': output_bytes
+        }, f)
+    os.replace(temp_path, path)
+
+def score(input_path, output, workers=None, chunk_size=1000, resume=False):
+    """
+    執行批次評分
+
+    參數:
+        input_path (str): 輸入的 CSV 或 JSONL 檔案
+        output (str): 輸出檔案，副檔名為 .csv 時輸出 CSV，否則輸出 JSONL
+        workers (int): 斷詞與關鍵詞提取的 worker 程序數量，預設為 CPU 核心數
+        chunk_size (int): 每個分段的列數，也是每次向量化與預測的批次大小
+        resume (bool): 是否從檢查點繼續
+
+    返回:
+        int: 本次處理的列數
+    """
+    # 只使用 app 的模型與分類設定，不需要暖機
+    os.environ.setdefault('WARMUP_ON_START', '0')
+    import app
+
+    engine = app.engine
+    # 與結果快取相同，分類的截取方式也會影響結果
+    model_version = f"{engine.version}:{app.CLASSIFY_MAX_CHARS}:{app.CLASSIFY_SAMPLING}"
+    workers = workers or os.cpu_count() or 1
+    rows_done = load_checkpoint(output, input_path, model_version) if resume else 0
+    writer = ResultWriter(output, engine.labels, append=rows_done > 0)
+    rows = 0
+    started = time.perf_counter()
+
+    def write_chunk(start, records, future):
+        nonlocal rows
+        processed = future.result()
+        scored = [i for i, item in enumerate(processed) if item is not None]
+        # 整個分段一次向量化與預測
+        classifications = engine.predict([processed[i][0] for i in scored]) if scored else []
+        predictions = dict(zip(scored, classifications))
+        for i, record in enumerate(records):
+            if is_repeated_header(record):
+                continue
+            result = {
+                'row': start + i,
+                'id': record['id'] if 'id' in record else record.get('artUrl') or None,
+                'board': record.get('boardID') or None
+            }
+            if i in predictions:
+                category, probabilities = predictions[i]
+                keywords = processed[i][1]
+                result.update({
+                    'category': category,
+                    'category_name': app.CATEGORY_NAMES.get(category, '閒聊板'),
+                    'probabilities': probabilities,
+                    'extracted_keywords': [word for word, _ in keywords[:10]],
+                    'hot_keywords': get_related_popular_keywords(keywords, category, max_keywords=MAX_RECOMMENDED)
+                })
+            elif PARSE_ERROR_KEY in record:
+                result['error'] = record[PARSE_ERROR_KEY]
+                logger.warning(f"第 {start + i} 列無法解析: {result['error']}")
+            else:
+                result['error'] = '文章內容為空'
+            writer.write(result)
+        rows += len(records)
+        save_checkpoint(output, input_path, model_version, start + len(records), writer.sync())
+        elapsed = time.perf_counter() - started
+        logger.info(f"已處理 {start + len(records)} 列（本次 {rows} 列，{rows / elapsed:.0f} 列/秒）")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # 結果依輸入順序寫入，最多同時有 workers * 2 個分段在處理中
+            pending = deque()
+            for start, records in iter_rows(input_path, chunk_size, rows_done):
+                texts = [post_text(record) for record in records]
+                future = executor.submit(process_texts, texts, app.CLASSIFY_MAX_CHARS, app.CLASSIFY_SAMPLING)
+                pending.append((start, records, future))
+                while len(pending) >= workers * 2:
+                    write_chunk(*pending.popleft())
+            while pending:
+                write_chunk(*pending.popleft())
+    finally:
+        writer.close()
+
+    # 全部完成後移除檢查點，下次執行時從頭開始
+    if os.path.exists(checkpoint_path(output)):
+        os.remove(checkpoint_path(output))
+    elapsed = time.perf_counter() - started
+    logger.info(f"完成：處理 {rows} 列，耗時 {elapsed:.1f} 秒（{rows / elapsed if elapsed else 0:.0f} 列/秒），"
+                f"已寫入 {output}")
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='批次重新分類文章，輸出類別、機率與關鍵字')
+    parser.add_argument('input', help='輸入的 CSV（artTitle/artContent/boardID）或 JSONL 檔案')
+    parser.add_argument('--output', required=True, help='輸出檔案，副檔名為 .csv 時輸出 CSV，否則輸出 JSONL')
+    parser.add_argument('--workers', type=int, default=None, help='worker 程序數量，預設為 CPU 核心數')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='每個分段的列數，也是預測的批次大小')
+    parser.add_argument('--resume', action='store_true', help='從上一次中斷的檢查點繼續')
+    args = parser.parse_args()
+
+    score(args.input, args.output, workers=args.workers, chunk_size=args.chunk_size, resume=args.resume)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""
+結果快取模組
+以正規化文本的雜湊值（加上模型版本等參數）為鍵，分別快取分類、關鍵字和標題結果
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+def normalize_text(text):
+    """正規化文本：統一全形半形字元，並合併多餘的空白"""
+    text = unicodedata.normalize('NFKC', text)
+    return WHITESPACE_PATTERN.sub(' ', text).strip()
+
+def content_key(text, *parts):
+    """
+    計算快取鍵
+
+    參數:
+        text (str): 文章內容，會先經過正規化
+        parts: 其他影響結果的參數（例如模型版本、類別）
+
+    返回:
+        str: SHA-256 十六進位字串
+    """
+    digest = hashlib.sha256(normalize_text(text).encode('utf-8'))
+    for part in parts:
+        digest.update(b'\x00')
+        digest.update(str(part).encode('utf-8'))
+    return digest.hexdigest()
+
+class LRUCache:
+    """
+    執行緒安全的程序內 LRU 快取，同時限制項目數量、總位元組數和存活時間
+    值以 bytes 儲存，位元組數即為實際佔用的大小
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, ttl=3600):
+        """
+        參數:
+            max_entries (int): 最多保留的項目數量
+            max_bytes (int): 所有值加總的位元組上限
+            ttl (float): 項目存活秒數，0 表示不過期
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        """取得快取值，不存在或已過期時返回 None"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at and expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """寫入快取值，超出上限時淘汰最久未使用的項目"""
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires_at)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        value, _ = self._data.pop(key)
+        self._bytes -= len(value)
+
+    def clear(self):
+        """清空快取"""
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """返回目前的項目數量、位元組數與淘汰次數"""
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'evictions': self.evictions
+            }
+
+class RedisBackend:
+    """
+    以 Redis 作為多個 worker 共用的快取後端
+    需要安裝 redis 套件；連線失敗時只記錄警告，不影響請求
+    """
+
+    def __init__(self, url, prefix='dcard-post-helper:'):
+        import redis  # 選用套件，只有啟用共用快取時才需要
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            return self.client.get(self.prefix + key)
+        except Exception as e:
+            logger.warning(f"讀取共用快取失敗: {str(e)}")
+            return None
+
+    def set(self, key, value, ttl):
+        try:
+            self.client.set(self.prefix + key, value, ex=int(ttl) if ttl else None)
+        except Exception as e:
+            logger.warning(f"寫入共用快取失敗: {str(e)}")
+
+class StageCache:
+    """
+    單一處理階段（分類、關鍵字、標題）的結果快取
+    先查詢程序內 LRU，未命中時再查詢共用後端（若有設定）
+    """
+
+    def __init__(self, name, local, backend=None, version=''):
+        """
+        參數:
+            name (str): 階段名稱，也作為快取鍵的一部分
+            local (LRUCache): 程序內快取
+            backend: 共用快取後端，需提供 get(key) 和 set(key, value, ttl)
+            version (str): 影響結果的版本字串（例如模型版本）
+        """
+        self.name = name
+        self.local = local
+        self.backend = backend
+        self.version = version
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _key(self, text, params):
+        return content_key(text, self.name, self.version, *params)
+
+    def get(self, text, *params):
+        """取得快取結果，未命中時返回 None"""
+        key = self._key(text, params)
+        value = self.local.get(key)
+        if value is not None:
+            self.hits += 1
+            return json.loads(value)
+        if self.backend is not None:
+            value = self.backend.get(key)
+            if value is not None:
+                self.shared_hits += 1
+                self.local.set(key, value)
+                return json.loads(value)
+        self.misses += 1
+        return None
+
+    def set(self, text, result, *params):
+        """寫入結果，結果必須可以轉換為 JSON"""
+        key = self._key(text, params)
+        value = json.dumps(result, ensure_ascii=False).encode('utf-8')
+        self.local.set(key, value)
+        if self.backend is not None:
+            self.backend.set(key, value, self.local.ttl)
+
+    def stats(self):
+        """返回命中與未命中次數"""
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.shared_hits) / lookups if lookups else 0.0
+        }
+
+class ResultCache:
+    """分類、關鍵字和標題三個階段的快取集合，共用同一個程序內 LRU 與共用後端"""
+
+    STAGES = ('classification', 'keywords', 'titles')
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, ttl=3600, redis_url=None, model_version=''):
+        self.local = LRUCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+        backend = None
+        if redis_url:
+            try:
+                backend = RedisBackend(redis_url)
+                logger.info("已啟用共用結果快取")
+            except ImportError:
+                logger.warning("未安裝 redis 套件，僅使用程序內快取")
+        self.classification = StageCache('classification', self.local, backend, version=model_version)
+        self.keywords = StageCache('keywords', self.local, backend)
+        self.titles = StageCache('titles', self.local, backend)
+
+    def stats(self):
+        """返回各階段的命中統計與程序內快取的使用量"""
+        result = {stage: getattr(self, stage).stats() for stage in self.STAGES}
+        result['local'] = self.local.stats()
+        return result
@@ -0,0 +1,290 @@
+"""
+精簡 TF-IDF 向量化器模組
+將 sklearn 的 TfidfVectorizer 匯出為不需要 pickle 的 .npz 檔案：排序後的詞彙陣列與 float32 IDF 權重，
+載入時不需要反序列化 Python 物件，也不受 sklearn 版本差異影響
+
+支援兩種模式：
+- vocabulary：詞彙以排序陣列保存，查詢時以二分搜尋（numpy.searchsorted）取得特徵欄位
+- hashing：以 HashingVectorizer 將詞彙雜湊到固定數量的欄位，不需要保存詞彙，只保存每個欄位的 IDF
+
+匯出時記錄來源 joblib 檔案的 SHA-256，來源檔案重新訓練或替換後，select_vectorizer_path 改為載入 joblib 檔案，
+避免新模型搭配舊詞彙
+
+使用方式:
+    python compact_vectorizer.py Dcard-posts-classification-main/tfidf_vectorizer.joblib \\
+        Dcard-posts-classification-main/tfidf_vectorizer.npz
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import numpy as np
+from scipy import sparse
+
+FORMAT_VERSION = 1
+MODE_VOCABULARY = 'vocabulary'
+MODE_HASHING = 'hashing'
+DEFAULT_TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+# 模型目錄中的向量化器檔案名稱
+COMPACT_FILENAME = 'tfidf_vectorizer.npz'
+SOURCE_FILENAME = 'tfidf_vectorizer.joblib'
+
+logger = logging.getLogger(__name__)
+
+class CompactVectorizer:
+    """
+    以排序詞彙陣列（或雜湊）與 float32 IDF 權重計算 TF-IDF 特徵，結果與 sklearn 的 TfidfVectorizer 相同
+    （IDF 以 float32 保存，誤差在 1e-6 以內）
+    """
+
+    def __init__(self, mode, idf, terms=None, n_features=None, lowercase=True, token_pattern=DEFAULT_TOKEN_PATTERN,
+                 norm='l2', sublinear_tf=False, binary=False, source_sha256=None):
+        """
+        參數:
+            mode (str): 'vocabulary' 或 'hashing'
+            idf (numpy.ndarray): 每個特徵欄位的 IDF 權重，None 表示不使用 IDF
+            terms (numpy.ndarray): 排序後的詞彙陣列（vocabulary 模式）
+            n_features (int): 特徵數量（hashing 模式）
+            source_sha256 (str): 匯出來源 joblib 檔案的 SHA-256，沒有來源檔案時為 None
+            其餘參數與 sklearn 的 TfidfVectorizer 相同
+        """
+        if mode not in (MODE_VOCABULARY, MODE_HASHING):
+            raise ValueError(f"不支援的模式: {mode}")
+        self.mode = mode
+        self.idf = None if idf is None else np.asarray(idf, dtype=np.float32)
+        self.terms = terms
+        self.n_features = len(terms) if mode == MODE_VOCABULARY else int(n_features)
+        self.lowercase = lowercase
+        self.token_pattern = token_pattern
+        self.norm = norm
+        self.sublinear_tf = sublinear_tf
+        self.binary = binary
+        self.source_sha256 = source_sha256
+        self._token_regex = re.compile(token_pattern)
+        self._hasher = None
+        if mode == MODE_HASHING:
+            from sklearn.feature_extraction.text import HashingVectorizer
+            # HashingVectorizer 沒有需要訓練的狀態，依參數直接建立即可
+            self._hasher = HashingVectorizer(n_features=self.n_features, lowercase=lowercase,
+                                             token_pattern=token_pattern, alternate_sign=False,
+                                             norm=None, binary=binary)
+
+    def _term_counts(self, texts):
+        """計算詞頻矩陣（CSR，float64）"""
+        if self.mode == MODE_HASHING:
+            return sparse.csr_matrix(self._hasher.transform(texts), dtype=np.float64)
+
+        # 整批文章的詞彙一次以二分搜尋查詢欄位，再以稀疏矩陣合併重複的詞
+        tokens = []
+        rows = []
+        for row, text in enumerate(texts):
+            if self.lowercase:
+                text = text.lower()
+            doc_tokens = self._token_regex.findall(text)
+            tokens.extend(doc_tokens)
+            rows.extend([row] * len(doc_tokens))
+        shape = (len(texts), self.n_features)
+        if not tokens or not self.n_features:
+            return sparse.csr_matrix(shape, dtype=np.float64)
+        tokens = np.array(tokens)
+        columns = np.minimum(np.searchsorted(self.terms, tokens), self.n_features - 1)
+        found = self.terms[columns] == tokens
+        counts = sparse.csr_matrix(
+            (np.ones(int(found.sum()), dtype=np.float64), (np.asarray(rows)[found], columns[found])),
+            shape=shape
+        )
+        counts.sum_duplicates()
+        if self.binary:
+            counts.data[:] = 1.0
+        return counts
+
+    def transform(self, texts):
+        """
+        將以空白分隔的分詞結果轉換為 TF-IDF 特徵矩陣
+
+        參數:
+            texts (list): 文本列表
+
+        返回:
+            scipy.sparse.csr_matrix: 形狀為 (文章數, 特徵數) 的特徵矩陣
+        """
+        matrix = self._term_counts(list(texts))
+        if self.sublinear_tf:
+            np.log(matrix.data, out=matrix.data)
+            matrix.data += 1.0
+        if self.idf is not None:
+            matrix.data *= self.idf[matrix.indices]
+        if self.norm:
+            # 逐列加總（空白列的範數為 0，不需要正規化）
+            if self.norm == 'l2':
+                norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+            else:
+                norms = np.asarray(abs(matrix).sum(axis=1)).ravel()
+            norms[norms == 0] = 1.0
+            matrix.data /= np.repeat(norms, np.diff(matrix.indptr))
+        return matrix
+
+    def save(self, path):
+        """以不需要 pickle 的 .npz 格式保存"""
+        params = {
+            'format_version': FORMAT_VERSION,
+            'mode': self.mode,
+            'n_features': self.n_features,
+            'lowercase': self.lowercase,
+            'token_pattern': self.token_pattern,
+            'norm': self.norm,
+            'sublinear_tf': self.sublinear_tf,
+            'binary': self.binary,
+            'use_idf': self.idf is not None,
+            'source_sha256': self.source_sha256
+        }
+        arrays = {'params': np.array(json.dumps(params))}
+        if self.idf is not None:
+            arrays['idf'] = self.idf
+        if self.mode == MODE_VOCABULARY:
+            arrays['terms'] = self.terms
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """載入 .npz 檔案（allow_pickle=False，不會執行任何反序列化程式碼）"""
+        with np.load(path, allow_pickle=False) as data:
+            params = json.loads(str(data['params']))
+            if params.get('format_version') != FORMAT_VERSION:
+                raise ValueError(f"不支援的向量化器格式版本: {params.get('format_version')}")
+            idf = data['idf'] if params['use_idf'] else None
+            terms = data['terms'] if params['mode'] == MODE_VOCABULARY else None
+        return cls(params['mode'], idf, terms=terms, n_features=params['n_features'],
+                   lowercase=params['lowercase'], token_pattern=params['token_pattern'], norm=params['norm'],
+                   sublinear_tf=params['sublinear_tf'], binary=params['binary'],
+                   source_sha256=params.get('source_sha256'))
+
+def _check_exportable(vectorizer):
+    """只支援預設的詞彙切分方式（以 token_pattern 切分的單詞）"""
+    unsupported = []
+    if vectorizer.analyzer != 'word':
+        unsupported.append('analyzer')
+    if tuple(vectorizer.ngram_range) != (1, 1):
+        unsupported.append('ngram_range')
+    if vectorizer.tokenizer is not None or vectorizer.preprocessor is not None:
+        unsupported.append('tokenizer/preprocessor')
+    if vectorizer.stop_words is not None:
+        unsupported.append('stop_words')
+    if vectorizer.strip_accents is not None:
+        unsupported.append('strip_accents')
+    if unsupported:
+        raise ValueError(f"無法匯出使用以下參數的向量化器: {', '.join(unsupported)}")
+
+def _idf_weights(vectorizer):
+    """取得 IDF 權重；舊版 sklearn（1.3 以前）將 IDF 存成稀疏對角矩陣 _idf_diag"""
+    try:
+        return np.asarray(vectorizer.idf_)
+    except AttributeError:
+        transformer = getattr(vectorizer, '_tfidf', vectorizer)
+        return np.asarray(transformer._idf_diag.diagonal())
+
+def from_tfidf_vectorizer(vectorizer):
+    """
+    將已訓練的 sklearn TfidfVectorizer 轉換為 CompactVectorizer（vocabulary 模式）
+
+    sklearn 在訓練時已將詞彙依字串排序後編號，欄位順序不變，用原始向量化器訓練的模型可以直接使用
+
+    返回:
+        CompactVectorizer: 精簡的向量化器
+    """
+    _check_exportable(vectorizer)
+    terms = np.empty(len(vectorizer.vocabulary_), dtype=object)
+    for term, column in vectorizer.vocabulary_.items():
+        terms[column] = term
+    terms = terms.astype(str)
+    if len(terms) > 1 and not np.all(terms[:-1] < terms[1:]):
+        raise ValueError("向量化器的詞彙編號沒有依字串排序，無法以排序陣列保存")
+    idf = _idf_weights(vectorizer) if vectorizer.use_idf else None
+    return CompactVectorizer(MODE_VOCABULARY, idf, terms=terms, lowercase=vectorizer.lowercase,
+                             token_pattern=vectorizer.token_pattern or DEFAULT_TOKEN_PATTERN,
+                             norm=vectorizer.norm, sublinear_tf=vectorizer.sublinear_tf, binary=vectorizer.binary)
+
+def from_hashing(n_features, transformer, lowercase=True, token_pattern=DEFAULT_TOKEN_PATTERN, binary=False):
+    """
+    以 HashingVectorizer 的參數與已訓練的 TfidfTransformer 建立 hashing 模式的 CompactVectorizer
+
+    參數:
+        n_features (int): 雜湊欄位數量
+        transformer: 以雜湊詞頻訓練的 sklearn TfidfTransformer
+    """
+    idf = _idf_weights(transformer) if transformer.use_idf else None
+    return CompactVectorizer(MODE_HASHING, idf, n_features=n_features, lowercase=lowercase,
+                             token_pattern=token_pattern, norm=transformer.norm,
+                             sublinear_tf=transformer.sublinear_tf, binary=binary)
+
+# 匯出後比對用的範例：包含空白文章、只有詞彙表外詞彙的文章，且放在批次的開頭、中間與結尾
+CHECK_TEXTS = ['', '分手 男友', 'xyz', '心情 不好 今天 心情', 'hello world ok', '', 'xyz abc']
+
+def file_sha256(path):
+    """計算檔案內容的 SHA-256（以內容比對，git checkout 或複製檔案改變修改時間也不受影響）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def select_vectorizer_path(model_dir):
+    """
+    選擇模型目錄中要載入的向量化器檔案
+
+    優先使用精簡的 .npz 檔案；同一目錄也有 joblib 檔案時，只有 .npz 記錄的來源雜湊與 joblib 檔案相同才使用，
+    否則（joblib 檔案在匯出後重新訓練，或 .npz 沒有記錄來源）改為載入 joblib 檔案
+
+    返回:
+        str: 向量化器檔案路徑
+    """
+    compact_path = os.path.join(model_dir, COMPACT_FILENAME)
+    source_path = os.path.join(model_dir, SOURCE_FILENAME)
+    if not os.path.exists(compact_path):
+        return source_path
+    if not os.path.exists(source_path):
+        return compact_path
+    with np.load(compact_path, allow_pickle=False) as data:
+        recorded = json.loads(str(data['params'])).get('source_sha256')
+    if recorded == file_sha256(source_path):
+        return compact_path
+    logger.warning(f"{compact_path} 不是由目前的 {source_path} 匯出，改為載入 joblib 檔案；"
+                   f"請重新執行 compact_vectorizer.py 匯出")
+    return source_path
+
+def check_equivalence(compact, vectorizer, texts=CHECK_TEXTS, atol=1e-6):
+    """
+    確認 CompactVectorizer 與原本的 TfidfVectorizer 對同一批文本的輸出相同
+
+    例外:
+        ValueError: 形狀不同或差異超過 atol
+    """
+    texts = list(texts)
+    expected = vectorizer.transform(texts)
+    actual = compact.transform(texts)
+    if expected.shape != actual.shape:
+        raise ValueError(f"特徵矩陣形狀不同: {actual.shape}，應為 {expected.shape}")
+    difference = abs(expected - actual).max()
+    if difference > atol:
+        raise ValueError(f"精簡向量化器的輸出與原本的向量化器不同（最大差異 {difference:.2e}）")
+
+def main():
+    parser = argparse.ArgumentParser(description='將 TfidfVectorizer 的 joblib 檔案匯出為精簡的 .npz 格式')
+    parser.add_argument('source', help='TfidfVectorizer 的 joblib 檔案')
+    parser.add_argument('target', help='輸出的 .npz 檔案')
+    args = parser.parse_args()
+
+    import joblib
+    vectorizer = joblib.load(args.source)
+    compact = from_tfidf_vectorizer(vectorizer)
+    compact.source_sha256 = file_sha256(args.source)
+    # 以範例文本（加上部分詞彙）確認輸出與原本的向量化器相同
+    check_equivalence(compact, vectorizer, CHECK_TEXTS + [' '.join(compact.terms[::max(1, compact.n_features // 50)])])
+    compact.save(args.target)
+    print(f"已匯出 {compact.n_features} 個詞彙至 {args.target}")
+
+if __name__ == '__main__':
+    main()
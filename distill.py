@@ -0,0 +1,227 @@
+"""
+模型蒸餾模組
+以投票分類器的預測機率（soft label）訓練一個線性模型，推論時只需要一次稀疏矩陣乘法加上 softmax，
+可以在低延遲的部署中取代整個投票分類器（SERVING_MODE=fast）
+
+使用方式:
+    # 以投票分類器為老師，蒸餾出 distilled_model.npz
+    python distill.py train --model-dir Dcard-posts-classification-main
+    # 在 raw_data/測試.csv 上比較 ensemble 與 fast 模式的準確率與延遲
+    python distill.py report --model-dir Dcard-posts-classification-main --output report.json
+"""
+import argparse
+import json
+import logging
+import os
+import time
+import numpy as np
+from scipy import sparse
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DISTILLED_FILENAME = 'distilled_model.npz'
+FORMAT_VERSION = 1
+
+class LinearModel:
+    """
+    蒸餾後的線性分類模型，以純 NumPy 計算 softmax(X · W + b)
+
+    提供與 sklearn 分類器相同的 classes_ 與 predict_proba，可以直接交給 InferenceEngine 使用
+    """
+
+    def __init__(self, coef, intercept, classes):
+        """
+        參數:
+            coef (numpy.ndarray): 形狀為 (類別數, 特徵數) 的權重；二元分類時可以是 (1, 特徵數)
+            intercept (numpy.ndarray): 每個類別的偏差值
+            classes (list): 類別標籤
+        """
+        coef = np.asarray(coef, dtype=np.float32)
+        intercept = np.asarray(intercept, dtype=np.float32).ravel()
+        if coef.shape[0] == 1 and len(classes) == 2:
+            # 二元邏輯迴歸的 sigmoid 等同於 [0, w·x + b] 的 softmax
+            coef = np.vstack([np.zeros_like(coef), coef])
+            intercept = np.array([0.0, intercept[0]], dtype=np.float32)
+        self.coef = coef
+        self.intercept = intercept
+        self.classes_ = np.asarray(classes)
+        self.n_features_in_ = coef.shape[1]
+        # 預先轉置為 (特徵數, 類別數)，CSR 矩陣乘法直接得到 (文章數, 類別數)
+        self._weights = np.ascontiguousarray(coef.T)
+
+    def decision_function(self, features):
+        """計算各類別的分數"""
+        scores = features @ self._weights
+        return np.asarray(scores) + self.intercept
+
+    def predict_proba(self, features):
+        """以 softmax 將分數轉換為機率"""
+        scores = self.decision_function(features).astype(np.float64)
+        scores -= scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        scores /= scores.sum(axis=1, keepdims=True)
+        return scores
+
+    def predict(self, features):
+        return self.classes_[np.argmax(self.decision_function(features), axis=1)]
+
+    def save(self, path):
+        """以不需要 pickle 的 .npz 格式保存"""
+        params = {'format_version': FORMAT_VERSION, 'classes': [str(c) for c in self.classes_]}
+        with open(path, 'wb') as f:
+            np.savez(f, coef=self.coef, intercept=self.intercept, params=np.array(json.dumps(params)))
+
+    @classmethod
+    def load(cls, path):
+        """載入 .npz 檔案（allow_pickle=False）"""
+        with np.load(path, allow_pickle=False) as data:
+            params = json.loads(str(data['params']))
+            if params.get('format_version') != FORMAT_VERSION:
+                raise ValueError(f"不支援的模型格式版本: {params.get('format_version')}")
+            return cls(data['coef'], data['intercept'], params['classes'])
+
+def distill(teacher, features, C=10.0, max_iter=1000):
+    """
+    以老師模型的預測機率訓練線性模型
+
+    每篇文章對每個類別各複製一列，以老師給該類別的機率作為樣本權重，
+    多元邏輯迴歸的損失即等於與 soft label 的交叉熵
+
+    參數:
+        teacher (InferenceEngine): 老師模型的推論引擎
+        features (scipy.sparse.csr_matrix): 訓練文章的特徵（不需要看板標籤）
+        C (float): 正則化強度的倒數，越大越貼近老師
+
+    返回:
+        LinearModel: 蒸餾後的模型，類別與老師的看板標籤相同
+    """
+    from sklearn.linear_model import LogisticRegression
+
+    soft_labels = teacher.predict_proba(features)
+    n_docs, n_classes = soft_labels.shape
+    stacked = sparse.vstack([features] * n_classes, format='csr')
+    targets = np.repeat(np.arange(n_classes), n_docs)
+    weights = soft_labels.T.ravel()
+    keep = weights > 0
+    student = LogisticRegression(C=C, max_iter=max_iter)
+    student.fit(stacked[keep], targets[keep], sample_weight=weights[keep])
+
+    coef = np.zeros((n_classes, features.shape[1]), dtype=np.float32)
+    intercept = np.zeros(n_classes, dtype=np.float32)
+    student_coef, student_intercept = student.coef_, student.intercept_
+    if len(student.classes_) == 2 and student_coef.shape[0] == 1:
+        student_coef = np.vstack([np.zeros_like(student_coef), student_coef])
+        student_intercept = np.array([0.0, student_intercept[0]])
+    # 老師給某類別的機率全為 0 時，學生不會學到該類別，保留為 0 權重
+    coef[student.classes_] = student_coef
+    intercept[student.classes_] = student_intercept
+    if len(student.classes_) < n_classes:
+        intercept[np.setdiff1d(np.arange(n_classes), student.classes_)] = -1e4
+    return LinearModel(coef, intercept, teacher.classes)
+
+def _load_teacher(model_dir, labels):
+    from inference import InferenceEngine
+    from compact_vectorizer import select_vectorizer_path
+    return InferenceEngine.load(os.path.join(model_dir, 'voting_classifier_model.joblib'),
+                                select_vectorizer_path(model_dir), labels)
+
+def _load_documents(paths, workers):
+    from train_model import load_corpus
+    return load_corpus(paths, workers or os.cpu_count() or 1, 2000)
+
+def train_command(args):
+    teacher = _load_teacher(args.model_dir, args.labels)
+    documents, _ = _load_documents(args.inputs, args.workers)
+    started = time.perf_counter()
+    student = distill(teacher, teacher.transform(documents), C=args.C)
+    output = args.output or os.path.join(args.model_dir, DISTILLED_FILENAME)
+    student.save(output)
+    logger.info(f"已蒸餾 {len(documents)} 篇文章，耗時 {time.perf_counter() - started:.1f} 秒，已寫入 {output}")
+
+def _latency(engine, documents, repeat):
+    """單篇文章推論的延遲（毫秒）與整批推論的吞吐量（篇/秒）"""
+    samples = []
+    for _ in range(repeat):
+        for document in documents:
+            started = time.perf_counter()
+            engine.predict([document])
+            samples.append((time.perf_counter() - started) * 1000)
+    started = time.perf_counter()
+    engine.predict(documents)
+    batch_seconds = time.perf_counter() - started
+    samples = np.array(samples)
+    return {
+        'p50_ms': round(float(np.percentile(samples, 50)), 3),
+        'p95_ms': round(float(np.percentile(samples, 95)), 3),
+        'p99_ms': round(float(np.percentile(samples, 99)), 3),
+        'mean_ms': round(float(samples.mean()), 3),
+        'batch_docs_per_sec': round(len(documents) / batch_seconds, 1)
+    }
+
+def report_command(args):
+    from sklearn.metrics import accuracy_score, classification_report
+    from inference import InferenceEngine
+
+    teacher = _load_teacher(args.model_dir, args.labels)
+    student_path = args.student or os.path.join(args.model_dir, DISTILLED_FILENAME)
+    fast = InferenceEngine(LinearModel.load(student_path), teacher.vectorizer, args.labels)
+    documents, labels = _load_documents(args.inputs, args.workers)
+
+    result = {'test_documents': len(documents), 'modes': {}}
+    predictions = {}
+    for mode, engine in (('ensemble', teacher), ('fast', fast)):
+        predicted = [label for label, _ in engine.predict(documents)]
+        predictions[mode] = predicted
+        result['modes'][mode] = {
+            'accuracy': round(accuracy_score(labels, predicted), 4),
+            'macro_f1': round(classification_report(labels, predicted, output_dict=True,
+                                                    zero_division=0)['macro avg']['f1-score'], 4),
+            'latency': _latency(engine, documents[:args.latency_docs], args.repeat)
+        }
+    result['agreement'] = round(float(np.mean(np.array(predictions['ensemble']) == np.array(predictions['fast']))), 4)
+
+    for mode, values in result['modes'].items():
+        latency = values['latency']
+        print(f"{mode:<9} 準確率 {values['accuracy']:.4f}  macro F1 {values['macro_f1']:.4f}  "
+              f"p50 {latency['p50_ms']:.2f} ms  p95 {latency['p95_ms']:.2f} ms  "
+              f"批次 {latency['batch_docs_per_sec']:.0f} 篇/秒")
+    print(f"兩種模式預測一致的比例: {result['agreement']:.4f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return result
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='蒸餾投票分類器並比較 ensemble 與 fast 模式')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = subparsers.add_parser('train', help='以投票分類器的預測機率訓練線性模型')
+    train_parser.add_argument('inputs', nargs='*', default=[os.path.join(BASE_DIR, 'raw_data', 'merge_from_ofoct.csv')],
+                              help='訓練文章的 CSV 檔案（不需要看板標籤正確，只使用文章內容）')
+    train_parser.add_argument('--C', type=float, default=10.0, help='正則化強度的倒數')
+    train_parser.add_argument('--output', default=None, help='輸出路徑，預設為模型目錄下的 distilled_model.npz')
+    train_parser.set_defaults(handler=train_command)
+
+    report_parser = subparsers.add_parser('report', help='在測試資料上比較準確率與延遲')
+    report_parser.add_argument('inputs', nargs='*', default=[os.path.join(BASE_DIR, 'raw_data', '測試.csv')],
+                               help='測試文章的 CSV 檔案')
+    report_parser.add_argument('--student', default=None, help='蒸餾模型路徑，預設為模型目錄下的 distilled_model.npz')
+    report_parser.add_argument('--latency-docs', type=int, default=200, help='測量單篇延遲使用的文章數量')
+    report_parser.add_argument('--repeat', type=int, default=3, help='測量延遲的重複次數')
+    report_parser.add_argument('--output', default=None, help='將報告寫入 JSON 檔案')
+    report_parser.set_defaults(handler=report_command)
+
+    for sub in (train_parser, report_parser):
+        sub.add_argument('--model-dir', default=os.path.join(BASE_DIR, 'Dcard-posts-classification-main'),
+                         help='投票分類器與向量化器所在目錄')
+        sub.add_argument('--labels', nargs='+', default=['mood', 'relationship', 'talk'], help='看板標籤')
+        sub.add_argument('--workers', type=int, default=None, help='斷詞的 worker 程序數量')
+
+    args = parser.parse_args()
+    args.handler(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+本地 Gemini API 模擬伺服器
+回應與 generateContent 相同格式的標題，可以設定延遲、錯誤率與 429 回應比例，
+搭配 GEMINI_API_BASE 在不消耗額度的情況下測試標題生成的負載表現
+
+使用方式:
+    python fake_gemini.py --port 8081 --latency-ms 800 --jitter-ms 200 --error-rate 0.02 --rate-limit-rate 0.05
+    GEMINI_API_KEY=fake GEMINI_API_BASE=http://127.0.0.1:8081 python app.py
+"""
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+ENDPOINT_PATTERN = re.compile(r'^/v1beta/models/[^/:]+:generateContent$')
+
+TITLES = [
+    "最近心情好複雜，想找人聊聊",
+    "交往兩年，他突然變得好冷淡",
+    "大家都怎麼度過低潮期？",
+    "和朋友吵架後該主動道歉嗎",
+    "一個人的週末其實也不錯",
+    "有沒有推薦的紓壓方法？"
+]
+
+class FakeGeminiConfig:
+    """模擬伺服器的行為設定，執行中可以直接修改屬性"""
+
+    def __init__(self, latency_ms=500.0, jitter_ms=0.0, error_rate=0.0, rate_limit_rate=0.0, retry_after=1.0,
+                 seed=None):
+        """
+        參數:
+            latency_ms (float): 平均回應延遲（毫秒）
+            jitter_ms (float): 延遲的隨機變動範圍（±毫秒）
+            error_rate (float): 回應 500 的比例
+            rate_limit_rate (float): 回應 429 的比例
+            retry_after (float): 429 回應的 Retry-After 秒數
+            seed (int): 亂數種子，固定後每次執行的錯誤序列相同
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {'200': 0, '429': 0, '500': 0}
+
+    def draw(self):
+        """決定下一個回應的狀態碼與延遲秒數"""
+        with self.lock:
+            roll = self.random.random()
+            delay = max(0.0, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+        if roll < self.rate_limit_rate:
+            # 429 通常在配額檢查時立即返回，不需要等待生成
+            return 429, 0.0
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500, delay
+        return 200, delay
+
+    def record(self, status):
+        with self.lock:
+            self.counts[str(status)] += 1
+
+def make_handler(config):
+    class FakeGeminiHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            self.rfile.read(length)
+            if not ENDPOINT_PATTERN.match(self.path.split('?')[0]):
+                self._send(404, {'error': {'code': 404, 'message': 'Not found'}})
+                return
+            if not self.headers.get('x-goog-api-key'):
+                self._send(403, {'error': {'code': 403, 'message': 'API key missing'}})
+                return
+
+            status, delay = config.draw()
+            if delay:
+                time.sleep(delay)
+            config.record(status)
+            if status == 429:
+                self._send(429, {'error': {'code': 429, 'message': 'Resource has been exhausted'}},
+                           {'Retry-After': f"{config.retry_after:g}"})
+            elif status == 500:
+                self._send(500, {'error': {'code': 500, 'message': 'Internal error'}})
+            else:
+                titles = config.random.sample(TITLES, 3)
+                text = '\n'.join(f"{i}. {title}" for i, title in enumerate(titles, 1))
+                self._send(200, {'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}}]})
+
+        def _send(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # 每個請求的存取日誌會影響負載測試的結果，只在 DEBUG 等級輸出
+            logger.debug(format, *args)
+
+    return FakeGeminiHandler
+
+def start_server(config, host='127.0.0.1', port=0):
+    """
+    在背景執行緒啟動模擬伺服器
+
+    參數:
+        config (FakeGeminiConfig): 行為設定
+        port (int): 連接埠，0 表示自動選擇
+
+    返回:
+        ThreadingHTTPServer: 伺服器，server.server_address 為實際位址，結束時呼叫 shutdown()
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-gemini', daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='本地 Gemini API 模擬伺服器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=500.0, help='平均回應延遲（毫秒）')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='延遲的隨機變動範圍（±毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='回應 500 的比例')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='回應 429 的比例')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='429 回應的 Retry-After 秒數')
+    parser.add_argument('--seed', type=int, default=None, help='亂數種子')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    config = FakeGeminiConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate,
+                              args.retry_after, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config))
+    server.daemon_threads = True
+    logger.info(f"模擬 Gemini API 已啟動: http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info(f"回應統計: {config.counts}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,393 @@
+"""
+Gemini API 用戶端
+使用連線池重複利用連線，並提供逾時、指數退避重試與斷路器；
+AsyncGeminiClient 以 asyncio 執行相同的流程，供 ASGI 服務使用（需要安裝 httpx 套件）
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+# 導入效能指標模組
+from metrics import increment
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_BASE = "https://generativelanguage.googleapis.com"
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+# 可以重試的 HTTP 狀態碼
+RETRYABLE_STATUS = frozenset((429, 500, 502, 503, 504))
+
+class GeminiError(Exception):
+    """Gemini API 呼叫失敗"""
+
+class CircuitOpenError(GeminiError):
+    """斷路器開啟中，暫停呼叫 Gemini API"""
+
+class CircuitBreaker:
+    """
+    連續失敗達到門檻後開啟斷路器，冷卻時間過後允許一次試探請求（半開狀態），
+    試探成功即關閉斷路器，失敗則重新開啟
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """
+        參數:
+            failure_threshold (int): 開啟斷路器的連續失敗次數
+            reset_timeout (float): 斷路器開啟後的冷卻秒數
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """目前狀態：'closed'、'open' 或 'half_open'"""
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half_open'
+            return 'open'
+
+    def allow(self):
+        """是否允許發送請求；半開狀態下只允許一個試探請求"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("Gemini API 連續失敗，開啟斷路器")
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release_probe(self):
+        """結束試探請求但不記錄結果（例如呼叫被取消或發生非預期的例外），之後允許新的試探請求"""
+        with self._lock:
+            self._probing = False
+
+def parse_retry_after(value):
+    """解析 Retry-After 標頭（秒數或 HTTP 日期），無法解析時返回 None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class GeminiCall:
+    """
+    一次 generateContent 呼叫的期限、重試、Retry-After 與斷路器狀態
+
+    同步與非同步用戶端共用此流程，只各自負責發送請求與等待：
+
+        call = client.start_call(deadline)
+        try:
+            while (remaining := call.next_attempt()) is not None:
+                try:
+                    response = 發送請求（逾時使用 call.timeouts(remaining)）
+                except 連線錯誤 as e:
+                    call.connection_failed(e)
+                else:
+                    text = call.handle_response(response)
+                    if text is not None:
+                        return text
+                delay = call.retry_delay()
+                if delay is None:
+                    break
+                等待 delay 秒
+            call.fail()
+        finally:
+            call.release()
+    """
+
+    def __init__(self, client, deadline=None):
+        self.client = client
+        self.give_up_at = time.monotonic() + (deadline or client.deadline)
+        self.attempt = -1
+        self.retry_after = None
+        self.last_error = None
+        self.retryable = True
+        # 是否已向斷路器記錄成功或失敗
+        self.recorded = False
+
+    def next_attempt(self):
+        """開始下一次嘗試，返回剩餘秒數；超過期限時返回 None"""
+        remaining = self.give_up_at - time.monotonic()
+        if remaining <= 0:
+            return None
+        self.attempt += 1
+        self.retry_after = None
+        return remaining
+
+    def timeouts(self, remaining):
+        """單次請求的 (連線逾時, 讀取逾時)，不超過剩餘時間"""
+        return min(self.client.connect_timeout, remaining), min(self.client.read_timeout, remaining)
+
+    def handle_response(self, response):
+        """
+        處理回應（requests 與 httpx 的回應物件介面相同）
+
+        返回:
+            str: 成功時為回應的文字，需要重試或放棄時返回 None
+        """
+        increment('gemini_requests_total', status=response.status_code)
+        if response.status_code == 200:
+            text = parse_response(response)
+            if text is not None:
+                self.client.breaker.record_success()
+                self.recorded = True
+                increment('gemini_calls_total', outcome='success')
+                return text
+            self.last_error = GeminiError("Gemini API 回應格式無法解析")
+            return None
+        self.last_error = GeminiError(f"Gemini API 回應狀態碼: {response.status_code}")
+        if response.status_code not in RETRYABLE_STATUS:
+            logger.warning(f"回應內容: {response.text[:200]}")
+            self.retryable = False
+        elif response.status_code == 429:
+            self.retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        return None
+
+    def connection_failed(self, error):
+        increment('gemini_requests_total', status='connection_error')
+        self.last_error = GeminiError(f"Gemini API 連線失敗: {str(error) or type(error).__name__}")
+
+    def retry_delay(self):
+        """
+        本次嘗試失敗後的等待秒數（429 遵守 Retry-After，否則為帶隨機抖動的指數退避）
+
+        返回:
+            float: 不再重試（已達最大嘗試次數、不可重試或等待後會超過期限）時返回 None
+        """
+        if not self.retryable:
+            return None
+        logger.warning(f"{self.last_error}（第 {self.attempt + 1} 次嘗試）")
+        if self.attempt + 1 >= self.client.max_retries:
+            return None
+        delay = self.retry_after if self.retry_after is not None else self.client.backoff(self.attempt)
+        if time.monotonic() + delay >= self.give_up_at:
+            return None
+        increment('gemini_retries_total')
+        return delay
+
+    def fail(self):
+        """記錄失敗並拋出最後一次的錯誤"""
+        self.client.breaker.record_failure()
+        self.recorded = True
+        increment('gemini_calls_total', outcome='failure')
+        raise self.last_error or GeminiError("超過 Gemini API 呼叫期限")
+
+    def release(self):
+        """呼叫結束時執行（放在 finally）：沒有記錄成功或失敗就結束時釋放斷路器的試探名額，避免斷路器一直無法試探"""
+        if not self.recorded:
+            self.client.breaker.release_probe()
+
+def parse_response(response):
+    """取出第一個候選結果的文字，格式不符時返回 None"""
+    try:
+        response_data = response.json()
+    except ValueError:
+        return None
+    candidates = response_data.get('candidates') or []
+    if candidates:
+        parts = candidates[0].get('content', {}).get('parts') or []
+        if parts and 'text' in parts[0]:
+            return parts[0]['text'].strip()
+    return None
+
+class BaseGeminiClient:
+    """GeminiClient 與 AsyncGeminiClient 共用的設定、請求內容與重試流程"""
+
+    def __init__(self, api_key, api_base=DEFAULT_API_BASE, model=DEFAULT_MODEL, pool_size=8,
+                 connect_timeout=3.0, read_timeout=10.0, deadline=15.0, max_retries=3,
+                 backoff_base=0.5, backoff_max=8.0, breaker=None):
+        """
+        參數:
+            api_key (str): Gemini API 密鑰
+            api_base (str): API 位址，測試時可以指向本地的模擬伺服器
+            model (str): 模型名稱
+            pool_size (int): 連線池大小
+            connect_timeout (float): 建立連線的逾時秒數
+            read_timeout (float): 單次請求讀取回應的逾時秒數
+            deadline (float): 一次呼叫（包含重試）的總時間上限
+            max_retries (int): 最大嘗試次數
+            backoff_base (float): 指數退避的基準秒數
+            backoff_max (float): 單次退避的最長秒數
+            breaker (CircuitBreaker): 斷路器，未提供時使用預設設定
+        """
+        self.api_key = api_key
+        self.endpoint = f"{api_base.rstrip('/')}/v1beta/models/{model}:generateContent"
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+    def backoff(self, attempt):
+        """第 attempt 次失敗後的等待秒數（full jitter）"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    @staticmethod
+    def request_data(prompt):
+        return {"contents": [{"parts": [{"text": prompt}]}]}
+
+    def headers(self):
+        return {"Content-Type": "application/json", "x-goog-api-key": self.api_key}
+
+    def start_call(self, deadline=None):
+        """
+        開始一次呼叫
+
+        例外:
+            CircuitOpenError: 斷路器開啟中
+        """
+        if not self.breaker.allow():
+            increment('gemini_calls_total', outcome='circuit_open')
+            raise CircuitOpenError("Gemini API 暫時停用")
+        return GeminiCall(self, deadline)
+
+class GeminiClient(BaseGeminiClient):
+    """
+    Gemini generateContent API 的用戶端
+
+    - 以 requests.Session 和連線池重複利用 HTTPS 連線
+    - 每次呼叫都有整體期限（deadline），單次請求的讀取逾時不會超過剩餘時間
+    - 失敗時以帶隨機抖動的指數退避重試，429 回應會遵守 Retry-After
+    - 連續失敗時由斷路器暫停呼叫，呼叫端可以改用本地功能
+    - submit() 在執行緒池中執行，呼叫端可以同時處理其他工作
+    """
+
+    def __init__(self, api_key, **settings):
+        """參數同 BaseGeminiClient，pool_size 同時也是執行緒池的大小"""
+        super().__init__(api_key, **settings)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='gemini')
+
+    def generate_content(self, prompt, deadline=None):
+        """
+        呼叫 generateContent 並返回第一個候選結果的文字
+
+        參數:
+            prompt (str): 提示詞
+            deadline (float): 本次呼叫的總時間上限，未提供時使用預設值
+
+        返回:
+            str: 模型回應的文字
+
+        例外:
+            CircuitOpenError: 斷路器開啟中
+            GeminiError: 重試後仍然失敗或超過期限
+        """
+        call = self.start_call(deadline)
+        request_data = self.request_data(prompt)
+        headers = self.headers()
+        try:
+            while (remaining := call.next_attempt()) is not None:
+                try:
+                    response = self.session.post(self.endpoint, headers=headers, json=request_data,
+                                                 timeout=call.timeouts(remaining))
+                except requests.RequestException as e:
+                    call.connection_failed(e)
+                else:
+                    text = call.handle_response(response)
+                    if text is not None:
+                        return text
+                delay = call.retry_delay()
+                if delay is None:
+                    break
+                time.sleep(delay)
+            call.fail()
+        finally:
+            call.release()
+
+    def submit(self, fn, *args, **kwargs):
+        """在用戶端的執行緒池中執行函數，返回 Future"""
+        return self.executor.submit(fn, *args, **kwargs)
+
+class AsyncGeminiClient(BaseGeminiClient):
+    """
+    以 asyncio 呼叫 Gemini API 的用戶端，逾時、重試、Retry-After 與斷路器的流程與 GeminiClient 相同（GeminiCall）
+
+    等待 API 回應時不佔用執行緒，同時進行中的呼叫數量只受連線池大小（pool_size）限制，
+    超過時在連線池中排隊，排隊時間也計入呼叫期限
+    """
+
+    def __init__(self, api_key, **settings):
+        """參數同 BaseGeminiClient"""
+        import httpx  # 選用套件，只有 ASGI 服務才需要
+
+        super().__init__(api_key, **settings)
+        # httpx 以 INFO 等級記錄每個請求，只保留警告
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+        self.httpx = httpx
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+        )
+
+    async def generate_content(self, prompt, deadline=None):
+        """
+        呼叫 generateContent 並返回第一個候選結果的文字（協程）
+
+        參數與例外同 GeminiClient.generate_content
+        """
+        call = self.start_call(deadline)
+        request_data = self.request_data(prompt)
+        headers = self.headers()
+        try:
+            while (remaining := call.next_attempt()) is not None:
+                connect_timeout, read_timeout = call.timeouts(remaining)
+                timeout = self.httpx.Timeout(connect=connect_timeout, read=read_timeout, write=remaining,
+                                             pool=remaining)
+                try:
+                    response = await self.client.post(self.endpoint, headers=headers, json=request_data,
+                                                      timeout=timeout)
+                except self.httpx.HTTPError as e:
+                    call.connection_failed(e)
+                else:
+                    text = call.handle_response(response)
+                    if text is not None:
+                        return text
+                delay = call.retry_delay()
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+            call.fail()
+        finally:
+            call.release()
+
+    async def aclose(self):
+        await self.client.aclose()
@@ -0,0 +1,47 @@
+"""
+gunicorn 正式環境設定
+
+使用方式:
+    gunicorn -c gunicorn.conf.py app:app
+    # ASGI 服務模式（需要安裝 uvicorn 與 httpx）
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app
+
+master 程序先載入 app（模型、TF-IDF 向量化器、jieba 詞典、IDF 詞頻表並完成暖機），再 fork 出 worker，
+worker 以 copy-on-write 共用這些唯讀的分頁，記憶體不再隨 worker 數量線性增長。
+fork 之前執行 gc.freeze()，將已載入的物件移出垃圾回收的追蹤範圍，
+避免 worker 的垃圾回收寫入物件標頭而讓共用分頁被複製。
+"""
+import gc
+import logging
+import os
+from memory_report import process_memory
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+# ASGI 服務模式使用 uvicorn.workers.UvicornWorker，threads 不適用，改以 ASGI_WORKERS 設定執行緒池大小
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+pidfile = os.getenv('GUNICORN_PIDFILE') or None
+
+# 在 master 載入 app，worker 共用載入後的記憶體
+preload_app = True
+
+logger = logging.getLogger('gunicorn.error')
+
+def _format_memory(memory):
+    if memory is None:
+        return '無法取得'
+    mb = 1024 * 1024
+    return (f"RSS {memory['rss'] / mb:.1f} MB（共用 {memory['shared'] / mb:.1f} MB，"
+            f"私有 {memory['private'] / mb:.1f} MB）")
+
+def when_ready(server):
+    """app 已在 master 載入完成、開始 fork worker 之前執行"""
+    # 先回收載入過程產生的垃圾，再凍結剩下的物件，worker 的垃圾回收不會再掃描（寫入）它們
+    gc.collect()
+    gc.freeze()
+    logger.info(f"已凍結 {gc.get_freeze_count()} 個物件，master {_format_memory(process_memory())}")
+
+def post_worker_init(worker):
+    logger.info(f"worker {worker.pid} 已啟動，{_format_memory(process_memory())}")
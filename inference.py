@@ -0,0 +1,169 @@
+"""
+模型推論模組
+以稀疏特徵執行投票分類器推論，每批文章只跑一次 predict_proba
+"""
+import hashlib
+import logging
+import os
+import joblib
+import numpy as np
+from scipy import sparse
+# 導入不需要 pickle 的精簡向量化器
+from compact_vectorizer import CompactVectorizer
+# 導入效能指標模組
+from metrics import span
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+def file_version(*paths):
+    """以檔案大小與修改時間計算模型版本字串"""
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns};".encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+class InferenceEngine:
+    """
+    投票分類器的推論引擎
+
+    - 特徵保持 CSR 稀疏格式，只有不支援稀疏輸入的模型（例如以密集矩陣訓練的 SVM）才會轉成密集矩陣
+    - 軟投票直接對各子模型的 predict_proba 加權平均，類別取機率最高者，不再重複呼叫 predict
+    - 模型的 classes_ 在啟動時就解碼為看板標籤，請求時不需再做轉換
+    """
+
+    def __init__(self, model, vectorizer, labels, version=''):
+        """
+        參數:
+            model: 已訓練的分類器（通常是 soft voting 的 VotingClassifier）
+            vectorizer: 已訓練的 TF-IDF 向量化器
+            labels (list): 所有有效的類別標籤，例如 ['mood', 'relationship', 'talk']
+            version (str): 模型版本，用於區分不同模型的快取結果
+        """
+        self.model = model
+        self.vectorizer = vectorizer
+        self.labels = list(labels)
+        self.version = version
+
+        # 解析需要參與投票的子模型與權重
+        self._estimators, self._weights = self._resolve_estimators(model)
+
+        # 啟動時就將模型類別解碼為標籤，並記錄每個標籤對應的機率欄位
+        self.classes = [self._decode_class(c) for c in model.classes_]
+        self._label_columns = {}
+        for column, label in enumerate(self.classes):
+            self._label_columns.setdefault(label, column)
+
+        # 探測每個子模型是否接受稀疏輸入
+        self._dense_only = [self._requires_dense(estimator) for estimator in self._estimators]
+        dense_names = [type(est).__name__ for est, dense in zip(self._estimators, self._dense_only) if dense]
+        if dense_names:
+            logger.info(f"以下模型需要密集特徵: {', '.join(dense_names)}")
+
+    @classmethod
+    def load(cls, model_path, vectorizer_path, labels, mmap_mode='c'):
+        """
+        從 joblib 檔案載入模型和向量化器
+
+        未壓縮的 joblib 檔案中的 numpy 陣列會以記憶體映射載入，只在實際使用時才讀入分頁；
+        使用 'c'（copy-on-write）而不是唯讀映射，因為 libsvm 需要可寫入的緩衝區。
+        壓縮過的檔案無法映射，會照常完整載入。向量化器為 .npz 檔案時以 CompactVectorizer 載入，
+        模型為 .npz 檔案時以蒸餾後的 LinearModel 載入，兩者都不經過 pickle
+        """
+        if model_path.endswith('.npz'):
+            # 蒸餾後的線性模型（distill.py），同樣不經過 pickle
+            from distill import LinearModel
+            model = LinearModel.load(model_path)
+        else:
+            model = joblib.load(model_path, mmap_mode=mmap_mode)
+        if vectorizer_path.endswith('.npz'):
+            vectorizer = CompactVectorizer.load(vectorizer_path)
+        else:
+            vectorizer = joblib.load(vectorizer_path, mmap_mode=mmap_mode)
+        return cls(model, vectorizer, labels, version=file_version(model_path, vectorizer_path))
+
+    @staticmethod
+    def _resolve_estimators(model):
+        """取得軟投票的子模型與對應權重；非軟投票模型則直接使用模型本身"""
+        if getattr(model, 'voting', None) == 'soft' and hasattr(model, 'estimators_'):
+            estimators = list(model.estimators_)
+            weights = getattr(model, '_weights_not_none', None)
+            if weights is None and model.weights is not None:
+                # 被設為 'drop' 的模型不在 estimators_ 中，權重也要一併排除
+                weights = [w for (_, est), w in zip(model.estimators, model.weights) if est != 'drop']
+            return estimators, weights
+        return [model], None
+
+    def _decode_class(self, value):
+        """將模型輸出的類別轉換為有效的字串標籤"""
+        if isinstance(value, (int, float, np.integer, np.floating)):
+            if 0 <= int(value) < len(self.labels):
+                return self.labels[int(value)]
+        elif str(value) in self.labels:
+            return str(value)
+        # 無法辨識的類別使用第一個標籤
+        logger.warning(f"模型類別 '{value}' 不在有效類別列表中，使用默認類別")
+        return self.labels[0]
+
+    def _requires_dense(self, estimator):
+        """以一列空白特徵測試模型是否能直接使用稀疏矩陣"""
+        n_features = getattr(self.vectorizer, 'n_features', None)
+        if hasattr(self.vectorizer, 'vocabulary_'):
+            n_features = len(self.vectorizer.vocabulary_)
+        n_features = getattr(estimator, 'n_features_in_', n_features)
+        if n_features is None:
+            return True
+        try:
+            estimator.predict_proba(sparse.csr_matrix((1, n_features)))
+            return False
+        except (ValueError, TypeError):
+            return True
+
+    def transform(self, processed_texts):
+        """將已分詞的文本轉換為 CSR 稀疏特徵矩陣"""
+        return sparse.csr_matrix(self.vectorizer.transform(processed_texts))
+
+    def predict_proba(self, features):
+        """
+        計算各類別機率，稀疏特徵只在必要時轉為密集矩陣，且整批最多轉換一次
+
+        返回:
+            numpy.ndarray: 形狀為 (文章數, 類別數) 的機率矩陣
+        """
+        dense_features = None
+        probas = []
+        for estimator, dense_only in zip(self._estimators, self._dense_only):
+            if dense_only:
+                if dense_features is None:
+                    dense_features = features.toarray()
+                probas.append(estimator.predict_proba(dense_features))
+            else:
+                probas.append(estimator.predict_proba(features))
+        if len(probas) == 1:
+            return probas[0]
+        return np.average(np.asarray(probas), axis=0, weights=self._weights)
+
+    def predict(self, processed_texts):
+        """
+        批次分類已分詞的文本
+
+        參數:
+            processed_texts (list): 以空白分隔的分詞結果列表
+
+        返回:
+            list: 每篇文章的 (類別, 各類別機率字典) 元組
+        """
+        with span('vectorize'):
+            features = self.transform(processed_texts)
+        with span('model'):
+            probabilities = self.predict_proba(features)
+        predicted_columns = np.argmax(probabilities, axis=1)
+        results = []
+        for column, row in zip(predicted_columns, probabilities):
+            category_probabilities = {
+                label: float(row[self._label_columns[label]]) if label in self._label_columns else 0.0
+                for label in self.labels
+            }
+            results.append((self.classes[column], category_probabilities))
+        return results
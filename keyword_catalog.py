@@ -0,0 +1,243 @@
+"""
+熱門關鍵字目錄模組
+從 JSON Lines 檔案載入各看板的熱門關鍵字，以緊湊的陣列結構保存，並在檔案更新時於背景重新載入
+
+檔案格式（每行一筆，# 開頭的行為註解）：
+    {"board": "mood", "keyword": "紓壓", "popularity": 98, "related": ["壓力", "放鬆", "心情"]}
+board 為 "general" 的項目是跨看板的一般性熱門關鍵字
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import sys
+import tempfile
+import threading
+import time
+from array import array
+# 導入熱門關鍵字索引
+from keyword_index import PopularKeywordIndex
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+GENERAL_BOARD = 'general'
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dict', 'popular_keywords.jsonl')
+
+class KeywordCatalog:
+    """
+    單一看板的熱門關鍵字目錄
+
+    字串經過駐留並存放在所有看板共用的字串表中，
+    關鍵字、熱門度與相關詞都以 array 保存，不為每筆資料建立 dict 和 list
+    """
+
+    __slots__ = ('strings', 'keyword_ids', 'popularity', 'related_offsets', 'related_ids')
+
+    def __init__(self, strings):
+        self.strings = strings
+        self.keyword_ids = array('I')
+        self.popularity = array('f')
+        self.related_offsets = array('I', [0])
+        self.related_ids = array('I')
+
+    def append(self, keyword_id, popularity, related_ids):
+        """加入一筆熱門關鍵字（以字串表中的編號表示）"""
+        self.keyword_ids.append(keyword_id)
+        self.popularity.append(popularity)
+        self.related_ids.extend(related_ids)
+        self.related_offsets.append(len(self.related_ids))
+
+    def __len__(self):
+        return len(self.keyword_ids)
+
+    def __getitem__(self, index):
+        """以 dict 形式返回第 index 筆熱門關鍵字"""
+        if index < 0:
+            index += len(self)
+        popularity = self.popularity[index]
+        start, end = self.related_offsets[index], self.related_offsets[index + 1]
+        return {
+            'keyword': self.strings[self.keyword_ids[index]],
+            'popularity': int(popularity) if popularity.is_integer() else round(popularity, 2),
+            'related': [self.strings[i] for i in self.related_ids[start:end]]
+        }
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+class CatalogSnapshot:
+    """某個版本的完整目錄與索引，載入後不再修改，可以安全地在執行緒間共用"""
+
+    def __init__(self, catalogs, version):
+        """
+        參數:
+            catalogs (dict): 看板 -> KeywordCatalog
+            version (str): 目錄版本，用於區分快取結果
+        """
+        self.catalogs = catalogs
+        self.version = version
+        self.indexes = {board: PopularKeywordIndex(catalog) for board, catalog in catalogs.items()}
+
+    def catalog(self, board):
+        """返回看板的目錄，不存在時返回 None"""
+        return self.catalogs.get(board)
+
+    def index(self, board):
+        """返回看板的索引，不存在時返回 None"""
+        return self.indexes.get(board)
+
+def _iter_records(path):
+    """以記憶體映射逐行讀取 JSON Lines 檔案"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for line_number, line in enumerate(iter(mapped.readline, b''), 1):
+                line = line.strip()
+                if not line or line.startswith(b'#'):
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning(f"熱門關鍵字目錄第 {line_number} 行格式錯誤，已略過")
+
+def _file_signature(path):
+    """以檔案大小與修改時間判斷檔案是否變更"""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+def load_catalog(path):
+    """
+    載入熱門關鍵字目錄檔案
+
+    參數:
+        path (str): JSON Lines 檔案路徑
+
+    返回:
+        CatalogSnapshot: 目錄快照
+    """
+    strings = []
+    string_ids = {}
+
+    def intern_id(value):
+        value = sys.intern(str(value))
+        string_id = string_ids.get(value)
+        if string_id is None:
+            string_id = string_ids[value] = len(strings)
+            strings.append(value)
+        return string_id
+
+    catalogs = {}
+    for record in _iter_records(path):
+        board = sys.intern(str(record.get('board', GENERAL_BOARD)))
+        catalog = catalogs.get(board)
+        if catalog is None:
+            catalog = catalogs[board] = KeywordCatalog(strings)
+        catalog.append(
+            intern_id(record['keyword']),
+            float(record.get('popularity', 0)),
+            [intern_id(related) for related in record.get('related', ())]
+        )
+
+    size, mtime_ns = _file_signature(path)
+    version = hashlib.sha1(f"{size}:{mtime_ns}".encode('utf-8')).hexdigest()[:12]
+    return CatalogSnapshot(catalogs, version)
+
+def write_catalog(path, boards):
+    """
+    以原子方式寫入熱門關鍵字目錄檔案（先寫入暫存檔再取代），執行中的服務只會讀到完整的檔案
+
+    參數:
+        path (str): JSON Lines 檔案路徑
+        boards (dict): 看板 -> 熱門關鍵字列表，每個元素包含 keyword、popularity 和 related
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.popular_keywords.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for board, entries in boards.items():
+                for entry in entries:
+                    record = {
+                        'board': board,
+                        'keyword': entry['keyword'],
+                        'popularity': entry['popularity'],
+                        'related': list(entry.get('related', ()))
+                    }
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+class CatalogStore:
+    """
+    保存目前使用中的目錄快照，並在背景執行緒定期檢查檔案是否更新
+
+    重新載入時先完整建立新的快照與索引，再一次替換參照，讀取端不會看到載入到一半的目錄；
+    載入失敗時保留舊的快照。監看執行緒在每個程序第一次讀取時啟動，fork 出的 worker 也會各自啟動
+    """
+
+    def __init__(self, path=DEFAULT_CATALOG_PATH, reload_interval=30.0):
+        """
+        參數:
+            path (str): 目錄檔案路徑
+            reload_interval (float): 檢查檔案更新的間隔秒數，0 表示不自動重新載入
+        """
+        self.path = path
+        self.reload_interval = reload_interval
+        self._signature = None
+        self._snapshot = CatalogSnapshot({}, '')
+        self._watcher_pid = None
+        self._lock = threading.Lock()
+        # fork 時鎖可能正被父程序的監看執行緒持有，子程序需要新的鎖
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_lock)
+        self.reload()
+
+    def snapshot(self):
+        """返回目前的目錄快照"""
+        if self.reload_interval and self._watcher_pid != os.getpid():
+            self._start_watcher()
+        return self._snapshot
+
+    def reload(self):
+        """
+        檔案有變更時重新載入目錄
+
+        返回:
+            bool: 是否載入了新的目錄
+        """
+        with self._lock:
+            try:
+                signature = _file_signature(self.path)
+                if signature == self._signature:
+                    return False
+                snapshot = load_catalog(self.path)
+            except Exception as e:
+                logger.error(f"載入熱門關鍵字目錄失敗: {str(e)}")
+                return False
+            self._snapshot = snapshot
+            self._signature = signature
+        total = sum(len(catalog) for catalog in snapshot.catalogs.values())
+        logger.info(f"已載入熱門關鍵字目錄（{len(snapshot.catalogs)} 個看板，共 {total} 筆）")
+        return True
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    def _start_watcher(self):
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        thread = threading.Thread(target=self._watch, name='keyword-catalog-watcher', daemon=True)
+        thread.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.reload_interval)
+            self.reload()
@@ -4,117 +4,263 @@
 """
 import jieba.analyse
 import logging
-import re
+import os
 import random
-from collections import Counter
+from functools import lru_cache
+from itertools import chain, repeat
+from operator import itemgetter
+import numpy as np
+from scipy import sparse
+# 導入共用分詞模組
+from tokenizer import DICT_DIR, STOP_WORDS_PATH, clean_text, clip_text, segment, split_sentences
+# 導入啟動加速模組
+from startup import apply_idf_table
+# 導入熱門關鍵字目錄
+from keyword_catalog import CatalogStore, DEFAULT_CATALOG_PATH, GENERAL_BOARD
+# 導入效能指標模組
+from metrics import span
 
 # 設置日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # 載入結巴分詞的 TF-IDF 和 TextRank 分析工具
-jieba.analyse.set_stop_words("dict/stop_words.txt")
-jieba.analyse.set_idf_path("dict/idf.txt.big")
-
-# 各看板熱門關鍵字（模擬資料）
-# 這些關鍵字可以通過爬蟲獲取或資料分析來更新
-POPULAR_KEYWORDS = {
-    'mood': [
-        {'keyword': '紓壓', 'popularity': 98, 'related': ['壓力', '放鬆', '心情']},
-        {'keyword': '自我成長', 'popularity': 95, 'related': ['進步', '學習', '挑戰']},
-        {'keyword': '焦慮', 'popularity': 92, 'related': ['緊張', '不安', '壓力']},
-        {'keyword': '療癒', 'popularity': 90, 'related': ['舒壓', '放鬆', '心靈']},
-        {'keyword': '孤獨', 'popularity': 89, 'related': ['寂寞', '一個人', '獨處']},
-        {'keyword': '憂鬱', 'popularity': 87, 'related': ['難過', '低落', '心情']},
-        {'keyword': '感恩', 'popularity': 85, 'related': ['謝謝', '珍惜', '幸福']},
-        {'keyword': '人際關係', 'popularity': 83, 'related': ['朋友', '社交', '互動']},
-        {'keyword': '成就感', 'popularity': 81, 'related': ['完成', '目標', '滿足']},
-        {'keyword': '自信', 'popularity': 80, 'related': ['肯定', '勇氣', '相信']},
-        # 新增的心情板熱門關鍵字
-        {'keyword': '心情不好', 'popularity': 94, 'related': ['難過', '不開心', '壓抑']},
-        {'keyword': '抒發', 'popularity': 91, 'related': ['表達', '宣洩', '心情']},
-        {'keyword': '生活壓力', 'popularity': 88, 'related': ['壓力', '忙碌', '疲憊']},
-        {'keyword': '快樂', 'popularity': 86, 'related': ['開心', '幸福', '滿足']},
-        {'keyword': '情緒管理', 'popularity': 84, 'related': ['控制', '處理', '情緒']},
-        {'keyword': '正能量', 'popularity': 82, 'related': ['積極', '樂觀', '正向']},
-        {'keyword': '失落', 'popularity': 79, 'related': ['迷茫', '失去', '空虛']},
-        {'keyword': '感動', 'popularity': 77, 'related': ['溫暖', '觸動', '淚水']},
-        {'keyword': '創傷', 'popularity': 75, 'related': ['傷害', '痛苦', '治療']},
-        {'keyword': '懷舊', 'popularity': 73, 'related': ['回憶', '過去', '思念']}
-    ],
-    'relationship': [
-        {'keyword': '前任', 'popularity': 98, 'related': ['分手', '復合', '舊情人']},
-        {'keyword': '曖昧', 'popularity': 96, 'related': ['捉摸不定', '柏拉圖', '柏拉圖式']},
-        {'keyword': '告白', 'popularity': 94, 'related': ['表白', '喜歡', '心意']},
-        {'keyword': '分手', 'popularity': 93, 'related': ['結束', '放下', '難過']},
-        {'keyword': '劈腿', 'popularity': 91, 'related': ['背叛', '出軌', '欺騙']},
-        {'keyword': '相處模式', 'popularity': 90, 'related': ['習慣', '空間', '磨合']},
-        {'keyword': '吵架', 'popularity': 88, 'related': ['爭執', '冷戰', '溝通']},
-        {'keyword': '暗戀', 'popularity': 86, 'related': ['單戀', '喜歡', '偷偷']},
-        {'keyword': '異地戀', 'popularity': 85, 'related': ['距離', '遠距離', '思念']},
-        {'keyword': '相親', 'popularity': 82, 'related': ['約會', '第一次見面', '介紹']},
-        # 新增的感情板熱門關鍵字
-        {'keyword': '交往', 'popularity': 95, 'related': ['戀愛', '情侶', '關係']},
-        {'keyword': '失戀', 'popularity': 92, 'related': ['分手', '放下', '傷心']},
-        {'keyword': '戀愛技巧', 'popularity': 89, 'related': ['追求', '攻略', '技巧']},
-        {'keyword': '感情問題', 'popularity': 87, 'related': ['困擾', '疑惑', '建議']},
-        {'keyword': '婚姻', 'popularity': 84, 'related': ['結婚', '伴侶', '經營']},
-        {'keyword': '長跑', 'popularity': 81, 'related': ['長期', '穩定', '關係']},
-        {'keyword': '曖昧期', 'popularity': 80, 'related': ['曖昧', '暧昧', '捉摸不定']},
-        {'keyword': '挽回', 'popularity': 79, 'related': ['挽救', '挽留', '挽回前任']},
-        {'keyword': '感情觀', 'popularity': 78, 'related': ['價值觀', '感情觀念', '愛情觀']},
-        {'keyword': '網戀', 'popularity': 77, 'related': ['線上交友', '遠距戀愛', '見面']}
-    ],
-    'talk': [
-        {'keyword': '心得分享', 'popularity': 97, 'related': ['經驗', '推薦', '想法']},
-        {'keyword': '求推薦', 'popularity': 95, 'related': ['意見', '建議', '推薦']},
-        {'keyword': '時事', 'popularity': 93, 'related': ['新聞', '熱門', '討論']},
-        {'keyword': '美食', 'popularity': 92, 'related': ['餐廳', '食物', '推薦']},
-        {'keyword': '職場', 'popularity': 90, 'related': ['工作', '上班', '同事']},
-        {'keyword': '電影', 'popularity': 88, 'related': ['影評', '推薦', '心得']},
-        {'keyword': '旅遊', 'popularity': 87, 'related': ['景點', '行程', '規劃']},
-        {'keyword': '3C', 'popularity': 85, 'related': ['手機', '電腦', '購買']},
-        {'keyword': '健身', 'popularity': 83, 'related': ['運動', '減肥', '健康']},
-        {'keyword': '追劇', 'popularity': 82, 'related': ['推薦', '心得', '評價']},
-        # 新增的閒聊板熱門關鍵字
-        {'keyword': '問卦', 'popularity': 96, 'related': ['問題', '好奇', '討論']},
-        {'keyword': '分享', 'popularity': 94, 'related': ['心得', '經驗', '推薦']},
-        {'keyword': '求解', 'popularity': 91, 'related': ['疑問', '請教', '解答']},
-        {'keyword': '學生', 'popularity': 89, 'related': ['大學', '課業', '校園']},
-        {'keyword': '科技', 'popularity': 86, 'related': ['手機', '電腦', '數位']},
-        {'keyword': '八卦', 'popularity': 84, 'related': ['gossip', '熱門', '話題']},
-        {'keyword': '女孩', 'popularity': 81, 'related': ['女生', '女性', '話題']},
-        {'keyword': '男孩', 'popularity': 80, 'related': ['男生', '男性', '話題']},
-        {'keyword': '疑問', 'popularity': 79, 'related': ['問題', '好奇', '請教']},
-        {'keyword': '爆料', 'popularity': 78, 'related': ['分享', '揭露', '秘密']}
-    ]
-}
-
-# 一般性熱門關鍵字（跨看板）
-GENERAL_POPULAR_KEYWORDS = [
-    {'keyword': '心得', 'popularity': 99, 'related': ['分享', '經驗', '體驗']},
-    {'keyword': '推薦', 'popularity': 98, 'related': ['好用', '分享', '評價']},
-    {'keyword': '問題', 'popularity': 97, 'related': ['疑問', '求解', '幫助']},
-    {'keyword': '討論', 'popularity': 96, 'related': ['意見', '想法', '交流']},
-    {'keyword': '求助', 'popularity': 95, 'related': ['幫忙', '意見', '困擾']},
-    {'keyword': '大家', 'popularity': 94, 'related': ['各位', '大家都', '問問']},
-    {'keyword': '分享', 'popularity': 93, 'related': ['心得', '推薦', '經驗']},
-    {'keyword': '經驗', 'popularity': 91, 'related': ['體驗', '過程', '親身']},
-    {'keyword': '想問', 'popularity': 90, 'related': ['請問', '疑問', '好奇']},
-    {'keyword': '好奇', 'popularity': 88, 'related': ['想知道', '疑問', '請問']}
-]
+jieba.analyse.set_stop_words(STOP_WORDS_PATH)
+# IDF 詞頻表優先讀取二進位快取
+apply_idf_table(os.path.join(DICT_DIR, 'idf.txt.big'))
+
+# TextRank 使用的詞性與共現窗口（與 jieba.analyse.textrank 預設值相同）
+TEXTRANK_ALLOW_POS = frozenset(('ns', 'n', 'vn', 'v'))
+TEXTRANK_SPAN = int(os.getenv('TEXTRANK_WINDOW', '5'))
+# TextRank 迭代到分數變化小於 TEXTRANK_TOL 為止，最多 TEXTRANK_MAX_ITER 次（jieba 固定迭代 10 次）
+TEXTRANK_MAX_ITER = int(os.getenv('TEXTRANK_MAX_ITER', '100'))
+TEXTRANK_TOL = float(os.getenv('TEXTRANK_TOL', '1e-3'))
+TEXTRANK_DAMPING = 0.85
+# 節點數量不超過此值時鄰接矩陣以密集陣列保存（300 個節點約 700 KB）
+TEXTRANK_DENSE_NODES = 300
+# 節點數量不超過此值時直接求解，不需要迭代
+TEXTRANK_DIRECT_NODES = 64
+
+# 關鍵字提取最多處理文章開頭的 KEYWORDS_MAX_CHARS 個字元（0 表示不限制）；
+# 超過 KEYWORD_CHUNK_CHARS 的文章依句子切成段落分別提取再合併，每段的斷詞與 TextRank 成本固定
+KEYWORDS_MAX_CHARS = int(os.getenv('KEYWORDS_MAX_CHARS', '6000'))
+KEYWORD_CHUNK_CHARS = int(os.getenv('KEYWORD_CHUNK_CHARS', '1000'))
+
+# 各看板熱門關鍵字目錄，檔案更新後會在背景自動重新載入
+# 這些關鍵字可以通過爬蟲獲取或資料分析來更新（見 dict/popular_keywords.jsonl）
+catalog_store = CatalogStore(
+    os.getenv('KEYWORD_CATALOG_PATH', DEFAULT_CATALOG_PATH),
+    reload_interval=float(os.getenv('KEYWORD_CATALOG_RELOAD_INTERVAL', '30'))
+)
 
 def preprocess_text(text):
     """
     預處理文本，移除URL、特殊符號等
     """
-    # 移除URL
-    text = re.sub(r'http\S+|www\S+|https\S+', '', text, flags=re.MULTILINE)
-    # 移除標點符號和特殊字元
-    text = re.sub(r'[^\w\s]', '', text)
-    return text
+    return clean_text(text)
+
+def extract_tfidf_keywords(segmented, top_k):
+    """
+    以 TF-IDF 從分詞結果提取關鍵詞（與 jieba.analyse.extract_tags 的計算方式相同）
+
+    參數:
+        segmented (SegmentedText): 分詞結果
+        top_k (int): 返回的關鍵詞數量
+
+    返回:
+        list: 關鍵詞列表，每個元素是 (關鍵詞, 權重) 的元組
+    """
+    tfidf = jieba.analyse.default_tfidf
+    freq = {}
+    for word in segmented.words:
+        if len(word.strip()) < 2 or word.lower() in tfidf.stop_words:
+            continue
+        freq[word] = freq.get(word, 0.0) + 1.0
+    total = sum(freq.values())
+    for word in freq:
+        freq[word] *= tfidf.idf_freq.get(word, tfidf.median_idf) / total
+    return sorted(freq.items(), key=itemgetter(1), reverse=True)[:top_k]
+
+@lru_cache(maxsize=131072)
+def is_tfidf_candidate(word):
+    """與 extract_tfidf_keywords 相同的條件：兩個字以上且不是停用詞，結果會被快取"""
+    return len(word.strip()) >= 2 and word.lower() not in jieba.analyse.default_tfidf.stop_words
+
+def extract_tfidf_keywords_batch(segmented_texts, top_k):
+    """
+    一次以 TF-IDF 從多篇文章的分詞結果提取關鍵詞，權重與排序都與 extract_tfidf_keywords 相同
+
+    整批文章的詞轉為整數編號後建立稀疏詞頻矩陣（列為文章、欄為詞），每個不同的詞只檢查一次停用詞與查詢一次 IDF；
+    非零項乘上 IDF 向量並除以該篇的詞數，每篇文章的排序（權重由大到小，同分時依詞第一次出現的順序）
+    以一次 lexsort 完成，不需要逐篇建立字典與排序
+
+    參數:
+        segmented_texts (list): 分詞結果列表
+        top_k (int): 每篇文章返回的關鍵詞數量
+
+    返回:
+        list: 每篇文章的關鍵詞列表，每個元素是 (關鍵詞, 權重) 的元組
+    """
+    tfidf = jieba.analyse.default_tfidf
+    num_docs = len(segmented_texts)
+    lengths = [len(segmented.words) for segmented in segmented_texts]
+    tokens = list(chain.from_iterable(segmented.words for segmented in segmented_texts))
+    if not tokens or top_k <= 0:
+        return [[] for _ in segmented_texts]
+
+    # 詞彙編號依整批第一次出現的順序
+    vocabulary = {word: i for i, word in enumerate(dict.fromkeys(tokens))}
+    keep = np.fromiter(map(is_tfidf_candidate, vocabulary), dtype=bool, count=len(vocabulary))
+    columns = np.fromiter(map(vocabulary.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+    rows = np.repeat(np.arange(num_docs), lengths)
+    kept = keep[columns]
+    columns, rows = columns[kept], rows[kept]
+    if not len(columns):
+        return [[] for _ in segmented_texts]
+
+    # 以 (文章, 詞) 的鍵值合併重複的詞，first 為詞在該篇第一次出現的位置
+    num_words = len(vocabulary)
+    keys, first, counts = np.unique(rows * num_words + columns, return_index=True, return_counts=True)
+    entry_rows, entry_columns = keys // num_words, keys % num_words
+    indptr = np.zeros(num_docs + 1, dtype=np.int64)
+    np.cumsum(np.bincount(entry_rows, minlength=num_docs), out=indptr[1:])
+    term_counts = sparse.csr_matrix((counts.astype(np.float64), entry_columns, indptr), shape=(num_docs, num_words))
+
+    # 不在 IDF 詞頻表中的詞使用中位數 IDF
+    idf = np.fromiter(map(tfidf.idf_freq.get, vocabulary, repeat(tfidf.median_idf)), dtype=np.float64,
+                      count=num_words)
+    # 每篇文章保留的詞數
+    totals = np.bincount(rows, minlength=num_docs).astype(np.float64)
+    # 與 extract_tfidf_keywords 相同的運算順序：詞頻 × (IDF / 總詞數)
+    weights = term_counts.data * (idf[term_counts.indices] / totals[entry_rows])
+
+    order = np.lexsort((first, -weights, entry_rows))
+    rank = np.arange(len(order)) - indptr[entry_rows[order]]
+    order = order[rank < top_k]
+    bounds = np.searchsorted(entry_rows[order], np.arange(num_docs + 1))
+    words = list(vocabulary)
+    top_words = [words[column] for column in entry_columns[order].tolist()]
+    top_weights = weights[order].tolist()
+    return [
+        list(zip(top_words[start:end], top_weights[start:end]))
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+
+def textrank_scores(sources, targets, num_nodes, max_iter=TEXTRANK_MAX_ITER, tol=TEXTRANK_TOL):
+    """
+    計算無向共現圖的 TextRank 分數
+
+    共現邊以 (sources[i], targets[i]) 陣列表示，兩個方向都需要列出，重複的邊即為權重；
+    鄰接矩陣在節點不多時以密集陣列、否則以 CSR 稀疏矩陣保存，每次迭代只需要一次矩陣乘法，
+    分數的最大變化小於 tol 時提前停止
+
+    參數:
+        sources (numpy.ndarray): 邊的起點
+        targets (numpy.ndarray): 邊的終點
+        num_nodes (int): 節點數量
+        max_iter (int): 最多迭代次數
+        tol (float): 收斂門檻
+
+    返回:
+        numpy.ndarray: 與 jieba 相同方式正規化後的分數
+    """
+    if num_nodes <= TEXTRANK_DENSE_NODES:
+        weights = np.bincount(sources * num_nodes + targets, minlength=num_nodes * num_nodes).astype(np.float64)
+        weights = weights.reshape(num_nodes, num_nodes)
+    else:
+        weights = sparse.csr_matrix((np.ones(len(sources)), (sources, targets)), shape=(num_nodes, num_nodes))
+    # 每條邊傳遞的比例（阻尼係數 × 邊的權重 / 鄰居的權重總和）不隨迭代改變，先併入矩陣
+    scale = TEXTRANK_DAMPING / np.asarray(weights.sum(axis=0)).ravel()
+    if sparse.issparse(weights):
+        transition = sparse.csr_matrix(weights.multiply(scale))
+    else:
+        transition = weights * scale
+    if num_nodes <= TEXTRANK_DIRECT_NODES:
+        # 小圖直接解固定點方程式 (I - transition) · scores = 1 - d，結果等於迭代到完全收斂，
+        # 比數十次矩陣乘法快
+        scores = np.linalg.solve(np.eye(num_nodes) - transition, np.full(num_nodes, 1 - TEXTRANK_DAMPING))
+    else:
+        scores = np.full(num_nodes, 1.0 / num_nodes)
+        for _ in range(max_iter):
+            updated = transition @ scores
+            updated += 1 - TEXTRANK_DAMPING
+            converged = np.abs(updated - scores).max() < tol
+            scores = updated
+            if converged:
+                break
+    min_rank, max_rank = scores.min(), scores.max()
+    return (scores - min_rank / 10.0) / (max_rank - min_rank / 10.0)
+
+def extract_textrank_keywords(segmented, top_k, window=TEXTRANK_SPAN, max_iter=TEXTRANK_MAX_ITER, tol=TEXTRANK_TOL):
+    """
+    以 TextRank 從分詞結果提取關鍵詞（與 jieba.analyse.textrank 的計算方式相同，但不再重新斷詞）
 
-def extract_keywords(text, method='mixed', num_keywords=10):
+    共現圖以陣列表示：符合詞性的詞轉為整數編號，窗口內的每個距離以陣列平移一次找出所有共現詞對，
+    不需要逐對建立字典；迭代到收斂為止，而不是固定 10 次
+
+    參數:
+        segmented (SegmentedText): 分詞結果
+        top_k (int): 返回的關鍵詞數量
+        window (int): 共現窗口大小（與 jieba 的 span 相同，窗口內最多 window - 1 個後續詞）
+        max_iter (int): 最多迭代次數
+        tol (float): 收斂門檻
+
+    返回:
+        list: 關鍵詞列表，每個元素是 (關鍵詞, 權重) 的元組
+    """
+    stop_words = jieba.analyse.default_textrank.stop_words
+
+    # 不符合條件的詞編號為 -1，但仍佔據窗口中的位置（與 jieba 相同）
+    vocabulary = {}
+    ids = np.array([
+        vocabulary.setdefault(word, len(vocabulary))
+        if flag in TEXTRANK_ALLOW_POS and len(word.strip()) >= 2 and word.lower() not in stop_words else -1
+        for word, flag in segmented.tokens
+    ], dtype=np.int64)
+    sources, targets = [], []
+    for distance in range(1, min(window, len(ids))):
+        start, end = ids[:-distance], ids[distance:]
+        valid = (start >= 0) & (end >= 0)
+        sources.append(start[valid])
+        targets.append(end[valid])
+    if not vocabulary or not sum(len(edges) for edges in sources):
+        return []
+
+    # 無向圖：每條共現邊兩個方向各列一次
+    forward, backward = np.concatenate(sources), np.concatenate(targets)
+    edge_sources = np.concatenate([forward, backward])
+    edge_targets = np.concatenate([backward, forward])
+    # 只保留有邊的節點（與 jieba 相同，沒有共現詞的詞不參與排名）
+    present = np.unique(edge_sources)
+    remap = np.full(len(vocabulary), -1, dtype=np.int64)
+    remap[present] = np.arange(len(present))
+    scores = textrank_scores(remap[edge_sources], remap[edge_targets], len(present), max_iter, tol)
+
+    # 詞彙字典的順序即為編號順序；同分時依詞出現的先後排序
+    words = list(vocabulary)
+    order = np.argsort(-scores, kind='stable')[:top_k]
+    return [(words[present[i]], float(scores[i])) for i in order]
+
+def extract_chunked_keywords(text, method='mixed', num_keywords=10, chunk_chars=KEYWORD_CHUNK_CHARS):
+    """
+    將長文章依句子切成段落，各段分別提取關鍵詞後合併
+
+    各段的權重依段落長度加權加總（TF-IDF 的詞頻以段落長度加權後即等於整篇的詞頻），
+    每段多取一倍的候選詞，減少只在單一段落排名較後的詞被遺漏
+
+    返回:
+        list: 關鍵詞列表，每個元素是 (關鍵詞, 權重) 的元組
+    """
+    chunks = split_sentences(text, chunk_chars)
+    total = sum(len(chunk) for chunk in chunks)
+    merged = {}
+    for chunk in chunks:
+        share = len(chunk) / total
+        for word, weight in extract_keywords(chunk, method, num_keywords * 2, chunked=False):
+            merged[word] = merged.get(word, 0.0) + weight * share
+    return sorted(merged.items(), key=itemgetter(1), reverse=True)[:num_keywords]
+
+def extract_keywords(text, method='mixed', num_keywords=10, segmented=None, chunked=True):
     """
     提取文本中的關鍵詞
     
@@ -122,41 +268,57 @@ def extract_keywords(text, method='mixed', num_keywords=10):
         text (str): 文本內容
         method (str): 'tfidf', 'textrank' 或 'mixed'
         num_keywords (int): 返回的關鍵詞數量
+        segmented (SegmentedText): 已有的分詞結果，提供時不再重新斷詞
+        chunked (bool): 文章超過 KEYWORD_CHUNK_CHARS 時是否分段提取（分段時不使用 segmented）
     
     返回:
         list: 關鍵詞列表，每個元素是 (關鍵詞, 權重) 的元組
     """
-    text = preprocess_text(text)
+    if chunked and len(text) > KEYWORD_CHUNK_CHARS > 0:
+        return extract_chunked_keywords(clip_text(text, KEYWORDS_MAX_CHARS), method, num_keywords)
+    if len(text) > KEYWORDS_MAX_CHARS > 0:
+        text, segmented = clip_text(text, KEYWORDS_MAX_CHARS), None
+    if segmented is None:
+        segmented = segment(text)
     
     if method == 'tfidf':
         # 使用 TF-IDF 算法提取關鍵詞
-        keywords = jieba.analyse.extract_tags(text, topK=num_keywords, withWeight=True)
+        with span('keywords_tfidf'):
+            keywords = extract_tfidf_keywords(segmented, num_keywords)
     elif method == 'textrank':
         # 使用 TextRank 算法提取關鍵詞
-        keywords = jieba.analyse.textrank(text, topK=num_keywords, withWeight=True)
+        with span('keywords_textrank'):
+            keywords = extract_textrank_keywords(segmented, num_keywords)
     else:  # mixed - 結合 TF-IDF 和 TextRank
-        # 分別使用兩種方法提取關鍵詞
-        tfidf_keywords = jieba.analyse.extract_tags(text, topK=num_keywords*2, withWeight=True)
-        textrank_keywords = jieba.analyse.textrank(text, topK=num_keywords*2, withWeight=True)
-        
-        # 合併兩種方法的結果
-        keyword_weights = {}
-        
-        # TF-IDF 權重，權重 * 0.6
-        for word, weight in tfidf_keywords:
-            keyword_weights[word] = weight * 0.6
-        
-        # TextRank 權重，權重 * 0.4 (如果該詞已經在 TF-IDF 中出現，則加權)
-        for word, weight in textrank_keywords:
-            if word in keyword_weights:
-                keyword_weights[word] += weight * 0.4
-            else:
-                keyword_weights[word] = weight * 0.4
-        
-        # 排序並選擇前 N 個關鍵詞
-        keywords = sorted(keyword_weights.items(), key=lambda x: x[1], reverse=True)[:num_keywords]
+        # 分別使用兩種方法提取關鍵詞，共用同一份分詞結果
+        with span('keywords_tfidf'):
+            tfidf_keywords = extract_tfidf_keywords(segmented, num_keywords*2)
+        with span('keywords_textrank'):
+            textrank_keywords = extract_textrank_keywords(segmented, num_keywords*2)
+        keywords = combine_keywords(tfidf_keywords, textrank_keywords, num_keywords)
+    
+    return drop_short_keywords(keywords, num_keywords)
+
+def combine_keywords(tfidf_keywords, textrank_keywords, num_keywords):
+    """合併 TF-IDF 與 TextRank 的結果（mixed 方法）"""
+    keyword_weights = {}
+    
+    # TF-IDF 權重，權重 * 0.6
+    for word, weight in tfidf_keywords:
+        keyword_weights[word] = weight * 0.6
     
-    # 移除過短的關鍵詞（通常不太有意義）
+    # TextRank 權重，權重 * 0.4 (如果該詞已經在 TF-IDF 中出現，則加權)
+    for word, weight in textrank_keywords:
+        if word in keyword_weights:
+            keyword_weights[word] += weight * 0.4
+        else:
+            keyword_weights[word] = weight * 0.4
+    
+    # 排序並選擇前 N 個關鍵詞
+    return sorted(keyword_weights.items(), key=lambda x: x[1], reverse=True)[:num_keywords]
+
+def drop_short_keywords(keywords, num_keywords):
+    """移除過短的關鍵詞（通常不太有意義），數量不足時再補回"""
     filtered_keywords = [(word, weight) for word, weight in keywords if len(word) > 1]
     
     # 如果過濾後的關鍵詞數量不足，再補充一些
@@ -166,6 +328,57 @@ def extract_keywords(text, method='mixed', num_keywords=10):
     
     return filtered_keywords
 
+def extract_keywords_batch(texts, method='mixed', num_keywords=10, segmented_texts=None):
+    """
+    一次提取多篇文章的關鍵詞，結果與逐篇呼叫 extract_keywords 相同
+
+    TF-IDF 部分以 extract_tfidf_keywords_batch 整批計算；TextRank 仍逐篇計算；
+    需要分段提取的長文章改用 extract_keywords
+
+    參數:
+        texts (list): 文本內容列表
+        method (str): 'tfidf', 'textrank' 或 'mixed'
+        num_keywords (int): 每篇文章返回的關鍵詞數量
+        segmented_texts (list): 已有的分詞結果列表，元素為 None 的文章會重新斷詞
+
+    返回:
+        list: 每篇文章的關鍵詞列表
+    """
+    if segmented_texts is None:
+        segmented_texts = [None] * len(texts)
+    results = [None] * len(texts)
+    batch, batch_segments = [], []
+    for i, (text, segmented) in enumerate(zip(texts, segmented_texts)):
+        if len(text) > KEYWORD_CHUNK_CHARS > 0:
+            results[i] = extract_keywords(text, method, num_keywords)
+            continue
+        if len(text) > KEYWORDS_MAX_CHARS > 0:
+            text, segmented = clip_text(text, KEYWORDS_MAX_CHARS), None
+        batch.append(i)
+        batch_segments.append(segmented if segmented is not None else segment(text))
+
+    tfidf_results = [None] * len(batch)
+    if method != 'textrank':
+        with span('keywords_tfidf_batch'):
+            tfidf_results = extract_tfidf_keywords_batch(batch_segments,
+                                                         num_keywords if method == 'tfidf' else num_keywords * 2)
+    for i, segmented, tfidf_keywords in zip(batch, batch_segments, tfidf_results):
+        if method == 'tfidf':
+            keywords = tfidf_keywords
+        elif method == 'textrank':
+            with span('keywords_textrank'):
+                keywords = extract_textrank_keywords(segmented, num_keywords)
+        else:
+            with span('keywords_textrank'):
+                textrank_keywords = extract_textrank_keywords(segmented, num_keywords * 2)
+            keywords = combine_keywords(tfidf_keywords, textrank_keywords, num_keywords)
+        results[i] = drop_short_keywords(keywords, num_keywords)
+    return results
+
+def catalog_version():
+    """目前使用中的熱門關鍵字目錄版本"""
+    return catalog_store.snapshot().version
+
 def get_related_popular_keywords(keywords, category, max_keywords=5):
     """
     根據提取的關鍵詞，推薦相關的熱門關鍵字
@@ -178,92 +391,21 @@ def get_related_popular_keywords(keywords, category, max_keywords=5):
     返回:
         list: 熱門關鍵字列表，每個元素是一個字典，包含關鍵字和熱門度
     """
-    # 獲取特定類別的熱門關鍵字
-    category_keywords = POPULAR_KEYWORDS.get(category, [])
-    if not category_keywords:
+    # 獲取特定類別的熱門關鍵字索引（載入時已建立）
+    snapshot = catalog_store.snapshot()
+    index = snapshot.index(category)
+    if not index:
         # 如果沒有特定類別的關鍵字，使用一般性熱門關鍵字
-        category_keywords = GENERAL_POPULAR_KEYWORDS
-    
-    # 將提取的關鍵詞轉換為列表並保留權重
-    extracted_keywords_with_weight = {k: w for k, w in keywords}
-    extracted_keywords = list(extracted_keywords_with_weight.keys())
-    
-    # 計算熱門關鍵字與提取關鍵詞的相關度
-    keyword_scores = []
-    for popular_keyword in category_keywords:
-        score = 0
-        
-        # 檢查熱門關鍵字是否在提取的關鍵詞中
-        if popular_keyword['keyword'] in extracted_keywords:
-            # 直接匹配給予較高分數，並考慮關鍵詞權重
-            keyword_weight = extracted_keywords_with_weight.get(popular_keyword['keyword'], 1.0)
-            score += 10 * keyword_weight  # 增加直接匹配的權重
-        
-        # 檢查相關關鍵詞是否在提取的關鍵詞中
-        for related in popular_keyword['related']:
-            if related in extracted_keywords:
-                # 相關詞匹配給予適中分數，並考慮關鍵詞權重
-                keyword_weight = extracted_keywords_with_weight.get(related, 0.5)
-                score += 5 * keyword_weight  # 增加相關詞匹配的權重
-            
-            # 進一步檢查部分匹配（關鍵詞包含情況）
-            else:
-                for extracted_kw in extracted_keywords:
-                    # 如果提取的關鍵詞包含相關詞或相關詞包含提取的關鍵詞
-                    if related in extracted_kw or extracted_kw in related:
-                        keyword_weight = extracted_keywords_with_weight.get(extracted_kw, 0.3)
-                        score += 2 * keyword_weight  # 部分匹配給予較低分數
-        
-        # 考慮熱門度因素，但降低其權重比例
-        popularity_factor = popular_keyword['popularity'] / 100
-        
-        # 最終得分：關鍵詞匹配得分 * 0.7 + 熱門度 * 0.3
-        final_score = (score * 0.7 + popularity_factor * 0.3) if score > 0 else popularity_factor * 0.1
-        
-        keyword_scores.append({
-            'keyword': popular_keyword['keyword'],
-            'popularity': popular_keyword['popularity'],
-            'score': final_score,
-            'related': popular_keyword['related']
-        })
-    
-    # 根據得分排序
-    keyword_scores.sort(key=lambda x: x['score'], reverse=True)
-    
-    # 如果沒有足夠的相關熱門關鍵字，添加一些基於類別相關的熱門關鍵字
-    if len([k for k in keyword_scores if k['score'] > 0.1]) < max_keywords:
-        additional_keywords = [k for k in category_keywords if k['keyword'] not in [x['keyword'] for x in keyword_scores[:max_keywords]]]
-        # 根據熱門度排序
-        additional_keywords.sort(key=lambda x: x['popularity'], reverse=True)
-        # 加入一定數量的額外關鍵字
-        for kw in additional_keywords[:max_keywords - len([k for k in keyword_scores if k['score'] > 0.1])]:
-            keyword_scores.append({
-                'keyword': kw['keyword'],
-                'popularity': kw['popularity'],
-                'score': 0.05,  # 給予較低的得分
-                'related': kw['related']
-            })
-        # 重新排序
-        keyword_scores.sort(key=lambda x: x['score'], reverse=True)
-    
-    # 返回推薦的熱門關鍵字
-    result = keyword_scores[:max_keywords]
-    
-    # 確保返回的關鍵字是唯一的
-    seen_keywords = set()
-    unique_result = []
-    for item in result:
-        if item['keyword'] not in seen_keywords:
-            seen_keywords.add(item['keyword'])
-            unique_result.append({
-                'keyword': item['keyword'],
-                'popularity': item['popularity'],
-                'related': item['related']
-            })
+        index = snapshot.index(GENERAL_BOARD)
+    if not index:
+        return []
     
-    return unique_result
+    # 直接匹配給予較高分數，相關詞匹配給予適中分數，部分匹配（互相包含）給予較低分數，
+    # 最後結合熱門度排序，不足時依熱門度補充
+    with span('keywords_recommend'):
+        return index.recommend(keywords, max_keywords=max_keywords)
 
-def generate_hot_keywords(text, category, max_extracted=15, max_recommended=5):
+def generate_hot_keywords(text, category, max_extracted=15, max_recommended=5, segmented=None):
     """
     從文本中提取關鍵詞並推薦熱門關鍵字
     
@@ -272,13 +414,14 @@ def generate_hot_keywords(text, category, max_extracted=15, max_recommended=5):
         category (str): 文章類別 ('mood', 'relationship', 'talk')
         max_extracted (int): 從文本中提取的關鍵詞數量
         max_recommended (int): 推薦的熱門關鍵字數量
+        segmented (SegmentedText): 已有的分詞結果，提供時不再重新斷詞
     
     返回:
         dict: 包含提取的關鍵詞和推薦的熱門關鍵字
     """
     try:
         # 使用混合方法提取關鍵詞 (結合 TF-IDF 和 TextRank)
-        keywords = extract_keywords(text, method='mixed', num_keywords=max_extracted)
+        keywords = extract_keywords(text, method='mixed', num_keywords=max_extracted, segmented=segmented)
         
         # 獲取推薦的熱門關鍵字
         recommended_keywords = get_related_popular_keywords(
@@ -298,7 +441,8 @@ def generate_hot_keywords(text, category, max_extracted=15, max_recommended=5):
     except Exception as e:
         logger.error(f"生成熱門關鍵字時發生錯誤: {str(e)}")
         # 返回一些默認關鍵字
-        default_keywords = [k['keyword'] for k in GENERAL_POPULAR_KEYWORDS[:max_recommended]]
+        general_catalog = catalog_store.snapshot().catalog(GENERAL_BOARD) or []
+        default_keywords = [general_catalog[i]['keyword'] for i in range(min(max_recommended, len(general_catalog)))]
         return {
             'extracted_keywords': [],
             'recommended_hot_keywords': [
@@ -310,6 +454,36 @@ def generate_hot_keywords(text, category, max_extracted=15, max_recommended=5):
             ]
         }
 
+def generate_hot_keywords_batch(texts, categories, max_extracted=15, max_recommended=5, segmented_texts=None):
+    """
+    一次為多篇文章提取關鍵詞並推薦熱門關鍵字，結果與逐篇呼叫 generate_hot_keywords 相同
+
+    參數:
+        texts (list): 文本內容列表
+        categories (list): 每篇文章的類別
+        segmented_texts (list): 已有的分詞結果列表，元素為 None 的文章會重新斷詞
+
+    返回:
+        list: 每篇文章的 {'extracted_keywords', 'recommended_hot_keywords'}
+    """
+    try:
+        keyword_lists = extract_keywords_batch(texts, method='mixed', num_keywords=max_extracted,
+                                               segmented_texts=segmented_texts)
+    except Exception as e:
+        logger.error(f"批次提取關鍵詞時發生錯誤，改為逐篇提取: {str(e)}")
+        segmented_texts = segmented_texts or [None] * len(texts)
+        return [
+            generate_hot_keywords(text, category, max_extracted, max_recommended, segmented)
+            for text, category, segmented in zip(texts, categories, segmented_texts)
+        ]
+    return [
+        {
+            'extracted_keywords': [k for k, _ in keywords[:10]],
+            'recommended_hot_keywords': get_related_popular_keywords(keywords, category, max_keywords=max_recommended)
+        }
+        for keywords, category in zip(keyword_lists, categories)
+    ]
+
 # 示例用法
 if __name__ == "__main__":
     test_text = """
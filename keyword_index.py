@@ -0,0 +1,174 @@
+"""
+熱門關鍵字索引模組
+在載入時為熱門關鍵字目錄建立雜湊索引，推薦時的計算量只與提取的關鍵詞數量有關，與目錄大小無關
+"""
+from array import array
+from collections import defaultdict
+
+class PopularKeywordIndex:
+    """
+    單一看板熱門關鍵字目錄的索引
+
+    - 熱門關鍵字與相關詞的完全比對使用雜湊表
+    - 「相關詞包含提取的關鍵詞」：預先將每個相關詞的所有子字串建立索引
+    - 「提取的關鍵詞包含相關詞」：列舉提取關鍵詞的子字串（長度不超過最長的相關詞）查詢相關詞索引
+
+    計分與排序結果與逐一比對整個目錄的做法完全相同
+    """
+
+    def __init__(self, entries):
+        """
+        參數:
+            entries: 熱門關鍵字序列（list 或 KeywordCatalog），每個元素包含 keyword、popularity 和 related
+        """
+        self.entries = entries
+        # 熱門關鍵字 -> 目錄索引
+        self._keyword_postings = defaultdict(list)
+        # 相關詞 -> (目錄索引, 相關詞位置)
+        self._related_postings = defaultdict(list)
+        # 相關詞的子字串 -> 包含該子字串的相關詞
+        self._substring_terms = defaultdict(set)
+        self._max_term_length = 0
+
+        for index, entry in enumerate(entries):
+            self._keyword_postings[entry['keyword']].append(index)
+            for position, related in enumerate(entry['related']):
+                self._related_postings[related].append((index, position))
+
+        for term in self._related_postings:
+            self._max_term_length = max(self._max_term_length, len(term))
+            for start in range(len(term)):
+                for end in range(start + 1, len(term) + 1):
+                    self._substring_terms[term[start:end]].add(term)
+
+        # 未匹配時的得分（熱門度 * 0.1）由高到低的順序，以及依熱門度排序的順序
+        popularity = [entry['popularity'] for entry in entries]
+        self._base_scores = array('d', (value / 100 * 0.1 for value in popularity))
+        self._base_order = array('I', sorted(range(len(entries)), key=lambda i: self._base_scores[i], reverse=True))
+        self._popularity_order = array('I', sorted(range(len(entries)), key=lambda i: popularity[i], reverse=True))
+        # 未匹配時得分仍大於 0.1 的項目數量（位於 _base_order 的最前面）
+        self._high_base_count = sum(1 for score in self._base_scores if score > 0.1)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _matching_terms(self, keyword):
+        """找出與提取關鍵詞互相包含的所有相關詞"""
+        if not keyword:
+            return set(self._related_postings)
+        terms = set(self._substring_terms.get(keyword, ()))
+        max_length = min(len(keyword), self._max_term_length)
+        for start in range(len(keyword)):
+            for end in range(start + 1, min(start + max_length, len(keyword)) + 1):
+                substring = keyword[start:end]
+                if substring in self._related_postings:
+                    terms.add(substring)
+        return terms
+
+    def _match_scores(self, weights):
+        """
+        計算有匹配的熱門關鍵字得分
+
+        參數:
+            weights (dict): 提取的關鍵詞 -> 權重（保留提取順序）
+
+        返回:
+            dict: 目錄索引 -> 關鍵詞匹配得分
+        """
+        # 每筆貢獻記錄 (相關詞位置, 提取關鍵詞順序, 分數)，最後依原本的比對順序加總
+        contributions = defaultdict(list)
+        for order, (keyword, weight) in enumerate(weights.items()):
+            # 熱門關鍵字直接匹配
+            for index in self._keyword_postings.get(keyword, ()):
+                contributions[index].append((-1, 0, 10 * weight))
+            # 相關詞直接匹配
+            for index, position in self._related_postings.get(keyword, ()):
+                contributions[index].append((position, 0, 5 * weight))
+            # 部分匹配：只計算沒有直接匹配的相關詞
+            for term in self._matching_terms(keyword):
+                if term in weights:
+                    continue
+                for index, position in self._related_postings[term]:
+                    contributions[index].append((position, order, 2 * weight))
+
+        scores = {}
+        for index, items in contributions.items():
+            items.sort(key=lambda item: (item[0], item[1]))
+            score = 0
+            for _, _, value in items:
+                score += value
+            scores[index] = score
+        return scores
+
+    def _ranked(self, final_scores):
+        """依最終得分由高到低（同分時依目錄順序）產生 (得分, 目錄索引)"""
+        matched = sorted(final_scores.items(), key=lambda item: (-item[1], item[0]))
+        base = (i for i in self._base_order if i not in final_scores)
+        next_base = next(base, None)
+        for index, score in matched:
+            while next_base is not None and (self._base_scores[next_base], -next_base) > (score, -index):
+                yield self._base_scores[next_base], next_base
+                next_base = next(base, None)
+            yield score, index
+        while next_base is not None:
+            yield self._base_scores[next_base], next_base
+            next_base = next(base, None)
+
+    def recommend(self, keywords, max_keywords=5):
+        """
+        根據提取的關鍵詞推薦熱門關鍵字
+
+        參數:
+            keywords (list): 提取的關鍵詞列表，每個元素是 (關鍵詞, 權重) 的元組
+            max_keywords (int): 返回的熱門關鍵字數量
+
+        返回:
+            list: 熱門關鍵字列表，每個元素是一個字典，包含關鍵字、熱門度和相關詞
+        """
+        weights = {k: w for k, w in keywords}
+
+        # 最終得分：關鍵詞匹配得分 * 0.7 + 熱門度 * 0.3；沒有匹配時只考慮熱門度 * 0.1
+        final_scores = {}
+        for index, score in self._match_scores(weights).items():
+            popularity_factor = self.entries[index]['popularity'] / 100
+            final_scores[index] = (score * 0.7 + popularity_factor * 0.3) if score > 0 else popularity_factor * 0.1
+
+        ranked = []
+        for score, index in self._ranked(final_scores):
+            if len(ranked) >= max_keywords:
+                break
+            ranked.append((score, index))
+
+        # 得分大於 0.1 的項目數量
+        high_count = sum(1 for score in final_scores.values() if score > 0.1)
+        high_count += sum(1 for i in self._base_order[:self._high_base_count] if i not in final_scores)
+
+        # 如果沒有足夠的相關熱門關鍵字，依熱門度補充其他關鍵字
+        if high_count < max_keywords:
+            top_keywords = {self.entries[index]['keyword'] for _, index in ranked}
+            needed = max_keywords - high_count
+            additional = []
+            for index in self._popularity_order:
+                if len(additional) >= needed:
+                    break
+                if self.entries[index]['keyword'] not in top_keywords:
+                    additional.append(index)
+            # 補充的關鍵字給予較低的得分，同分時排在原有項目之後
+            candidates = [(score, rank, index) for rank, (score, index) in enumerate(ranked)]
+            candidates += [(0.05, len(self.entries) + j, index) for j, index in enumerate(additional)]
+            candidates.sort(key=lambda item: (-item[0], item[1]))
+            ranked = [(score, index) for score, _, index in candidates[:max_keywords]]
+
+        # 確保返回的關鍵字是唯一的
+        seen_keywords = set()
+        unique_result = []
+        for _, index in ranked:
+            entry = self.entries[index]
+            if entry['keyword'] not in seen_keywords:
+                seen_keywords.add(entry['keyword'])
+                unique_result.append({
+                    'keyword': entry['keyword'],
+                    'popularity': entry['popularity'],
+                    'related': list(entry['related'])
+                })
+        return unique_result
@@ -0,0 +1,256 @@
+"""
+負載測試工具
+以逐步增加的並行使用者數量（closed loop：每個使用者收到回應後立即送出下一個請求）呼叫 /predict，
+記錄每個並行數量的吞吐量、延遲百分位數與錯誤率，找出吞吐量不再增加的飽和點
+
+預設會為每種模式各啟動一個 gunicorn 服務（gunicorn.conf.py）：
+    llm   標題由 Gemini 生成，API 指向本地模擬伺服器（fake_gemini.py），可以設定延遲、錯誤率與 429 比例
+    mock  未設定 GEMINI_API_KEY，標題由 mock_generate_titles 生成
+
+使用方式:
+    python load_test.py --modes llm mock --concurrency 1 2 4 8 16 32 --duration 10 --output load.json
+    python load_test.py --modes llm --gemini-latency-ms 1200 --gemini-rate-limit-rate 0.05
+    # 對已啟動的服務執行（不另外啟動 gunicorn）
+    python load_test.py --url http://127.0.0.1:5000 --concurrency 1 4 16
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+import requests
+# 導入 Gemini API 模擬伺服器
+from fake_gemini import FakeGeminiConfig, start_server
+# 與基準測試使用相同的測試文章
+from benchmark import DEFAULT_CORPUS, load_posts
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class AppServer:
+    """以 gunicorn 啟動服務，等待 /ready 後才開始測試"""
+
+    def __init__(self, env, ready_timeout=120.0):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = dict(env, GUNICORN_BIND=f"127.0.0.1:{self.port}")
+        self.ready_timeout = ready_timeout
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                                        cwd=BASE_DIR, env=self.env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        give_up_at = time.monotonic() + self.ready_timeout
+        while time.monotonic() < give_up_at:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn 啟動失敗，結束代碼 {self.process.returncode}")
+            try:
+                if requests.get(f"{self.url}/ready", timeout=1).status_code == 200:
+                    return self
+            except requests.RequestException:
+                pass
+            time.sleep(0.5)
+        self.__exit__(None, None, None)
+        raise RuntimeError("等待服務就緒逾時")
+
+    def __exit__(self, *exc):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+def run_level(url, posts, concurrency, duration, unique_texts=True, timeout=60.0):
+    """
+    以固定並行數量持續送出請求
+
+    參數:
+        url (str): 服務位址
+        posts (list): 輪流使用的文章內容
+        concurrency (int): 並行使用者數量
+        duration (float): 持續秒數
+        unique_texts (bool): 在文章後加上序號，避免命中結果快取
+
+    返回:
+        dict: 吞吐量、延遲百分位數與錯誤統計
+    """
+    counter = itertools.count()
+    latencies = []
+    errors = {}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def user():
+        session = requests.Session()
+        while time.monotonic() < stop_at:
+            n = next(counter)
+            text = posts[n % len(posts)]
+            if unique_texts:
+                # 非中文字元在斷詞前就會被移除，不影響分類結果
+                text = f"{text} #{n}"
+            started = time.perf_counter()
+            try:
+                response = session.post(f"{url}/predict", json={'text': text}, timeout=timeout)
+                outcome = None if response.status_code == 200 else str(response.status_code)
+            except requests.RequestException as e:
+                outcome = type(e).__name__
+            elapsed = time.perf_counter() - started
+            with lock:
+                if outcome is None:
+                    latencies.append(elapsed)
+                else:
+                    errors[outcome] = errors.get(outcome, 0) + 1
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=user, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 最後一批請求會在期限之後才完成，以實際經過的時間計算吞吐量
+    elapsed = time.monotonic() - started
+
+    samples = np.asarray(latencies) * 1000
+    failed = sum(errors.values())
+    total = len(latencies) + failed
+    return {
+        'concurrency': concurrency,
+        'requests': total,
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(float(np.percentile(samples, 50)), 2) if len(samples) else None,
+        'p95_ms': round(float(np.percentile(samples, 95)), 2) if len(samples) else None,
+        'p99_ms': round(float(np.percentile(samples, 99)), 2) if len(samples) else None,
+        'error_rate': round(failed / total, 4) if total else 0.0,
+        'errors': errors
+    }
+
+def saturation_point(levels, min_gain=0.1, max_error_rate=0.01, latency_slo_ms=None):
+    """
+    找出飽和點：吞吐量比前一個最佳值增加不到 min_gain 之前的最後一個並行數量，
+    錯誤率超過 max_error_rate 或 p95 超過延遲目標的並行數量不計入
+
+    返回:
+        dict: 飽和時的並行數量與吞吐量，以及停止增加的原因
+    """
+    best = None
+    reason = '測試的並行數量內吞吐量仍持續增加'
+    for level in levels:
+        if level['error_rate'] > max_error_rate:
+            reason = f"並行數量 {level['concurrency']} 的錯誤率 {level['error_rate']:.2%} 超過 {max_error_rate:.2%}"
+            break
+        if latency_slo_ms and (level['p95_ms'] is None or level['p95_ms'] > latency_slo_ms):
+            reason = f"並行數量 {level['concurrency']} 的 p95 超過 {latency_slo_ms} ms"
+            break
+        if best is not None and level['throughput_rps'] < best['throughput_rps'] * (1 + min_gain):
+            reason = f"並行數量 {level['concurrency']} 的吞吐量增加不到 {min_gain:.0%}"
+            break
+        best = level
+    return {
+        'concurrency': best['concurrency'] if best else None,
+        'throughput_rps': best['throughput_rps'] if best else None,
+        'p95_ms': best['p95_ms'] if best else None,
+        'reason': reason
+    }
+
+def sweep(url, posts, args):
+    levels = []
+    for concurrency in args.concurrency:
+        level = run_level(url, posts, concurrency, args.duration, not args.allow_cache_hits)
+        logger.info(f"並行 {concurrency}: {level['throughput_rps']} 請求/秒，p95 {level['p95_ms']} ms，"
+                    f"錯誤率 {level['error_rate']:.2%}")
+        levels.append(level)
+    return {
+        'levels': levels,
+        'saturation': saturation_point(levels, args.min_gain, args.max_error_rate, args.latency_slo_ms)
+    }
+
+def mode_environment(mode, gemini_url):
+    env = dict(os.environ)
+    env.setdefault('LOG_LEVEL', 'WARNING')
+    if mode == 'llm':
+        env['GEMINI_API_KEY'] = 'fake'
+        env['GEMINI_API_BASE'] = gemini_url
+    else:
+        env.pop('GEMINI_API_KEY', None)
+        if os.path.exists(os.path.join(BASE_DIR, '.env')):
+            logger.warning("mock 模式：.env 檔案中若設定了 GEMINI_API_KEY，服務仍會呼叫 Gemini API")
+    return env
+
+def print_report(results):
+    for mode, result in results.items():
+        print(f"\n[{mode}]")
+        print(f"{'並行':>6}{'請求/秒':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'錯誤率':>8}")
+        for level in result['levels']:
+            print(f"{level['concurrency']:>6}{level['throughput_rps']:>12.1f}{level['p50_ms'] or 0:>10.1f}"
+                  f"{level['p95_ms'] or 0:>10.1f}{level['p99_ms'] or 0:>10.1f}{level['error_rate']:>10.2%}")
+        saturation = result['saturation']
+        print(f"飽和點: 並行 {saturation['concurrency']}，{saturation['throughput_rps']} 請求/秒（{saturation['reason']}）")
+
+def main():
+    parser = argparse.ArgumentParser(description='以逐步增加的並行數量對 /predict 進行負載測試')
+    parser.add_argument('--modes', nargs='+', choices=['llm', 'mock'], default=['llm', 'mock'],
+                        help='測試的標題生成模式，各自啟動一個 gunicorn 服務')
+    parser.add_argument('--url', default=None, help='對已啟動的服務執行，不另外啟動 gunicorn')
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 2, 4, 8, 16, 32], help='並行使用者數量')
+    parser.add_argument('--duration', type=float, default=10.0, help='每個並行數量持續的秒數')
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help='文章 CSV 檔案')
+    parser.add_argument('--limit', type=int, default=500, help='使用的文章數量')
+    parser.add_argument('--allow-cache-hits', action='store_true', help='不在文章後加上序號，允許命中結果快取')
+    parser.add_argument('--min-gain', type=float, default=0.1, help='吞吐量增加不到此比例即視為飽和')
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help='視為飽和的錯誤率')
+    parser.add_argument('--latency-slo-ms', type=float, default=None, help='視為飽和的 p95 延遲（毫秒）')
+    parser.add_argument('--gemini-latency-ms', type=float, default=800.0, help='模擬 Gemini API 的平均延遲')
+    parser.add_argument('--gemini-jitter-ms', type=float, default=200.0, help='模擬 Gemini API 延遲的變動範圍')
+    parser.add_argument('--gemini-error-rate', type=float, default=0.0, help='模擬 Gemini API 回應 500 的比例')
+    parser.add_argument('--gemini-rate-limit-rate', type=float, default=0.0, help='模擬 Gemini API 回應 429 的比例')
+    parser.add_argument('--gemini-retry-after', type=float, default=1.0, help='429 回應的 Retry-After 秒數')
+    parser.add_argument('--output', default=None, help='將結果寫入 JSON 檔案')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    posts = load_posts(args.corpus, args.limit)
+    results = {}
+    if args.url:
+        results['external'] = sweep(args.url.rstrip('/'), posts, args)
+    else:
+        gemini_config = FakeGeminiConfig(args.gemini_latency_ms, args.gemini_jitter_ms, args.gemini_error_rate,
+                                         args.gemini_rate_limit_rate, args.gemini_retry_after)
+        gemini_server = start_server(gemini_config)
+        gemini_url = f"http://127.0.0.1:{gemini_server.server_address[1]}"
+        try:
+            for mode in args.modes:
+                logger.info(f"啟動 {mode} 模式的服務")
+                with AppServer(mode_environment(mode, gemini_url)) as server:
+                    results[mode] = sweep(server.url, posts, args)
+                if mode == 'llm':
+                    results[mode]['gemini_responses'] = dict(gemini_config.counts)
+        finally:
+            gemini_server.shutdown()
+
+    print_report(results)
+    if args.output:
+        report = {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'settings': {key: value for key, value in vars(args).items() if key != 'output'},
+            'results': results
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
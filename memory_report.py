@@ -0,0 +1,105 @@
+"""
+記憶體使用報告
+讀取 /proc/<pid>/smaps_rollup，區分各程序與其他程序共用的分頁（preload 後 fork 的模型與詞典）和私有分頁
+
+使用方式:
+    python memory_report.py <gunicorn master pid>
+    python memory_report.py --pidfile gunicorn.pid
+"""
+import argparse
+import os
+
+# smaps_rollup 中要讀取的欄位（單位為 kB）
+SMAPS_FIELDS = {
+    'Rss': 'rss',
+    'Pss': 'pss',
+    'Shared_Clean': 'shared_clean',
+    'Shared_Dirty': 'shared_dirty',
+    'Private_Clean': 'private_clean',
+    'Private_Dirty': 'private_dirty'
+}
+
+def process_memory(pid='self'):
+    """
+    讀取單一程序的記憶體使用量
+
+    參數:
+        pid: 程序編號，預設為目前程序
+
+    返回:
+        dict: rss、pss、shared、private（位元組），無法讀取（例如非 Linux 系統）時返回 None
+    """
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', encoding='ascii') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].rstrip(':') in SMAPS_FIELDS:
+                    values[SMAPS_FIELDS[parts[0].rstrip(':')]] = int(parts[1]) * 1024
+    except OSError:
+        return None
+    if 'rss' not in values:
+        return None
+    return {
+        'rss': values['rss'],
+        'pss': values.get('pss', 0),
+        'shared': values.get('shared_clean', 0) + values.get('shared_dirty', 0),
+        'private': values.get('private_clean', 0) + values.get('private_dirty', 0)
+    }
+
+def child_pids(parent_pid):
+    """列出指定程序的子程序"""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', encoding='ascii', errors='replace') as f:
+                # 程序名稱可能包含空白，從最後一個右括號之後開始解析
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == parent_pid:
+            children.append(int(entry))
+    return sorted(children)
+
+def report(master_pid):
+    """
+    產生 master 與所有 worker 的記憶體報告
+
+    返回:
+        list: 每個程序的 dict，包含 pid、role 和記憶體使用量
+    """
+    rows = []
+    for role, pid in [('master', master_pid)] + [('worker', pid) for pid in child_pids(master_pid)]:
+        memory = process_memory(pid)
+        if memory is not None:
+            rows.append(dict(pid=pid, role=role, **memory))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='顯示 gunicorn master 與 worker 的共用與私有記憶體')
+    parser.add_argument('pid', nargs='?', type=int, help='gunicorn master 的程序編號')
+    parser.add_argument('--pidfile', help='gunicorn 的 pid 檔案')
+    args = parser.parse_args()
+
+    master_pid = args.pid
+    if master_pid is None:
+        if not args.pidfile:
+            parser.error('請提供 master pid 或 --pidfile')
+        with open(args.pidfile, encoding='ascii') as f:
+            master_pid = int(f.read().strip())
+
+    rows = report(master_pid)
+    mb = 1024 * 1024
+    print(f"{'pid':>8} {'role':<7} {'RSS MB':>9} {'PSS MB':>9} {'共用 MB':>9} {'私有 MB':>9}")
+    for row in rows:
+        print(f"{row['pid']:>8} {row['role']:<7} {row['rss'] / mb:>9.1f} {row['pss'] / mb:>9.1f} "
+              f"{row['shared'] / mb:>9.1f} {row['private'] / mb:>9.1f}")
+    if rows:
+        # PSS 將共用分頁平均分攤到各程序，加總即為實際佔用的記憶體
+        print(f"合計 RSS {sum(r['rss'] for r in rows) / mb:.1f} MB，實際佔用（PSS 合計）"
+              f"{sum(r['pss'] for r in rows) / mb:.1f} MB")
+
+if __name__ == '__main__':
+    main()
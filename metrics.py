@@ -0,0 +1,188 @@
+"""
+效能指標模組
+以計時區段（span）記錄各處理階段的耗時，彙整為直方圖，並以 Prometheus 文字格式輸出
+
+- span(stage)：記錄一個階段的耗時到 stage_duration_seconds 直方圖
+- increment(name, **labels)：累加計數器
+- start_profile() / finish_profile()：記錄單一請求經過的各階段耗時（用於回應的 Server-Timing 標頭）
+
+指標存在各個程序的記憶體中，gunicorn 的每個 worker 各自統計
+"""
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+NAMESPACE = 'dcard_post_helper'
+
+# 直方圖的區間上限（秒），涵蓋次毫秒的快取命中到數秒的 Gemini API 呼叫
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """固定區間的直方圖，只保存每個區間的次數、總和與總次數"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """返回 (區間上限, 累計次數) 列表，最後一個區間上限為 +Inf"""
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+def _key(name, labels):
+    # 標籤值一律轉為字串，狀態碼（int）與其他值（str）可以一起排序
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+class MetricsRegistry:
+    """直方圖與計數器的集合，以 (名稱, 標籤) 為鍵"""
+
+    def __init__(self):
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            # fork 出的 worker 從零開始統計，不重複計入主程序暖機時的數值
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name, amount=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def snapshot(self):
+        """返回目前所有直方圖與計數器的複本"""
+        with self._lock:
+            histograms = {key: (h.cumulative(), h.sum, h.count) for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+        return histograms, counters
+
+registry = MetricsRegistry()
+
+# 目前請求的各階段耗時，未啟用時為 None
+_profile = contextvars.ContextVar('profile', default=None)
+
+def observe(name, value, **labels):
+    registry.observe(name, value, **labels)
+
+def increment(name, amount=1, **labels):
+    registry.increment(name, amount, **labels)
+
+@contextmanager
+def span(stage):
+    """
+    計時一個處理階段，耗時記錄到 stage_duration_seconds{stage=...}；
+    目前請求啟用了 profile 時同時記錄到 profile
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        registry.observe('stage_duration_seconds', elapsed, stage=stage)
+        profile = _profile.get()
+        if profile is not None:
+            profile.append((stage, elapsed))
+
+def start_profile():
+    """開始記錄目前請求的各階段耗時，返回用於 finish_profile 的 token"""
+    return _profile.set([])
+
+def finish_profile(token):
+    """
+    結束記錄並返回各階段耗時
+
+    返回:
+        list: (階段名稱, 秒數) 列表，同一階段出現多次時分別列出
+    """
+    profile = _profile.get() or []
+    _profile.reset(token)
+    return profile
+
+def run_in_context(fn):
+    """包裝函數，讓它在其他執行緒執行時仍然使用目前的 profile"""
+    context = contextvars.copy_context()
+
+    def wrapper(*args, **kwargs):
+        return context.run(fn, *args, **kwargs)
+    return wrapper
+
+def server_timing(profile):
+    """將 profile 轉換為 Server-Timing 標頭的內容（毫秒）"""
+    totals = {}
+    for stage, elapsed in profile:
+        totals[stage] = totals.get(stage, 0.0) + elapsed
+    return ', '.join(f"{stage};dur={elapsed * 1000:.2f}" for stage, elapsed in totals.items())
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in items)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + '}'
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+def render_prometheus(gauges=None):
+    """
+    以 Prometheus 文字格式（text/plain; version=0.0.4）輸出所有指標
+
+    參數:
+        gauges (list): 額外輸出的即時數值，每個元素為 (名稱, 標籤字典, 數值)
+
+    返回:
+        str: 指標內容
+    """
+    histograms, counters = registry.snapshot()
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+        full_name = f"{NAMESPACE}_{name}"
+        declare(full_name, 'histogram')
+        for bound, cumulative in buckets:
+            lines.append(f"{full_name}_bucket{_format_labels(labels, [('le', _format_bound(bound))])} {cumulative}")
+        lines.append(f"{full_name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"{full_name}_count{_format_labels(labels)} {count}")
+
+    for (name, labels), value in sorted(counters.items()):
+        full_name = f"{NAMESPACE}_{name}"
+        declare(full_name, 'counter')
+        lines.append(f"{full_name}{_format_labels(labels)} {value}")
+
+    # 同名的指標必須連續輸出
+    for name, labels, value in sorted(gauges or [], key=lambda gauge: gauge[0]):
+        full_name = f"{NAMESPACE}_{name}"
+        declare(full_name, 'gauge')
+        lines.append(f"{full_name}{_format_labels(sorted(labels.items()))} {value}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,174 @@
+"""
+近似重複文章索引
+使用者修改草稿後重新送出時，內容只差幾個字，精確雜湊的快取鍵就會不同。
+以分詞結果計算 64 位元 SimHash，漢明距離在門檻內即視為同一篇草稿，
+可以沿用上一版的標題與熱門關鍵字，只重新執行分類器
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+
+FINGERPRINT_BITS = 64
+_BIT_SHIFTS = np.arange(FINGERPRINT_BITS, dtype=np.uint64)
+
+@lru_cache(maxsize=131072)
+def _feature_hash(feature):
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def simhash(words):
+    """
+    計算 SimHash 指紋
+
+    特徵為詞彙與相鄰詞對（保留詞序），出現次數即為權重；
+    每個位元取所有特徵雜湊在該位元的加權多數
+
+    參數:
+        words (list): 詞彙列表
+
+    返回:
+        int: 64 位元指紋，沒有任何詞彙時返回 None
+    """
+    features = {}
+    previous = None
+    for word in words:
+        features[word] = features.get(word, 0) + 1
+        if previous is not None:
+            pair = previous + ' ' + word
+            features[pair] = features.get(pair, 0) + 1
+        previous = word
+    if not features:
+        return None
+    hashes = np.fromiter((_feature_hash(feature) for feature in features), dtype=np.uint64, count=len(features))
+    weights = np.fromiter(features.values(), dtype=np.float64, count=len(features))
+    bits = ((hashes[:, None] >> _BIT_SHIFTS) & np.uint64(1)).astype(np.float64)
+    # 位元為 1 時加上權重、為 0 時減去權重
+    votes = weights @ (2 * bits - 1)
+    return int(np.sum(np.left_shift(np.uint64(1), _BIT_SHIFTS[votes > 0]), dtype=np.uint64))
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+class NearDuplicateIndex:
+    """
+    最近分析過的文章的 SimHash 索引
+
+    - 指紋切成 max_distance + 1 段，漢明距離不超過 max_distance 的兩個指紋至少有一段完全相同（鴿籠原理），
+      查詢時只需要比對同一段相同的候選項目
+    - 項目超過 ttl 秒或數量超過 max_entries 時由最舊的開始淘汰
+    - 索引在各個程序的記憶體中，gunicorn 的每個 worker 各自維護
+    """
+
+    def __init__(self, max_distance=6, ttl=600.0, max_entries=10000):
+        """
+        參數:
+            max_distance (int): 視為近似重複的最大漢明距離
+            ttl (float): 項目存活秒數
+            max_entries (int): 最多保留的項目數量
+        """
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.max_entries = max_entries
+        bounds = np.linspace(0, FINGERPRINT_BITS, max_distance + 2).astype(int)
+        # 每一段的 (位移, 遮罩)
+        self._bands = [(int(start), (1 << int(end - start)) - 1) for start, end in zip(bounds[:-1], bounds[1:])]
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        # 指紋 -> (到期時間, 類別, 內容)，依加入順序排列
+        self._entries = OrderedDict()
+        self._buckets = [{} for _ in self._bands]
+        self.hits = 0
+        self.misses = 0
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    def _band_keys(self, fingerprint):
+        return [(fingerprint >> shift) & mask for shift, mask in self._bands]
+
+    def _remove(self, fingerprint):
+        self._entries.pop(fingerprint)
+        for bucket, key in zip(self._buckets, self._band_keys(fingerprint)):
+            members = bucket.get(key)
+            if members is not None:
+                members.discard(fingerprint)
+                if not members:
+                    del bucket[key]
+
+    def _evict(self, now):
+        while self._entries:
+            fingerprint, (expires_at, _, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            self._remove(fingerprint)
+
+    def add(self, fingerprint, category, payload):
+        """
+        記錄一篇已分析的文章
+
+        參數:
+            fingerprint (int): simhash() 的結果
+            category (str): 文章類別，內容只會被同類別的文章沿用
+            payload (dict): 可以沿用的結果（例如標題與熱門關鍵字）
+        """
+        if fingerprint is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if fingerprint in self._entries:
+                self._remove(fingerprint)
+            self._entries[fingerprint] = (now + self.ttl, category, payload)
+            for bucket, key in zip(self._buckets, self._band_keys(fingerprint)):
+                bucket.setdefault(key, set()).add(fingerprint)
+            self._evict(now)
+
+    def find(self, fingerprint, category):
+        """
+        尋找同類別且漢明距離最小的近似重複文章
+
+        返回:
+            dict: 該文章的內容，找不到時返回 None
+        """
+        if fingerprint is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            candidates = set()
+            for bucket, key in zip(self._buckets, self._band_keys(fingerprint)):
+                candidates.update(bucket.get(key, ()))
+            best, best_distance = None, self.max_distance + 1
+            for candidate in candidates:
+                _, candidate_category, payload = self._entries[candidate]
+                distance = hamming_distance(fingerprint, candidate)
+                if candidate_category == category and distance < best_distance:
+                    best, best_distance = payload, distance
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return best
+
+    def clear(self):
+        """移除所有項目，命中統計保留"""
+        with self._lock:
+            self._entries.clear()
+            for bucket in self._buckets:
+                bucket.clear()
+
+    def stats(self):
+        """返回項目數量與命中統計"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
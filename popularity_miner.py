@@ -0,0 +1,323 @@
+"""
+熱門關鍵字挖掘工具
+離線分析 raw_data 下的看板文章，依發文時間衰減與留言數計算各看板關鍵字的熱門度，
+輸出 keyword_extractor 使用的熱門關鍵字目錄（dict/popular_keywords.jsonl）
+
+使用方式:
+    python popularity_miner.py
+    python popularity_miner.py raw_data/心情板.csv --half-life-days 3 --workers 8 --output dict/popular_keywords.jsonl
+
+- CSV 以 chunksize 分段讀取，任何時候只有固定數量的分段在記憶體中
+- 各分段的斷詞與關鍵詞提取在多個程序中平行執行
+- 每個看板只保留有限數量的候選關鍵字與共現詞，重複文章以固定大小的 Bloom filter 判斷；
+  計算 IDF 的文章數另外完整累計（大小由詞彙量決定），不受候選詞篩選影響
+"""
+import argparse
+import hashlib
+import heapq
+import logging
+import math
+import os
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import pandas as pd
+# 導入共用分詞與關鍵詞提取
+from tokenizer import NON_CJK_PATTERN, segment
+from keyword_extractor import extract_tfidf_keywords
+from keyword_catalog import DEFAULT_CATALOG_PATH, GENERAL_BOARD, write_catalog
+
+# 設置日誌
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RAW_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'raw_data')
+DEFAULT_INPUTS = [
+    os.path.join(RAW_DATA_DIR, name)
+    for name in ('心情板.csv', '感情板.csv', '閒聊板.csv', 'merge_from_ofoct.csv')
+]
+USE_COLUMNS = ['artUrl', 'artDate', 'artTitle', 'artContent', 'boardID', 'commentCount']
+
+class BoardStats:
+    """
+    單一看板的關鍵字統計
+
+    - scores: 關鍵字 -> 時間衰減與留言加權後的熱門度分數
+    - posts: 關鍵字 -> 出現的文章數
+    - pairs: 關鍵字 -> 共現關鍵字 -> 共現分數，用於產生相關詞
+    """
+
+    __slots__ = ('scores', 'posts', 'pairs')
+
+    def __init__(self):
+        self.scores = Counter()
+        self.posts = Counter()
+        self.pairs = defaultdict(Counter)
+
+    def add_post(self, keywords, weight):
+        """加入一篇文章的關鍵詞列表 [(關鍵詞, TF-IDF 權重)]"""
+        for word, keyword_weight in keywords:
+            self.scores[word] += weight * keyword_weight
+            self.posts[word] += 1
+        for i, (word, _) in enumerate(keywords):
+            for other, _ in keywords[i + 1:]:
+                self.pairs[word][other] += weight
+                self.pairs[other][word] += weight
+
+    def merge(self, other):
+        """合併另一份統計"""
+        self.scores.update(other.scores)
+        self.posts.update(other.posts)
+        for word, related in other.pairs.items():
+            self.pairs[word].update(related)
+
+    def prune(self, max_candidates, max_pairs):
+        """只保留分數最高的候選關鍵字，以及每個關鍵字分數最高的共現詞"""
+        if len(self.scores) > max_candidates:
+            kept = heapq.nlargest(max_candidates, self.scores.items(), key=lambda item: item[1])
+            self.scores = Counter(dict(kept))
+            self.posts = Counter({word: self.posts[word] for word in self.scores})
+            self.pairs = defaultdict(Counter, {word: self.pairs[word] for word in self.scores if word in self.pairs})
+        for word, related in self.pairs.items():
+            if len(related) > max_pairs:
+                self.pairs[word] = Counter(dict(related.most_common(max_pairs)))
+
+def post_weight(art_date, comment_count, reference_time, half_life_days):
+    """
+    計算單篇文章的權重：熱門度隨發文時間以半衰期遞減，留言數以對數加權
+
+    參數:
+        art_date (float): 發文時間（Unix 秒數）
+        comment_count (float): 留言數
+        reference_time (float): 計算衰減的基準時間（Unix 秒數）
+        half_life_days (float): 半衰期天數
+    """
+    age_days = max(0.0, (reference_time - art_date) / 86400)
+    decay = 0.5 ** (age_days / half_life_days)
+    return decay * (1 + math.log1p(max(0.0, comment_count)))
+
+def is_catalog_keyword(word):
+    """熱門關鍵字只保留兩個字以上的中文詞"""
+    return len(word) > 1 and not NON_CJK_PATTERN.search(word)
+
+def process_chunk(records, reference_time, half_life_days, keywords_per_post):
+    """
+    在 worker 程序中處理一個分段的文章
+
+    參數:
+        records (list): (看板, 文章內容, 發文時間, 留言數) 的列表
+
+    返回:
+        dict: 看板 -> BoardStats
+    """
+    boards = defaultdict(BoardStats)
+    for board, text, art_date, comment_count in records:
+        keywords = [
+            (word, weight)
+            for word, weight in extract_tfidf_keywords(segment(text), keywords_per_post * 2)
+            if is_catalog_keyword(word)
+        ][:keywords_per_post]
+        if keywords:
+            boards[board].add_post(keywords, post_weight(art_date, comment_count, reference_time, half_life_days))
+    return dict(boards)
+
+class SeenUrls:
+    """
+    以固定大小的 Bloom filter 記錄看過的文章網址，記憶體用量只由 capacity 決定，與資料筆數無關
+
+    不會漏掉重複的文章；文章數超過 capacity 後誤判率逐漸上升，誤判的文章會被當成重複而略過，
+    只少算熱門度統計的少數樣本
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        """
+        參數:
+            capacity (int): 預計的文章數量
+            error_rate (float): 文章數未超過 capacity 時的誤判率
+        """
+        self.num_bits = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def add(self, url):
+        """記錄網址，已經看過（或誤判為看過）時返回 False"""
+        digest = hashlib.blake2b(url.encode('utf-8'), digest_size=16).digest()
+        # 以兩個雜湊值組合出 num_hashes 個位置（double hashing）
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        added = False
+        for i in range(self.num_hashes):
+            position = (first + i * second) % self.num_bits
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        return added
+
+def iter_chunks(paths, chunk_size, seen_urls):
+    """
+    分段讀取 CSV，略過重複的表頭列與重複的文章（merge_from_ofoct.csv 與各看板檔案重疊）
+
+    參數:
+        seen_urls (SeenUrls): 看過的文章網址
+
+    產生:
+        (list, int): 該分段的文章記錄與讀取的列數
+    """
+    for path in paths:
+        logger.info(f"讀取 {path}")
+        reader = pd.read_csv(path, usecols=USE_COLUMNS, chunksize=chunk_size, dtype=str,
+                             encoding='utf-8-sig', keep_default_na=False)
+        for frame in reader:
+            frame = frame[(frame['boardID'] != 'boardID') & (frame['boardID'] != '')]
+            dates = pd.to_datetime(frame['artDate'], errors='coerce')
+            comments = pd.to_numeric(frame['commentCount'], errors='coerce').fillna(0)
+            records = []
+            for url, date, title, content, board, comment_count in zip(
+                    frame['artUrl'], dates, frame['artTitle'], frame['artContent'], frame['boardID'], comments):
+                if pd.isna(date):
+                    continue
+                if url and not seen_urls.add(url):
+                    continue
+                records.append((board, f"{title}\n{content}", date.timestamp(), float(comment_count)))
+            yield records, len(frame)
+
+def build_catalog(stats, document_counts, total_posts, top_n, num_related, min_posts, max_df):
+    """
+    將統計結果轉換為熱門關鍵字列表
+
+    「真的」、「知道」這類各看板都常見的詞沒有鑑別度：出現在超過 max_df 比例文章中的詞直接排除，
+    其餘分數再乘上整個語料的 IDF（log(文章總數 / 出現文章數)）；熱門度以看板內最高分為 100 線性縮放
+
+    參數:
+        stats (BoardStats): 看板的統計
+        document_counts (Counter): 關鍵字 -> 所有看板中出現的文章數（在候選關鍵字篩選之前累計，不會缺少任何候選詞）
+        total_posts (int): 文章總數
+        max_df (float): 關鍵字可以出現的文章比例上限
+
+    返回:
+        list: 每個元素包含 keyword、popularity 和 related
+    """
+    max_posts = max_df * total_posts
+
+    def distinctive(word):
+        # 沒有文章數的詞無法計算 IDF，直接略過
+        return 0 < document_counts[word] <= max_posts and document_counts[word] < total_posts
+
+    candidates = [
+        (score * math.log(total_posts / document_counts[word]), word)
+        for word, score in stats.scores.items()
+        if stats.posts[word] >= min_posts and distinctive(word)
+    ]
+    top = heapq.nlargest(top_n, candidates)
+    if not top:
+        return []
+    max_score = top[0][0]
+    entries = []
+    for score, word in top:
+        related = [other for other, _ in stats.pairs.get(word, Counter()).most_common() if distinctive(other)]
+        related = related[:num_related]
+        entries.append({
+            'keyword': word,
+            'popularity': max(1, round(score / max_score * 100)),
+            'related': related
+        })
+    return entries
+
+def mine(paths, output, workers=None, chunk_size=2000, half_life_days=7.0, reference_date=None,
+         keywords_per_post=8, top_n=30, num_related=3, min_posts=3, max_df=0.08, max_candidates=20000, max_pairs=50,
+         dedupe_capacity=5000000):
+    """
+    執行挖掘並寫入熱門關鍵字目錄
+
+    參數:
+        paths (list): 輸入的 CSV 檔案
+        output (str): 輸出的目錄檔案路徑
+        workers (int): worker 程序數量，預設為 CPU 核心數
+        chunk_size (int): 每個分段的列數
+        half_life_days (float): 熱門度的半衰期天數
+        reference_date (str): 計算時間衰減的基準日期，預設為目前時間
+        keywords_per_post (int): 每篇文章取用的關鍵詞數量
+        top_n (int): 每個看板輸出的熱門關鍵字數量
+        num_related (int): 每個熱門關鍵字的相關詞數量
+        min_posts (int): 熱門關鍵字至少要出現的文章數
+        max_df (float): 關鍵字可以出現的文章比例上限，超過時視為沒有鑑別度的常用詞
+        max_candidates (int): 每個看板保留的候選關鍵字上限
+        max_pairs (int): 每個候選關鍵字保留的共現詞上限
+        dedupe_capacity (int): 判斷重複文章的預計文章數量（Bloom filter 約使用 capacity * 1.8 位元組）
+
+    返回:
+        dict: 看板 -> 熱門關鍵字列表
+    """
+    reference_time = pd.Timestamp(reference_date).timestamp() if reference_date else time.time()
+    workers = workers or os.cpu_count() or 1
+    totals = defaultdict(BoardStats)
+    # 各關鍵字在所有看板出現的文章數，在篩選候選關鍵字之前累計（只有詞與計數，大小由詞彙量決定）
+    document_counts = Counter()
+    seen_urls = SeenUrls(dedupe_capacity)
+    rows = posts = 0
+    started = time.perf_counter()
+
+    def collect(future):
+        for board, stats in future.result().items():
+            document_counts.update(stats.posts)
+            totals[board].merge(stats)
+            totals[board].prune(max_candidates, max_pairs)
+
+    # 最多同時有 workers * 2 個分段在處理中，讀取速度不會讓記憶體無限增長
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for records, chunk_rows in iter_chunks(paths, chunk_size, seen_urls):
+            rows += chunk_rows
+            posts += len(records)
+            if records:
+                pending.add(executor.submit(process_chunk, records, reference_time, half_life_days, keywords_per_post))
+            while len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future)
+            elapsed = time.perf_counter() - started
+            logger.info(f"已讀取 {rows} 列、{posts} 篇文章（{rows / elapsed:.0f} 列/秒）")
+        for future in pending:
+            collect(future)
+
+    general = BoardStats()
+    for stats in totals.values():
+        general.merge(stats)
+        general.prune(max_candidates, max_pairs)
+
+    catalog = {
+        board: build_catalog(stats, document_counts, posts, top_n, num_related, min_posts, max_df)
+        for board, stats in sorted(totals.items())
+    }
+    catalog[GENERAL_BOARD] = build_catalog(general, document_counts, posts, top_n, num_related, min_posts, max_df)
+    write_catalog(output, catalog)
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"完成：{posts} 篇文章，耗時 {elapsed:.1f} 秒（{posts / elapsed:.0f} 篇/秒），已寫入 {output}")
+    return catalog
+
+def main():
+    parser = argparse.ArgumentParser(description='從看板文章挖掘熱門關鍵字，產生熱門關鍵字目錄')
+    parser.add_argument('inputs', nargs='*', default=DEFAULT_INPUTS, help='輸入的 CSV 檔案')
+    parser.add_argument('--output', default=DEFAULT_CATALOG_PATH, help='輸出的目錄檔案路徑')
+    parser.add_argument('--workers', type=int, default=None, help='worker 程序數量，預設為 CPU 核心數')
+    parser.add_argument('--chunk-size', type=int, default=2000, help='每個分段的列數')
+    parser.add_argument('--half-life-days', type=float, default=7.0, help='熱門度的半衰期天數')
+    parser.add_argument('--reference-date', default=None, help='計算時間衰減的基準日期，預設為目前時間')
+    parser.add_argument('--keywords-per-post', type=int, default=8, help='每篇文章取用的關鍵詞數量')
+    parser.add_argument('--top-n', type=int, default=30, help='每個看板輸出的熱門關鍵字數量')
+    parser.add_argument('--related', type=int, default=3, help='每個熱門關鍵字的相關詞數量')
+    parser.add_argument('--min-posts', type=int, default=3, help='熱門關鍵字至少要出現的文章數')
+    parser.add_argument('--max-df', type=float, default=0.08, help='關鍵字可以出現的文章比例上限')
+    parser.add_argument('--dedupe-capacity', type=int, default=5000000,
+                        help='判斷重複文章的預計文章數量，決定去重使用的固定記憶體大小')
+    args = parser.parse_args()
+
+    mine(args.inputs, args.output, workers=args.workers, chunk_size=args.chunk_size,
+         half_life_days=args.half_life_days, reference_date=args.reference_date,
+         keywords_per_post=args.keywords_per_post, top_n=args.top_n, num_related=args.related,
+         min_posts=args.min_posts, max_df=args.max_df, dedupe_capacity=args.dedupe_capacity)
+
+if __name__ == '__main__':
+    main()
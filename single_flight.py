@@ -0,0 +1,145 @@
+"""
+相同內容的同時請求合併（single-flight）
+熱門範本文章或用戶端重試時，同一篇文章會同時送出多次；結果快取要等第一個請求完成才會命中，
+在那之前每個請求都會各自執行分類器並呼叫 Gemini API。
+同一個鍵的計算進行中時，後到的呼叫直接等待並共用該次計算的結果（或例外）
+"""
+import os
+import threading
+from concurrent.futures import Future
+# 導入效能指標模組
+from metrics import increment
+
+class SingleFlight:
+    """
+    一個處理階段的進行中計算，以鍵（例如正規化文本的雜湊值）合併同時的呼叫
+
+    - 同一個鍵的呼叫在執行緒中等待（do、do_batch）或取得共用的 Future（submit）
+    - 計算完成後立即移除，之後的呼叫重新計算（或由結果快取處理）
+    - 被合併的呼叫次數記錄在 single_flight_coalesced_total{stage}
+    """
+
+    def __init__(self, name, enabled=True):
+        """
+        參數:
+            name (str): 階段名稱，作為指標的標籤
+            enabled (bool): 設為 False 時每個呼叫都各自計算
+        """
+        self.name = name
+        self.enabled = enabled
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        # 鍵 -> 進行中計算的 Future
+        self._calls = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def begin(self, key):
+        """
+        開始一次計算
+
+        返回:
+            tuple: (Future, 是否由此呼叫負責計算)；負責計算時必須以 finish() 設定結果
+        """
+        with self._lock:
+            if self.enabled:
+                future = self._calls.get(key)
+                if future is not None:
+                    self.coalesced += 1
+                    increment('single_flight_coalesced_total', stage=self.name)
+                    return future, False
+            future = Future()
+            if self.enabled:
+                self._calls[key] = future
+            self.calls += 1
+        return future, True
+
+    def finish(self, key, future, result=None, exception=None):
+        """設定計算結果，正在等待的呼叫會取得同一個結果或例外"""
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn, *args, **kwargs):
+        """執行 fn(*args, **kwargs)，同一個鍵的計算進行中時等待並返回它的結果"""
+        future, leader = self.begin(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self.finish(key, future, exception=e)
+            raise
+        self.finish(key, future, result)
+        return result
+
+    def do_batch(self, keys, fn):
+        """
+        整批計算多個鍵，進行中的鍵等待其他呼叫的結果，其餘的鍵由 fn 一次計算
+
+        參數:
+            keys (list): 每個項目的鍵，同一批中重複的鍵也只計算一次
+            fn (callable): fn(indices) 返回 keys 中這些位置的結果列表
+
+        返回:
+            list: 每個鍵的結果
+        """
+        futures = []
+        leaders = []
+        for i, key in enumerate(keys):
+            future, leader = self.begin(key)
+            futures.append(future)
+            if leader:
+                leaders.append(i)
+        if leaders:
+            try:
+                results = fn(leaders)
+            except BaseException as e:
+                for i in leaders:
+                    self.finish(keys[i], futures[i], exception=e)
+                raise
+            for i, result in zip(leaders, results):
+                self.finish(keys[i], futures[i], result)
+        return [future.result() for future in futures]
+
+    def submit(self, key, start):
+        """
+        start() 開始一個背景計算並返回 Future；同一個鍵的計算進行中時不呼叫 start，直接返回共用的 Future
+        """
+        future, leader = self.begin(key)
+        if not leader:
+            return future
+        try:
+            started = start()
+        except BaseException as e:
+            self.finish(key, future, exception=e)
+            raise
+
+        def done(started):
+            if started.cancelled():
+                self.finish(key, future, exception=RuntimeError(f"{self.name} 的計算已取消"))
+            elif started.exception() is not None:
+                self.finish(key, future, exception=started.exception())
+            else:
+                self.finish(key, future, started.result())
+
+        started.add_done_callback(done)
+        return future
+
+    def stats(self):
+        """返回計算次數、被合併的呼叫次數與目前進行中的計算數量"""
+        total = self.calls + self.coalesced
+        return {
+            'in_flight': len(self._calls),
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'coalesced_rate': self.coalesced / total if total else 0.0
+        }
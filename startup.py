@@ -0,0 +1,105 @@
+"""
+啟動加速模組
+將啟動時需要解析的詞庫資料快取為二進位檔，縮短程序冷啟動與第一個請求的等待時間
+
+- jieba 的前綴詞典快取寫入專案的快取目錄（預設寫入系統暫存目錄，容器重啟後就會消失）
+- IDF 詞頻表以 marshal 格式快取，不需要每次逐行解析 4 MB 的文字檔
+- 快取檔名包含來源檔案的大小與修改時間，來源更新後自動重建
+
+快取目錄可以在建置映像檔時預先產生（python -c "import startup; startup.build_caches()"），
+新啟動的 Pod 直接讀取
+"""
+import hashlib
+import logging
+import marshal
+import os
+import tempfile
+import jieba
+
+# 設置日誌
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.getenv('STARTUP_CACHE_DIR', os.path.join(BASE_DIR, '.cache'))
+
+def _cache_path(source, prefix, cache_dir=CACHE_DIR):
+    """依來源檔案的路徑、大小與修改時間決定快取檔名"""
+    stat = os.stat(source)
+    signature = f"{os.path.abspath(source)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return os.path.join(cache_dir, f"{prefix}-{hashlib.sha1(signature.encode('utf-8')).hexdigest()[:12]}.marshal")
+
+def _write_atomic(path, data):
+    """先寫入暫存檔再取代，多個程序同時建立快取時不會讀到寫到一半的檔案"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def configure_jieba_cache(cache_dir=CACHE_DIR):
+    """讓 jieba 將前綴詞典快取寫入指定目錄，必須在 jieba 初始化之前呼叫"""
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        jieba.dt.tmp_dir = cache_dir
+    except OSError as e:
+        logger.warning(f"無法建立快取目錄，jieba 使用系統暫存目錄: {str(e)}")
+
+def load_idf_table(path, cache_dir=CACHE_DIR):
+    """
+    載入 IDF 詞頻表，優先讀取二進位快取
+
+    參數:
+        path (str): jieba 格式的 IDF 文字檔（每行「詞 IDF值」）
+        cache_dir (str): 快取目錄
+
+    返回:
+        (dict, float): 詞 -> IDF 值，以及 IDF 中位數（與 jieba 的計算方式相同）
+    """
+    cache_path = _cache_path(path, 'idf', cache_dir)
+    try:
+        with open(cache_path, 'rb') as f:
+            return marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    with open(path, 'rb') as f:
+        content = f.read().decode('utf-8')
+    idf_freq = {}
+    for line in content.splitlines():
+        word, freq = line.strip().split(' ')
+        idf_freq[word] = float(freq)
+    median_idf = sorted(idf_freq.values())[len(idf_freq) // 2]
+
+    try:
+        _write_atomic(cache_path, marshal.dumps((idf_freq, median_idf)))
+    except OSError as e:
+        logger.warning(f"無法寫入 IDF 快取: {str(e)}")
+    return idf_freq, median_idf
+
+def apply_idf_table(path, tfidf=None, cache_dir=CACHE_DIR):
+    """
+    將 IDF 詞頻表套用到 jieba 的 TF-IDF 關鍵詞提取器，效果與 jieba.analyse.set_idf_path 相同
+
+    參數:
+        path (str): IDF 文字檔路徑
+        tfidf: jieba.analyse.TFIDF 實例，預設為 jieba.analyse.default_tfidf
+    """
+    if tfidf is None:
+        import jieba.analyse
+        tfidf = jieba.analyse.default_tfidf
+    idf_freq, median_idf = load_idf_table(path, cache_dir)
+    loader = tfidf.idf_loader
+    loader.path = os.path.abspath(path)
+    loader.idf_freq, loader.median_idf = idf_freq, median_idf
+    tfidf.idf_freq, tfidf.median_idf = idf_freq, median_idf
+
+def build_caches():
+    """預先建立所有快取（建置映像檔時使用）"""
+    import keyword_extractor  # 載入時即會建立 IDF 快取並設定 jieba 快取目錄
+    jieba.initialize()
+    logger.info(f"已建立啟動快取: {CACHE_DIR}")
@@ -0,0 +1,5 @@
+"""pytest 設定：測試直接匯入專案根目錄的模組"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,48 @@
+"""微批次排程（MicroBatcher）錯誤處理的測試"""
+import pytest
+
+from batcher import MicroBatcher
+
+class Abort(BaseException):
+    """不是 Exception 子類別的例外"""
+
+def submit_all(batcher, items):
+    """一次放進佇列，讓所有資料合併成同一批"""
+    with batcher._condition:
+        futures = [batcher.submit(item) for item in items]
+    return futures
+
+def test_failed_batch_only_fails_bad_item():
+    def double(items):
+        if 'bad' in items:
+            raise ValueError('bad item')
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(double, max_batch_size=3, max_wait_ms=1000)
+    futures = submit_all(batcher, ['a', 'bad', 'c'])
+    assert futures[0].result(timeout=5) == 'aa'
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=5)
+    assert futures[2].result(timeout=5) == 'cc'
+    assert batcher.stats()['item_errors'] == 1
+
+def test_base_exception_does_not_stop_worker():
+    def abort_once(items):
+        if items == ['abort']:
+            raise Abort()
+        return [item.upper() for item in items]
+
+    batcher = MicroBatcher(abort_once, max_batch_size=1, max_wait_ms=1)
+    with pytest.raises(Abort):
+        batcher.submit('abort').result(timeout=5)
+    # 執行緒仍在處理後續的請求
+    assert batcher.submit('ok').result(timeout=5) == 'OK'
+
+def test_missing_results_fail_remaining_futures():
+    batcher = MicroBatcher(lambda items: [item + 1 for item in items[:1]], max_batch_size=3, max_wait_ms=1000)
+    futures = submit_all(batcher, [1, 2, 3])
+    assert futures[0].result(timeout=5) == 2
+    for future in futures[1:]:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+    assert batcher.stats()['errors'] == 1
@@ -0,0 +1,87 @@
+"""Gemini API 用戶端（斷路器與 429 Retry-After）的測試，以 fake_gemini 的模擬伺服器回應"""
+import time
+
+import pytest
+
+from fake_gemini import FakeGeminiConfig, start_server
+from gemini_client import CircuitBreaker, CircuitOpenError, GeminiClient, GeminiError
+
+@pytest.fixture
+def fake_gemini():
+    config = FakeGeminiConfig(latency_ms=0.0, seed=0)
+    server = start_server(config)
+    yield config, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def make_client(api_base, breaker, max_retries=1, deadline=5.0):
+    return GeminiClient('test', api_base=api_base, pool_size=2, deadline=deadline, max_retries=max_retries,
+                        breaker=breaker)
+
+def test_circuit_breaker_opens_and_recovers(fake_gemini):
+    config, api_base = fake_gemini
+    config.error_rate = 1.0
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+    client = make_client(api_base, breaker)
+    for _ in range(2):
+        with pytest.raises(GeminiError):
+            client.generate_content('prompt')
+    assert breaker.state == 'open'
+    # 斷路器開啟時不發送請求
+    with pytest.raises(CircuitOpenError):
+        client.generate_content('prompt')
+    assert config.counts['500'] == 2
+
+    # 冷卻時間過後的試探請求成功，斷路器關閉
+    config.error_rate = 0.0
+    time.sleep(0.25)
+    assert breaker.state == 'half_open'
+    assert client.generate_content('prompt')
+    assert breaker.state == 'closed'
+
+def test_failed_probe_reopens_breaker(fake_gemini):
+    config, api_base = fake_gemini
+    config.error_rate = 1.0
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.2)
+    client = make_client(api_base, breaker)
+    with pytest.raises(GeminiError):
+        client.generate_content('prompt')
+    time.sleep(0.25)
+    with pytest.raises(GeminiError):
+        client.generate_content('prompt')
+    assert breaker.state == 'open'
+    assert config.counts['500'] == 2
+
+def test_half_open_allows_one_probe_until_released():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.1)
+    assert breaker.allow()
+    # 試探請求尚未結束時不允許其他請求
+    assert not breaker.allow()
+    breaker.release_probe()
+    assert breaker.allow()
+
+def test_rate_limit_waits_for_retry_after(fake_gemini):
+    config, api_base = fake_gemini
+    config.rate_limit_rate = 1.0
+    config.retry_after = 0.3
+    client = make_client(api_base, CircuitBreaker(), max_retries=2)
+    started = time.monotonic()
+    with pytest.raises(GeminiError, match='429'):
+        client.generate_content('prompt')
+    assert time.monotonic() - started >= 0.3
+    assert config.counts['429'] == 2
+
+def test_retry_after_beyond_deadline_gives_up(fake_gemini):
+    config, api_base = fake_gemini
+    config.rate_limit_rate = 1.0
+    config.retry_after = 10.0
+    client = make_client(api_base, CircuitBreaker(), max_retries=3, deadline=1.0)
+    started = time.monotonic()
+    with pytest.raises(GeminiError, match='429'):
+        client.generate_content('prompt')
+    # 等待 Retry-After 會超過期限，不再重試
+    assert time.monotonic() - started < 1.0
+    assert config.counts['429'] == 1
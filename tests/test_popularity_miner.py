@@ -0,0 +1,66 @@
+"""熱門關鍵字挖掘（popularity_miner）的測試"""
+from collections import Counter
+
+import pandas as pd
+
+import popularity_miner
+from popularity_miner import BoardStats, build_catalog, mine
+
+def board_stats(posts):
+    """由關鍵詞列表建立看板統計，每篇文章權重為 1"""
+    stats = BoardStats()
+    for keywords in posts:
+        stats.add_post([(word, 1.0) for word in keywords], 1.0)
+    return stats
+
+def test_build_catalog_skips_words_without_document_counts():
+    stats = board_stats([['分手', '男友'], ['分手', '復合'], ['分手', '男友']])
+    # 「男友」與「復合」不在文章數統計中（例如在合併前被篩選掉），不能除以零
+    catalog = build_catalog(stats, Counter({'分手': 3}), total_posts=100, top_n=10, num_related=3,
+                            min_posts=1, max_df=0.5)
+    assert [entry['keyword'] for entry in catalog] == ['分手']
+    assert catalog[0]['related'] == []
+
+def test_build_catalog_with_pruned_candidates():
+    mood = board_stats([['心情', '低潮'], ['心情', '低潮'], ['心情', '失眠'], ['憂鬱', '失眠']])
+    talk = board_stats([['宵夜', '炸雞'], ['宵夜', '炸雞'], ['宵夜', '手搖']])
+    document_counts = Counter()
+    general = BoardStats()
+    for stats in (mood, talk):
+        document_counts.update(stats.posts)
+        # 只保留一個候選詞，各看板其餘的詞都不會出現在合併後的統計中
+        stats.prune(max_candidates=1, max_pairs=1)
+        general.merge(stats)
+        general.prune(max_candidates=1, max_pairs=1)
+    catalog = build_catalog(mood, document_counts, total_posts=7, top_n=10, num_related=3, min_posts=1, max_df=0.9)
+    assert [entry['keyword'] for entry in catalog] == ['心情']
+    assert catalog[0]['related'] == ['低潮']
+    assert build_catalog(general, document_counts, total_posts=7, top_n=10, num_related=3, min_posts=1, max_df=0.9)
+
+def test_mine_with_candidate_pruning(tmp_path):
+    topics = {
+        'mood': ['今天心情很低落，晚上一直失眠睡不著', '考試壓力好大，最近常常覺得焦慮又疲憊',
+                 '下雨天讓人憂鬱，只想躺在床上聽音樂'],
+        'talk': ['半夜肚子餓想吃宵夜，大家推薦哪家炸雞', '週末去夜市吃臭豆腐和珍珠奶茶',
+                 '便利商店的新品飯糰到底好不好吃']
+    }
+    rows = []
+    for board, texts in topics.items():
+        for i in range(12):
+            rows.append({
+                'artUrl': f'https://www.dcard.tw/f/{board}/p/{i}',
+                'artDate': '2024-06-20T12:00:00.000Z',
+                'artTitle': texts[i % len(texts)][:6],
+                'artContent': texts[i % len(texts)],
+                'boardID': board,
+                'commentCount': str(i)
+            })
+    path = tmp_path / 'posts.csv'
+    pd.DataFrame(rows).to_csv(path, index=False)
+    output = tmp_path / 'catalog.jsonl'
+    # 候選詞上限遠小於詞彙量，各看板的候選詞不一定出現在合併後的統計中
+    catalog = mine([str(path)], str(output), workers=1, chunk_size=5, reference_date='2024-06-25',
+                   keywords_per_post=4, min_posts=1, max_df=0.9, max_candidates=3, max_pairs=2)
+    assert set(catalog) == {'mood', 'talk', popularity_miner.GENERAL_BOARD}
+    assert catalog['mood'] and catalog['talk']
+    assert output.exists()
@@ -0,0 +1,22 @@
+"""共用分詞模組（tokenizer）的測試"""
+import jieba
+import jieba.analyse
+import jieba.posseg
+
+import keyword_extractor
+from tokenizer import clean_text, segment
+
+TEXT = '最近跟男友吵架，他總是已讀不回，朋友都說我們應該好好溝通，可是我真的不知道該怎麼開口 https://www.dcard.tw/f/relationship'
+
+def test_segment_matches_jieba_tokenizers():
+    segmented = segment(TEXT)
+    cleaned = clean_text(TEXT)
+    # TF-IDF 使用 jieba.cut 的斷詞，TextRank 使用 jieba.posseg 的斷詞與詞性（與 jieba.analyse 相同）
+    assert segmented.words == jieba.lcut(cleaned)
+    assert [tuple(token) for token in segmented.tokens] == [(pair.word, pair.flag)
+                                                            for pair in jieba.posseg.dt.cut(cleaned)]
+
+def test_tfidf_keywords_match_extract_tags():
+    keywords = keyword_extractor.extract_tfidf_keywords(segment(TEXT), 10)
+    expected = jieba.analyse.extract_tags(clean_text(TEXT), topK=10, withWeight=True)
+    assert [word for word, _ in keywords] == [word for word, _ in expected]
@@ -1,10 +1,15 @@
+import asyncio
 import os
 import logging
-import time
-import json
 import re
-import requests
+import time
+from concurrent.futures import Future
 from dotenv import load_dotenv
+# 導入 Gemini API 用戶端
+from gemini_client import (GeminiClient, AsyncGeminiClient, GeminiError, CircuitOpenError, CircuitBreaker,
+                           DEFAULT_API_BASE, DEFAULT_MODEL)
+# 導入效能指標模組
+from metrics import increment, run_in_context, span
 
 # 載入 .env 檔案中的環境變數
 load_dotenv()
@@ -13,13 +18,28 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def gemini_client_settings():
+    """Gemini 用戶端的設定（連線池、期限與斷路器），同步與非同步用戶端共用"""
+    return {
+        'api_base': os.getenv("GEMINI_API_BASE", DEFAULT_API_BASE),
+        'model': os.getenv("GEMINI_MODEL", DEFAULT_MODEL),
+        'pool_size': int(os.getenv("GEMINI_POOL_SIZE", "8")),
+        'deadline': float(os.getenv("GEMINI_DEADLINE", "15")),
+        'breaker': CircuitBreaker(
+            failure_threshold=int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("GEMINI_BREAKER_RESET", "30"))
+        )
+    }
+
 # 設置 Gemini API 密鑰
 # 需要在環境變數中設置 GEMINI_API_KEY
 api_key = os.getenv("GEMINI_API_KEY")
 if api_key:
     logger.info(f"成功從環境變數中讀取到 GEMINI_API_KEY: {api_key[:4]}...")
-    GEMINI_API_ENDPOINT = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
+    # 共用的 Gemini 用戶端（連線池、逾時、重試與斷路器），GEMINI_API_BASE 可指向本地模擬伺服器
+    gemini_client = GeminiClient(api_key, **gemini_client_settings())
 else:
+    gemini_client = None
     logger.warning("未設置 GEMINI_API_KEY 環境變數，標題生成功能將無法使用")
     
     # 檢查環境中的所有變數，看是否有類似的 API 密鑰
@@ -27,6 +47,9 @@ else:
     if env_vars:
         logger.info(f"在環境中找到的可能相關變數: {env_vars}")
 
+# 提示詞最多包含文章開頭的字元數
+TITLE_MAX_CHARS = int(os.getenv("TITLE_MAX_CHARS", "500"))
+
 # 看板風格特徵定義
 BOARD_STYLES = {
     'mood': {
@@ -64,31 +87,16 @@ BOARD_STYLES = {
     }
 }
 
-def generate_titles(text, category, num_titles=3, max_retries=3):
-    """
-    根據文章內容和類別使用 Gemini API 生成適合的標題
-    
-    參數:
-        text (str): 文章內容
-        category (str): 文章分類 ('mood', 'relationship', 'talk')
-        num_titles (int): 要生成的標題數量
-        max_retries (int): 最大重試次數
-    
-    返回:
-        list: 生成的標題列表
-    """
-    if not api_key:
-        logger.error("未設置 Gemini API 密鑰，無法生成標題")
-        return ["請設置 GEMINI_API_KEY 以啟用標題生成功能"]
-    
+def build_title_prompt(text, category, num_titles=3):
+    """構建標題生成的提示詞"""
     # 獲取對應類別的風格指南
     style_guide = BOARD_STYLES.get(category, BOARD_STYLES['talk'])
     
     # 準備內容摘要 (限制長度以減少token消耗)
-    content_summary = text[:500] + ('...' if len(text) > 500 else '')
+    content_summary = text[:TITLE_MAX_CHARS] + ('...' if len(text) > TITLE_MAX_CHARS else '')
     
     # 構建提示詞
-    prompt = f"""
+    return f"""
     請幫我為以下文章內容生成{num_titles}個適合在Dcard {style_guide['description']} 發布的標題。
     
     文章內容：
@@ -105,63 +113,140 @@ def generate_titles(text, category, num_titles=3, max_retries=3):
     
     請直接給出{num_titles}個標題，每個標題一行，以數字編號，不要有額外的說明。
     """
+
+def parse_titles(titles_text, num_titles):
+    """解析 Gemini 回應中以數字編號開頭的標題，解析失敗時返回空列表"""
+    # 解析標題，使用正則表達式匹配數字編號開頭的行
+    titles = re.findall(r'^\d+\.?\s*(.+)$', titles_text, re.MULTILINE)
     
-    # 構建 Gemini API 請求
-    request_data = {
-        "contents": [
-            {
-                "parts": [
-                    {
-                        "text": prompt
-                    }
-                ]
-            }
-        ]
-    }
+    # 確保我們至少得到一個標題
+    if titles:
+        return titles[:num_titles]  # 限制返回標題數量
     
-    headers = {
-        "Content-Type": "application/json"
-    }
+    # 解析失敗時重新生成
+    increment('gemini_unparsable_responses_total')
+    logger.warning(f"Gemini API 回應解析失敗，回應內容: {titles_text[:200]}")
+    return []
+
+def generate_titles(text, category, num_titles=3, max_retries=3, client=None, fallback=True):
+    """
+    根據文章內容和類別使用 Gemini API 生成適合的標題
+    API 無法使用（斷路器開啟、重試後仍失敗或超過期限）時改用本地標題生成
     
-    retry_count = 0
-    while retry_count < max_retries:
+    參數:
+        text (str): 文章內容
+        category (str): 文章分類 ('mood', 'relationship', 'talk')
+        num_titles (int): 要生成的標題數量
+        max_retries (int): 最大重試次數
+        client (GeminiClient): Gemini 用戶端，未提供時使用模組共用的用戶端
+        fallback (bool): API 無法使用時是否改用本地標題生成，設為 False 時拋出 GeminiError
+    
+    返回:
+        list: 生成的標題列表
+    """
+    client = client or gemini_client
+    if client is None:
+        logger.error("未設置 Gemini API 密鑰，無法生成標題")
+        return ["請設置 GEMINI_API_KEY 以啟用標題生成功能"]
+    
+    prompt = build_title_prompt(text, category, num_titles)
+    # 解析失敗的重新生成共用同一個期限，總耗時不超過 client.deadline
+    give_up_at = time.monotonic() + client.deadline
+    
+    for _ in range(max_retries):
+        remaining = give_up_at - time.monotonic()
+        if remaining <= 0:
+            if not fallback:
+                raise GeminiError("標題生成超過期限")
+            logger.warning("標題生成超過期限，改用本地標題生成")
+            break
         try:
-            # 發送 API 請求
-            response = requests.post(
-                GEMINI_API_ENDPOINT,
-                headers=headers,
-                json=request_data
-            )
-            
-            # 檢查響應狀態
-            if response.status_code == 200:
-                # 解析響應
-                response_data = response.json()
-                if 'candidates' in response_data and len(response_data['candidates']) > 0:
-                    content = response_data['candidates'][0]['content']
-                    if 'parts' in content and len(content['parts']) > 0:
-                        titles_text = content['parts'][0]['text'].strip()
-                        
-                        # 解析標題，使用正則表達式匹配數字編號開頭的行
-                        titles = re.findall(r'^\d+\.?\s*(.+)$', titles_text, re.MULTILINE)
-                        
-                        # 確保我們至少得到一個標題
-                        if titles:
-                            return titles[:num_titles]  # 限制返回標題數量
-            
-            # 如果沒有返回或解析失敗，記錄錯誤
-            logger.warning(f"Gemini API 回應解析失敗，狀態碼: {response.status_code}")
-            logger.warning(f"回應內容: {response.text}")
-            retry_count += 1
-            time.sleep(1)  # 延遲一秒再重試
-                
-        except Exception as e:
+            with span('gemini'):
+                titles_text = client.generate_content(prompt, deadline=remaining)
+        except CircuitOpenError:
+            if not fallback:
+                raise
+            logger.warning("Gemini API 暫時停用，改用本地標題生成")
+            break
+        except GeminiError as e:
+            if not fallback:
+                raise
             logger.error(f"生成標題時發生錯誤: {str(e)}")
-            retry_count += 1
-            time.sleep(1)  # 延遲一秒再重試
+            break
+        
+        titles = parse_titles(titles_text, num_titles)
+        if titles:
+            return titles
+    
+    # 如果多次嘗試後仍然失敗，使用本地標題生成
+    if not fallback:
+        raise GeminiError("Gemini API 回應無法解析為標題")
+    return mock_generate_titles(text, category, num_titles)
+
+def generate_titles_async(text, category, num_titles=3, client=None, fallback=True):
+    """
+    在 Gemini 用戶端的執行緒池中生成標題，呼叫端可以同時處理其他工作
+    
+    返回:
+        concurrent.futures.Future: 結果為標題列表
+    """
+    client = client or gemini_client
+    if client is None:
+        future = Future()
+        future.set_result(generate_titles(text, category, num_titles))
+        return future
+    # 在目前請求的 context 中執行，Gemini 呼叫的耗時也會記錄到請求的 profile
+    return client.submit(run_in_context(generate_titles), text, category, num_titles, client=client, fallback=fallback)
+
+def create_async_gemini_client():
+    """
+    建立 ASGI 服務使用的非同步 Gemini 用戶端（設定與 gemini_client 相同）
+
+    返回:
+        AsyncGeminiClient: 未設置密鑰或未安裝 httpx 時返回 None
+    """
+    if not api_key:
+        return None
+    try:
+        return AsyncGeminiClient(api_key, **gemini_client_settings())
+    except ImportError:
+        logger.warning("未安裝 httpx 套件，Gemini API 改在執行緒池中呼叫")
+        return None
+
+async def agenerate_titles(text, category, num_titles=3, max_retries=3, client=None, fallback=True):
+    """
+    以非同步 I/O 生成標題，參數與返回值同 generate_titles；client 為 AsyncGeminiClient
+
+    未提供非同步用戶端時在同步用戶端的執行緒池中呼叫 generate_titles
+    """
+    if client is None:
+        future = generate_titles_async(text, category, num_titles, fallback=fallback)
+        return await asyncio.wrap_future(future)
+    
+    prompt = build_title_prompt(text, category, num_titles)
+    give_up_at = time.monotonic() + client.deadline
+    for _ in range(max_retries):
+        remaining = give_up_at - time.monotonic()
+        if remaining <= 0:
+            if not fallback:
+                raise GeminiError("標題生成超過期限")
+            logger.warning("標題生成超過期限，改用本地標題生成")
+            break
+        try:
+            with span('gemini'):
+                titles_text = await client.generate_content(prompt, deadline=remaining)
+        except GeminiError as e:
+            if not fallback:
+                raise
+            logger.warning(f"Gemini API 無法使用，改用本地標題生成: {str(e)}")
+            break
+        titles = parse_titles(titles_text, num_titles)
+        if titles:
+            return titles
     
-    # 如果多次嘗試後仍然失敗，返回一個默認標題
-    return ["我的Dcard文章", f"分享一些關於{style_guide['description']}的想法", "想聽聽大家的看法"]
+    if not fallback:
+        raise GeminiError("Gemini API 回應無法解析為標題")
+    return mock_generate_titles(text, category, num_titles)
 
 # 模擬生成標題的函數 (測試用，不需要API密鑰)
 def mock_generate_titles(text, category, num_titles=3):
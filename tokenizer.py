@@ -0,0 +1,165 @@
+"""
+共用分詞模組
+關鍵字提取與近似重複比對共用每篇文章的分詞結果（segment）；
+分類器與訓練流程使用 classifier_tokens，先只保留中文字元再斷詞（與訓練筆記本的前處理相同）
+"""
+import logging
+import os
+import re
+from collections import namedtuple
+import jieba
+import jieba.posseg
+# 導入啟動加速模組
+from startup import configure_jieba_cache
+
+# 詞庫目錄
+DICT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dict')
+STOP_WORDS_PATH = os.path.join(DICT_DIR, 'stop_words.txt')
+# 訓練筆記本使用的繁體中文詞庫（jieba 的 extra_dict/dict.txt.big，未包含在專案中），檔案存在時才會套用
+JIEBA_DICT_PATH = os.getenv('JIEBA_DICT_PATH', os.path.join(DICT_DIR, 'dict.txt.big'))
+
+URL_PATTERN = re.compile(r'http\S+|www\S+|https\S+', flags=re.MULTILINE)
+PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+# 分類器只使用中文字元（與訓練筆記本相同）
+NON_CJK_PATTERN = re.compile('[^\u4e00-\u9fa5]+')
+# 句子：到句尾標點或換行為止（標點會在斷詞前被移除，所以要在清理之前切分）
+SENTENCE_PATTERN = re.compile(r'[^。！？!?；;\n]+[。！？!?；;\n]*')
+
+logger = logging.getLogger(__name__)
+
+# 分詞結果：詞彙和詞性
+Token = namedtuple('Token', ['word', 'flag'])
+
+def load_stop_words(path=STOP_WORDS_PATH):
+    """載入停用詞列表"""
+    with open(path, encoding='utf-8') as f:
+        return frozenset(line.strip() for line in f)
+
+STOP_WORDS = load_stop_words()
+
+# jieba 的前綴詞典快取保存在專案的快取目錄，重新啟動時不需重建
+configure_jieba_cache()
+
+if os.path.exists(JIEBA_DICT_PATH):
+    jieba.set_dictionary(JIEBA_DICT_PATH)
+    jieba.posseg.dt.load_word_tag(jieba.dt.get_dict_file())
+else:
+    logger.info(f"找不到詞庫 {JIEBA_DICT_PATH}，使用 jieba 內建詞庫（斷詞結果可能與訓練時不同）")
+
+class SegmentedText:
+    """
+    一篇文章的分詞結果，可供各個處理階段重複使用
+
+    words 與 jieba.analyse.extract_tags 相同以 jieba.cut 斷詞（TF-IDF、近似重複比對使用）；
+    tokens 與 jieba.analyse.textrank 相同以 jieba.posseg 斷詞並標註詞性（TextRank 使用），
+    jieba.posseg 的詞性 HMM 成本較高，第一次讀取時才執行
+    """
+
+    __slots__ = ('text', 'words', '_tokens')
+
+    def __init__(self, text, words):
+        """
+        參數:
+            text (str): 清理後的文本
+            words (list): 詞彙列表
+        """
+        self.text = text
+        self.words = words
+        self._tokens = None
+
+    @property
+    def tokens(self):
+        """Token 列表（詞彙和詞性）"""
+        if self._tokens is None:
+            self._tokens = [Token(pair.word, pair.flag) for pair in jieba.posseg.dt.cut(self.text)]
+        return self._tokens
+
+def clean_text(text):
+    """
+    預處理文本，移除URL、特殊符號等
+    """
+    # 移除URL
+    text = URL_PATTERN.sub('', text)
+    # 移除標點符號和特殊字元
+    return PUNCTUATION_PATTERN.sub('', text)
+
+def clip_text(text, max_chars, sampling='head'):
+    """
+    限制文本長度
+
+    參數:
+        text (str): 原始文本
+        max_chars (int): 最多保留的字元數，0 表示不限制
+        sampling (str): 'head' 保留開頭；'head_tail' 保留開頭與結尾各一半（文章的結論常在最後）
+
+    返回:
+        str: 未超過長度時返回原本的字串物件
+    """
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    if sampling == 'head_tail':
+        head = max_chars // 2
+        return text[:head] + '\n' + text[len(text) - (max_chars - head):]
+    return text[:max_chars]
+
+def split_sentences(text, max_chars):
+    """
+    依句子將文本切成不超過 max_chars 字元的段落，超過長度的單一句子直接切開
+
+    返回:
+        list: 段落列表，不包含空白段落
+    """
+    chunks = []
+    current = ''
+    for sentence in SENTENCE_PATTERN.findall(text):
+        while len(sentence) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if len(current) + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current += sentence
+    if current:
+        chunks.append(current)
+    return [chunk for chunk in chunks if chunk.strip()]
+
+def segment(text):
+    """
+    清理並斷詞
+
+    參數:
+        text (str): 原始文章內容
+
+    返回:
+        SegmentedText: 分詞結果，詞性在需要時才標註
+    """
+    cleaned = clean_text(text)
+    return SegmentedText(cleaned, jieba.lcut(cleaned))
+
+def classifier_tokens(text, stop_words=STOP_WORDS):
+    """
+    分類器使用的詞彙：移除網址後只保留中文字元再斷詞，並篩選掉停用詞與單字詞（與訓練筆記本相同）
+
+    必須在斷詞之前移除非中文字元：被英數字或標點隔開的中文字會接在一起斷詞，與斷詞後逐詞移除的結果不同
+
+    參數:
+        text (str): 原始文章內容
+        stop_words (frozenset): 停用詞
+
+    返回:
+        list: 詞彙列表
+    """
+    cjk_text = NON_CJK_PATTERN.sub('', URL_PATTERN.sub('', text))
+    return [word for word in jieba.cut(cjk_text) if len(word) > 1 and word not in stop_words]
+
+def classifier_input(text):
+    """以空白分隔的分類器輸入字串"""
+    return ' '.join(classifier_tokens(text))
+
+def get_token(text):
+    """訓練流程使用的斷詞函數，回傳分類器使用的詞彙列表"""
+    return classifier_tokens(text)
@@ -0,0 +1,277 @@
+"""
+模型訓練工具
+取代 分類器.ipynb 的手動流程：讀取 raw_data 的文章、平行斷詞、訓練 TF-IDF + 軟投票分類器，
+並將模型、向量化器與訓練紀錄寫入以版本命名的目錄
+
+使用方式:
+    python train_model.py
+    python train_model.py raw_data/merge_from_ofoct.csv --jobs 8 --install
+
+輸出:
+    models/<版本>/voting_classifier_model.joblib
+    models/<版本>/tfidf_vectorizer.joblib    （--hashing-features 模式不輸出）
+    models/<版本>/tfidf_vectorizer.npz       不需要 pickle 的精簡向量化器，網頁應用優先載入
+    models/<版本>/distilled_model.npz        （--distill）蒸餾後的線性模型，供 SERVING_MODE=fast 使用
+    models/<版本>/metadata.json   訓練參數、資料來源、各階段耗時與吞吐量、測試集評估結果
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import joblib
+import pandas as pd
+from sklearn import svm
+from sklearn.ensemble import RandomForestClassifier, VotingClassifier
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer, TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, classification_report
+from sklearn.model_selection import train_test_split
+from sklearn.tree import DecisionTreeClassifier
+# 導入共用分詞模組，確保訓練與推論使用相同的前處理
+from tokenizer import get_token
+from inference import InferenceEngine, file_version
+from compact_vectorizer import file_sha256, from_hashing, from_tfidf_vectorizer
+from distill import DISTILLED_FILENAME, distill
+
+# 設置日誌
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INPUTS = [os.path.join(BASE_DIR, 'raw_data', 'merge_from_ofoct.csv')]
+MODELS_DIR = os.path.join(BASE_DIR, 'models')
+# 網頁應用預設載入的模型位置
+INSTALL_DIR = os.path.join(BASE_DIR, 'Dcard-posts-classification-main')
+MODEL_FILENAME = 'voting_classifier_model.joblib'
+VECTORIZER_FILENAME = 'tfidf_vectorizer.joblib'
+COMPACT_VECTORIZER_FILENAME = 'tfidf_vectorizer.npz'
+USE_COLUMNS = ['artUrl', 'artTitle', 'artContent', 'boardID']
+
+def tokenize_chunk(texts):
+    """在 worker 程序中斷詞，返回以空白分隔的分類器輸入"""
+    return [' '.join(get_token(text)) for text in texts]
+
+def iter_chunks(paths, chunk_size):
+    """
+    分段讀取 CSV，略過重複的表頭列、缺少標題或內容的文章，以及重複的文章
+
+    產生:
+        (list, list): 該分段的文章內容與看板標籤
+    """
+    seen_urls = set()
+    for path in paths:
+        logger.info(f"讀取 {path}")
+        reader = pd.read_csv(path, usecols=USE_COLUMNS, chunksize=chunk_size, dtype=str, encoding='utf-8-sig')
+        for frame in reader:
+            frame = frame[frame['boardID'] != 'boardID'].dropna(subset=['artTitle', 'artContent', 'boardID'])
+            texts, labels = [], []
+            for url, title, content, board in zip(frame['artUrl'], frame['artTitle'], frame['artContent'],
+                                                  frame['boardID']):
+                if isinstance(url, str):
+                    if url in seen_urls:
+                        continue
+                    seen_urls.add(url)
+                texts.append(title + content)
+                labels.append(board)
+            yield texts, labels
+
+def load_corpus(paths, workers, chunk_size):
+    """
+    讀取並平行斷詞所有文章，保持原本的順序，讓資料切分可以重現
+
+    返回:
+        (list, list): 分詞結果與看板標籤
+    """
+    documents, labels = [], []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # 最多同時有 workers * 2 個分段在處理中
+        pending = deque()
+        for texts, chunk_labels in iter_chunks(paths, chunk_size):
+            pending.append((executor.submit(tokenize_chunk, texts), chunk_labels))
+            while len(pending) >= workers * 2:
+                future, done_labels = pending.popleft()
+                documents.extend(future.result())
+                labels.extend(done_labels)
+        while pending:
+            future, done_labels = pending.popleft()
+            documents.extend(future.result())
+            labels.extend(done_labels)
+    return documents, labels
+
+def build_model(jobs, random_state):
+    """建立與筆記本相同組合的軟投票分類器，子模型以 n_jobs 平行訓練"""
+    return VotingClassifier(
+        estimators=[
+            ("lr", LogisticRegression()),
+            ("dt", DecisionTreeClassifier(random_state=random_state)),
+            ("svm", svm.SVC(probability=True, random_state=random_state)),
+            ("rf", RandomForestClassifier(n_jobs=jobs, random_state=random_state))
+        ],
+        voting="soft",  # 使用預測機率進行投票
+        weights=[0.3, 0.1, 0.4, 0.2],  # 給SVM較高權重
+        n_jobs=jobs
+    )
+
+def install_artifacts(version_dir, install_dir=INSTALL_DIR):
+    """將指定版本的模型複製到網頁應用預設載入的位置（先複製為暫存檔再取代）"""
+    for filename in (MODEL_FILENAME, VECTORIZER_FILENAME, COMPACT_VECTORIZER_FILENAME, DISTILLED_FILENAME):
+        source = os.path.join(version_dir, filename)
+        if not os.path.exists(source):
+            continue
+        target = os.path.join(install_dir, filename)
+        temp_path = target + '.tmp'
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, target)
+    logger.info(f"已安裝模型至 {install_dir}")
+
+def train(paths, output_dir=MODELS_DIR, workers=None, jobs=None, chunk_size=2000, max_features=1000,
+          hashing_features=None, test_size=0.3, random_state=777, distill_model=False, install=False):
+    """
+    執行完整的訓練流程
+
+    參數:
+        paths (list): 輸入的 CSV 檔案
+        output_dir (str): 版本目錄的上層目錄
+        workers (int): 斷詞的 worker 程序數量，預設為 CPU 核心數
+        jobs (int): 模型訓練的平行數量（n_jobs），預設為 CPU 核心數
+        chunk_size (int): 每個分段的列數
+        max_features (int): TF-IDF 的最大特徵數
+        hashing_features (int): 設定時改用 HashingVectorizer 將詞彙雜湊到這個數量的欄位，不保存詞彙
+        test_size (float): 測試集比例
+        random_state (int): 亂數種子
+        distill_model (bool): 是否以訓練集蒸餾出線性模型（fast 模式）
+        install (bool): 是否將模型安裝到網頁應用預設載入的位置
+
+    返回:
+        dict: 訓練紀錄（同 metadata.json）
+    """
+    workers = workers or os.cpu_count() or 1
+    jobs = jobs or os.cpu_count() or 1
+    timings = {}
+
+    started = time.perf_counter()
+    documents, labels = load_corpus(paths, workers, chunk_size)
+    timings['tokenize'] = time.perf_counter() - started
+    logger.info(f"斷詞完成：{len(documents)} 篇文章，耗時 {timings['tokenize']:.1f} 秒"
+                f"（{len(documents) / timings['tokenize']:.0f} 篇/秒）")
+
+    # 把整個資料集七三切
+    X_train, X_test, y_train, y_test = train_test_split(
+        documents, labels, test_size=test_size, random_state=random_state
+    )
+
+    step = time.perf_counter()
+    # 保持稀疏矩陣訓練，推論時不需要轉為密集矩陣
+    if hashing_features:
+        hasher = HashingVectorizer(n_features=hashing_features, alternate_sign=False, norm=None)
+        vectorizer = None
+        transformer = TfidfTransformer()
+        vec_train = transformer.fit_transform(hasher.transform(X_train))
+        vec_test = transformer.transform(hasher.transform(X_test))
+        compact_vectorizer = from_hashing(hashing_features, transformer)
+    else:
+        vectorizer = TfidfVectorizer(max_features=max_features)
+        vec_train = vectorizer.fit_transform(X_train)
+        vec_test = vectorizer.transform(X_test)
+        compact_vectorizer = from_tfidf_vectorizer(vectorizer)
+    timings['vectorize'] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    model = build_model(jobs, random_state)
+    model.fit(vec_train, y_train)
+    timings['fit'] = time.perf_counter() - step
+    logger.info(f"模型訓練完成，耗時 {timings['fit']:.1f} 秒（{len(X_train) / timings['fit']:.0f} 篇/秒）")
+
+    step = time.perf_counter()
+    y_pred = model.predict(vec_test)
+    timings['evaluate'] = time.perf_counter() - step
+    print(classification_report(y_test, y_pred))
+
+    # 子模型以編碼後的類別訓練，需要轉回看板標籤
+    estimator_accuracy = {
+        name: accuracy_score(y_test, model.classes_[estimator.predict(vec_test)])
+        for name, estimator in zip((name for name, _ in model.estimators), model.estimators_)
+    }
+
+    version = time.strftime('%Y%m%d-%H%M%S') + '-' + file_version(*paths)[:6]
+    version_dir = os.path.join(output_dir, version)
+    os.makedirs(version_dir, exist_ok=True)
+    joblib.dump(model, os.path.join(version_dir, MODEL_FILENAME))
+    if vectorizer is not None:
+        joblib.dump(vectorizer, os.path.join(version_dir, VECTORIZER_FILENAME))
+        # 記錄匯出來源，之後 joblib 檔案被替換時服務改為載入 joblib 檔案
+        compact_vectorizer.source_sha256 = file_sha256(os.path.join(version_dir, VECTORIZER_FILENAME))
+    compact_vectorizer.save(os.path.join(version_dir, COMPACT_VECTORIZER_FILENAME))
+
+    distilled_accuracy = None
+    if distill_model:
+        step = time.perf_counter()
+        teacher = InferenceEngine(model, compact_vectorizer, labels=[str(c) for c in model.classes_])
+        student = distill(teacher, vec_train)
+        timings['distill'] = time.perf_counter() - step
+        student.save(os.path.join(version_dir, DISTILLED_FILENAME))
+        distilled_accuracy = accuracy_score(y_test, student.predict(vec_test))
+        logger.info(f"蒸餾模型準確率 {distilled_accuracy:.4f}")
+
+    timings['total'] = time.perf_counter() - started
+    metadata = {
+        'version': version,
+        'inputs': [os.path.relpath(path, BASE_DIR) for path in paths],
+        'data_version': file_version(*paths),
+        'documents': len(documents),
+        'train_documents': len(X_train),
+        'test_documents': len(X_test),
+        'classes': [str(c) for c in model.classes_],
+        'params': {
+            'max_features': max_features,
+            'hashing_features': hashing_features,
+            'test_size': test_size,
+            'random_state': random_state,
+            'workers': workers,
+            'jobs': jobs
+        },
+        'timings': {name: round(seconds, 3) for name, seconds in timings.items()},
+        'throughput': {
+            'tokenize_docs_per_sec': round(len(documents) / timings['tokenize'], 1),
+            'fit_docs_per_sec': round(len(X_train) / timings['fit'], 1)
+        },
+        'accuracy': accuracy_score(y_test, y_pred),
+        'estimator_accuracy': estimator_accuracy,
+        'distilled_accuracy': distilled_accuracy,
+        'report': classification_report(y_test, y_pred, output_dict=True)
+    }
+    with open(os.path.join(version_dir, 'metadata.json'), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    logger.info(f"已寫入模型版本 {version}（準確率 {metadata['accuracy']:.4f}，總耗時 {timings['total']:.1f} 秒）")
+
+    if install:
+        install_artifacts(version_dir)
+    return metadata
+
+def main():
+    parser = argparse.ArgumentParser(description='訓練看板分類模型')
+    parser.add_argument('inputs', nargs='*', default=DEFAULT_INPUTS, help='輸入的 CSV 檔案')
+    parser.add_argument('--output-dir', default=MODELS_DIR, help='版本目錄的上層目錄')
+    parser.add_argument('--workers', type=int, default=None, help='斷詞的 worker 程序數量，預設為 CPU 核心數')
+    parser.add_argument('--jobs', type=int, default=None, help='模型訓練的平行數量，預設為 CPU 核心數')
+    parser.add_argument('--chunk-size', type=int, default=2000, help='每個分段的列數')
+    parser.add_argument('--max-features', type=int, default=1000, help='TF-IDF 的最大特徵數')
+    parser.add_argument('--hashing-features', type=int, default=None,
+                        help='改用 HashingVectorizer 並雜湊到指定的欄位數量（例如 262144），不保存詞彙')
+    parser.add_argument('--test-size', type=float, default=0.3, help='測試集比例')
+    parser.add_argument('--random-state', type=int, default=777, help='亂數種子')
+    parser.add_argument('--distill', action='store_true', help='同時蒸餾出 fast 模式使用的線性模型')
+    parser.add_argument('--install', action='store_true', help='將模型安裝到網頁應用預設載入的位置')
+    args = parser.parse_args()
+
+    train(args.inputs, output_dir=args.output_dir, workers=args.workers, jobs=args.jobs,
+          chunk_size=args.chunk_size, max_features=args.max_features,
+          hashing_features=args.hashing_features, test_size=args.test_size,
+          random_state=args.random_state, distill_model=args.distill, install=args.install)
+
+if __name__ == '__main__':
+    main()